@@ -0,0 +1,8 @@
+"""性能基准脚本（不依赖真实网关 / 账号，全部在本地桩服务上运行）。
+
+用法：
+    python -m bench.agent_e2e --sessions 8
+    python -m bench.anti_recall_micro --baseline bench/anti_recall_micro.baseline.json
+    python -m bench.fake_napcat --spawn --rate 20 --duration 60
+    python -m bench.replay data/capture/events-<ts>.jsonl --speed 10
+"""
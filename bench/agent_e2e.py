@@ -0,0 +1,447 @@
+"""Agent 端到端基准：桩 Gemini + 桩 n8n + 脚本化多轮会话。
+
+目标：
+- 不消耗真实 API 配额，测量 agent 各阶段的延迟分布与 N 个并发会话下的吞吐
+- 可以作为回归检查：与保存的基线比较，变慢/吞吐下降超过容忍度时退出码为 1
+
+做法：
+- 在本进程内用 uvicorn 起一个桩服务：
+  - `POST /v1beta/models/{model}:generateContent`：模拟 Gemini，延迟 = 首 token 延迟 + 输出 token 数 × 每 token 耗时
+    （用户最新消息包含“提交”时返回 trigger_n8n=true，否则返回追问）；`:streamGenerateContent` 以 SSE 分片返回（--stream）
+  - `POST /webhook/agent`：模拟 n8n，记录每个 session_id 的到达时间
+- agent 通过 AGENT__GEMINI_BASE_URL / AGENT__N8N_BASE_URL 指向桩服务；checkpoint / outbox 写到临时目录
+- 通过 nonebot.message.handle_event 投递 OneBot V11 私聊事件（走完整的 matcher / 权限 / Alconna 解析），
+  适配器的 _call_api 被替换为本地实现（记录发送、返回语音 base64），因此 API hook 仍会执行
+- 每个会话按脚本逐轮发送：等到机器人回复（排队提示不算）后再发下一条
+
+输出（JSON）：
+- stages：e2e_reply（消息到回复）、n8n_delivery（最后一条消息到 n8n 收到）、stub_gemini（桩服务侧耗时），
+  以及进程内指标中的 graph 节点 / LLM 排队 / 整轮耗时，每项给出 count/mean/p50/p95/p99/max
+- throughput_turns_per_s：全部会话完成的轮次数 / 墙钟时间
+
+用法：
+    python -m bench.agent_e2e --sessions 8 --rounds 2
+    python -m bench.agent_e2e --save-baseline bench/agent_e2e.baseline.json
+    python -m bench.agent_e2e --baseline bench/agent_e2e.baseline.json --tolerance 0.25
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+ROOT = Path(__file__).resolve().parent.parent
+BOT_ID = "10000"
+USER_BASE = 20000
+
+# 脚本化会话：("text", 文本) / ("image", 说明) / ("voice", 秒数)
+SCRIPTS: dict[str, list[tuple[str, Any]]] = {
+    "chat": [("text", "/a 你好"), ("text", "最近有什么好看的电影"), ("text", "谢谢，我再想想")],
+    "task_text": [("text", "/a 帮我安排一件事"), ("text", "明天上午十点提醒我开会"), ("text", "就这样，提交")],
+    "task_image": [("text", "/a"), ("image", "cat.png"), ("text", "把图里的内容记下来，提交")],
+    "task_voice": [("text", "/a"), ("voice", 4), ("text", "提交")],
+    "fastpath": [("text", "/a 午饭花了30块")],
+}
+
+
+@dataclass(slots=True)
+class StubOptions:
+    ttft: float = 0.3
+    per_token: float = 0.01
+    jitter: float = 0.2
+    n8n_latency: float = 0.05
+
+
+@dataclass
+class StubState:
+    options: StubOptions
+    n8n_arrivals: dict[str, float] = field(default_factory=dict)
+    gemini_calls: int = 0
+
+
+def build_stub_app(state: StubState):
+    from nb_shared.metrics import Histogram
+
+    app = FastAPI()
+    app.state.gemini_hist = Histogram()
+
+    @app.post("/{version}/models/{model_action}")
+    async def generate(version: str, model_action: str, request: Request):
+        started = time.perf_counter()
+        body = await request.json()
+        state.gemini_calls += 1
+        contents = body.get("contents") or []
+        last_text = ""
+        prompt_tokens = 0
+        for content in contents:
+            for part in content.get("parts") or []:
+                if "text" in part:
+                    prompt_tokens += len(part["text"])
+                    if content.get("role") == "user":
+                        last_text = part["text"]
+                else:
+                    prompt_tokens += 258
+
+        if "提交" in last_text:
+            out = {"trigger_n8n": True, "payload": f"需求：{last_text}", "response": ""}
+        else:
+            out = {"trigger_n8n": False, "payload": "", "response": "好的，能再具体说说吗？"}
+        text = json.dumps(out, ensure_ascii=False)
+        output_tokens = max(1, len(text) // 3)
+
+        opts = state.options
+        scale = random.uniform(1 - opts.jitter, 1 + opts.jitter)
+        usage = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        }
+
+        def chunk(piece: str, *, last: bool) -> dict[str, Any]:
+            candidate: dict[str, Any] = {"content": {"role": "model", "parts": [{"text": piece}]}}
+            out: dict[str, Any] = {"candidates": [candidate], "modelVersion": model_action.split(":")[0]}
+            if last:
+                candidate.update(finishReason="STOP", avgLogprobs=-0.05)
+                out["usageMetadata"] = usage
+            return out
+
+        if model_action.endswith(":streamGenerateContent"):
+            # SSE：首个分片在 ttft 后到达，其余按每 token 耗时陆续到达
+            pieces = [text[i:i + 12] for i in range(0, len(text), 12)]
+
+            async def events():
+                await asyncio.sleep(max(0.0, opts.ttft * scale))
+                for i, piece in enumerate(pieces):
+                    if i:
+                        await asyncio.sleep(max(0.0, len(piece) / 3 * opts.per_token * scale))
+                    payload = json.dumps(chunk(piece, last=i == len(pieces) - 1), ensure_ascii=False)
+                    yield f"data: {payload}\r\n\r\n"
+                app.state.gemini_hist.observe(time.perf_counter() - started)
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(max(0.0, (opts.ttft + output_tokens * opts.per_token) * scale))
+        app.state.gemini_hist.observe(time.perf_counter() - started)
+        return chunk(text, last=True)
+
+    @app.post("/webhook/agent")
+    async def n8n(request: Request):
+        body = await request.json()
+        await asyncio.sleep(state.options.n8n_latency)
+        state.n8n_arrivals.setdefault(body.get("session_id", ""), time.perf_counter())
+        return {"ok": True}
+
+    return app
+
+
+async def start_stub(state: StubState):
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config(build_stub_app(state), host="127.0.0.1", port=0, log_level="warning", lifespan="off")
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, port
+
+
+def setup_nonebot(port: int, workdir: Path, *, users: list[int], debounce_ms: int, stream: bool) -> None:
+    env = {
+        "DRIVER": "~fastapi",
+        "SUPERUSERS": json.dumps([str(u) for u in users]),
+        "COMMAND_START": '["/"]',
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "NB_CONFIG_JSON_PATH": str(workdir / "config.json"),
+        "ANTI_RECALL__MONITOR_GROUPS": "[]",
+        "AGENT__GEMINI_BASE_URL": f"http://127.0.0.1:{port}",
+        "AGENT__GEMINI_API_KEY": "bench",
+        "AGENT__N8N_BASE_URL": f"http://127.0.0.1:{port}",
+        "AGENT__N8N_WEBHOOK_PATH": "webhook/agent",
+        "AGENT__CHECKPOINT_PATH": str(workdir / "checkpoints.sqlite"),
+        "AGENT__OUTBOX_PATH": str(workdir / "outbox.sqlite"),
+        "AGENT__SESSION_DEBOUNCE_MS": str(debounce_ms),
+        "AGENT__GEMINI_STREAM": "true" if stream else "false",
+    }
+    for k, v in env.items():
+        os.environ.setdefault(k, v)
+
+    sys.path.insert(0, str(ROOT))
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter as V11Adapter
+
+    nonebot.init()
+    nonebot.get_driver().register_adapter(V11Adapter)
+    nonebot.load_plugins(str(ROOT / "plugin"))
+
+
+class FakeOneBot:
+    """替换适配器的 _call_api：记录发送的消息，按用户唤醒等待者。"""
+
+    def __init__(self, *, voice_bytes: int) -> None:
+        import nonebot
+        from nonebot.adapters.onebot.v11 import Adapter as V11Adapter, Bot
+
+        self.adapter = nonebot.get_adapter(V11Adapter)
+        self.adapter._call_api = self._call_api  # type: ignore[method-assign]
+        self.bot = Bot(self.adapter, BOT_ID)
+        self._msg_id = 0
+        self._voice = base64.b64encode(os.urandom(voice_bytes)).decode()
+        self._waiters: dict[int, asyncio.Queue[tuple[float, str]]] = {}
+        from plugin.agent.config import config
+
+        self._busy_prefix = config.llm_busy_message.split("{")[0]
+
+    def inbox(self, user_id: int) -> asyncio.Queue[tuple[float, str]]:
+        return self._waiters.setdefault(user_id, asyncio.Queue())
+
+    async def _call_api(self, bot, api: str, **data: Any) -> Any:
+        if api in ("send_msg", "send_private_msg"):
+            self._msg_id += 1
+            text = "".join(str(seg.data.get("text", "")) for seg in data.get("message", []) if seg.type == "text")
+            user_id = int(data.get("user_id", 0))
+            if not (self._busy_prefix and text.startswith(self._busy_prefix)):
+                self.inbox(user_id).put_nowait((time.perf_counter(), text))
+            return {"message_id": self._msg_id}
+        if api == "get_record":
+            return {"base64": self._voice}
+        return {}
+
+    def event(self, user_id: int, kind: str, value: Any):
+        from nonebot.adapters.onebot.v11 import Message, MessageSegment, PrivateMessageEvent
+
+        self._msg_id += 1
+        if kind == "text":
+            message = Message(MessageSegment.text(value))
+        elif kind == "image":
+            message = Message(MessageSegment("image", {"file": value, "url": f"https://example.invalid/{value}"}))
+        else:
+            message = Message(MessageSegment("record", {"file": f"voice-{self._msg_id}.amr"}))
+        return PrivateMessageEvent.model_validate(
+            {
+                "time": int(time.time()),
+                "self_id": int(BOT_ID),
+                "post_type": "message",
+                "sub_type": "friend",
+                "message_type": "private",
+                "message_id": self._msg_id,
+                "user_id": user_id,
+                "message": message,
+                "original_message": message,
+                "raw_message": str(message),
+                "font": 0,
+                "sender": {"user_id": user_id, "nickname": f"bench{user_id}"},
+                "to_me": True,
+            }
+        )
+
+
+async def run_session(
+    onebot: FakeOneBot,
+    user_id: int,
+    script: list[tuple[str, Any]],
+    *,
+    think: float,
+    timeout: float,
+    e2e,
+    results: dict[str, Any],
+) -> None:
+    from nonebot.message import handle_event
+
+    inbox = onebot.inbox(user_id)
+    for kind, value in script:
+        sent_at = time.perf_counter()
+        await handle_event(onebot.bot, onebot.event(user_id, kind, value))
+        try:
+            replied_at, _ = await asyncio.wait_for(inbox.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            results["timeouts"] += 1
+            return
+        e2e.observe(replied_at - sent_at)
+        results["turns"] += 1
+        results["last_sent"][user_id] = sent_at
+        if think:
+            await asyncio.sleep(think)
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix="agent-bench-"))
+    state = StubState(StubOptions(ttft=args.ttft_ms / 1000, per_token=args.token_ms / 1000, n8n_latency=args.n8n_ms / 1000))
+    server, server_task, port = await start_stub(state)
+
+    users = [USER_BASE + i for i in range(args.sessions * args.rounds)]
+    setup_nonebot(port, workdir, users=users, debounce_ms=args.debounce_ms, stream=args.stream)
+
+    from nb_shared import metrics
+    from nb_shared.metrics import Histogram
+    from plugin.agent.outbox import get_dispatcher
+
+    onebot = FakeOneBot(voice_bytes=args.voice_seconds * 4000)
+    e2e = Histogram()
+    results: dict[str, Any] = {"turns": 0, "timeouts": 0, "last_sent": {}}
+    names = list(SCRIPTS)
+
+    started = time.perf_counter()
+    for r in range(args.rounds):
+        batch = users[r * args.sessions:(r + 1) * args.sessions]
+        await asyncio.gather(
+            *(
+                run_session(
+                    onebot,
+                    uid,
+                    SCRIPTS[names[i % len(names)]],
+                    think=args.think_ms / 1000,
+                    timeout=args.turn_timeout,
+                    e2e=e2e,
+                    results=results,
+                )
+                for i, uid in enumerate(batch)
+            )
+        )
+    wall = time.perf_counter() - started
+
+    # 等待 outbox 把需求都投递给桩 n8n
+    expected = sum(1 for i in range(len(users)) if names[i % len(names)] != "chat")
+    deadline = time.perf_counter() + 10
+    while len(state.n8n_arrivals) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+    delivery = Histogram()
+    for key, sess_id in _session_ids().items():
+        arrived = state.n8n_arrivals.get(sess_id)
+        sent = results["last_sent"].get(key)
+        if arrived is not None and sent is not None:
+            delivery.observe(arrived - sent)
+
+    stages: dict[str, Any] = {
+        "e2e_reply": e2e.summary(),
+        "n8n_delivery": delivery.summary(),
+        "stub_gemini": server.config.app.state.gemini_hist.summary(),
+    }
+    for name in (
+        "agent_graph_node_seconds",
+        "agent_graph_turn_seconds",
+        "agent_llm_queue_seconds",
+        "agent_llm_latency_seconds",
+        "agent_llm_ttft_seconds",
+    ):
+        for labels, hist in metrics.registry.series(name):
+            suffix = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+            stages[f"{name}{{{suffix}}}" if suffix else name] = hist.summary()
+
+    await get_dispatcher().stop()
+    server.should_exit = True
+    await server_task
+
+    return {
+        "sessions": args.sessions,
+        "rounds": args.rounds,
+        "turns": results["turns"],
+        "timeouts": results["timeouts"],
+        "n8n_delivered": len(state.n8n_arrivals),
+        "n8n_expected": expected,
+        "gemini_calls": state.gemini_calls,
+        "wall_seconds": wall,
+        "throughput_turns_per_s": results["turns"] / wall if wall else 0.0,
+        "stages": stages,
+    }
+
+
+def _session_ids() -> dict[int, str]:
+    """user_id -> n8n session_id（从 outbox 的 reply_to 反查）。"""
+
+    from plugin.agent.outbox import get_outbox
+
+    out: dict[int, str] = {}
+    rows = get_outbox()._conn.execute("SELECT session_id, reply_to FROM outbox").fetchall()
+    for session_id, reply_to in rows:
+        _, _, user = reply_to.partition(":")
+        if user.isdigit():
+            out[int(user)] = session_id
+    return out
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """与基线比较，返回回归项（p95 变慢或吞吐下降超过容忍度）。"""
+
+    problems: list[str] = []
+    base_tp = baseline.get("throughput_turns_per_s") or 0
+    if base_tp and report["throughput_turns_per_s"] < base_tp * (1 - tolerance):
+        problems.append(f"throughput {report['throughput_turns_per_s']:.2f}/s < baseline {base_tp:.2f}/s")
+    for name, base in (baseline.get("stages") or {}).items():
+        cur = report["stages"].get(name)
+        if not cur or not base.get("count") or not cur.get("count"):
+            continue
+        if cur["p95"] > base["p95"] * (1 + tolerance):
+            problems.append(f"{name} p95 {cur['p95'] * 1000:.1f}ms > baseline {base['p95'] * 1000:.1f}ms")
+    if report["timeouts"]:
+        problems.append(f"{report['timeouts']} turn(s) timed out")
+    return problems
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(
+        f"sessions={report['sessions']}x{report['rounds']} turns={report['turns']} timeouts={report['timeouts']} "
+        f"n8n={report['n8n_delivered']}/{report['n8n_expected']} wall={report['wall_seconds']:.2f}s "
+        f"throughput={report['throughput_turns_per_s']:.2f} turns/s"
+    )
+    print(f"{'stage':<68}{'count':>7}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for name, s in report["stages"].items():
+        if not s.get("count"):
+            continue
+        print(f"{name:<68}{s['count']:>7}{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}{s['p99'] * 1000:>10.1f}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8, help="并发会话数")
+    parser.add_argument("--rounds", type=int, default=1, help="重复轮数（每轮使用新的用户）")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="桩 Gemini 首 token 延迟")
+    parser.add_argument("--token-ms", type=float, default=10, help="桩 Gemini 每个输出 token 的耗时")
+    parser.add_argument("--stream", action="store_true", help="agent 使用流式接口（AGENT__GEMINI_STREAM），可测首 token 延迟")
+    parser.add_argument("--n8n-ms", type=float, default=50, help="桩 n8n 响应延迟")
+    parser.add_argument("--voice-seconds", type=int, default=4, help="语音样本时长（按 4KB/s 生成随机数据）")
+    parser.add_argument("--debounce-ms", type=int, default=0, help="AGENT__SESSION_DEBOUNCE_MS（默认 0，只测处理耗时）")
+    parser.add_argument("--think-ms", type=float, default=0, help="收到回复后到发送下一条的间隔")
+    parser.add_argument("--turn-timeout", type=float, default=60, help="单轮等待回复的超时（秒）")
+    parser.add_argument("--json", action="store_true", help="输出完整 JSON 报告")
+    parser.add_argument("--save-baseline", type=Path, help="把本次结果保存为基线")
+    parser.add_argument("--baseline", type=Path, help="与基线比较，回归时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="回归容忍度（相对值）")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"baseline saved: {args.save_baseline}")
+
+    if args.baseline:
+        problems = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION: {p}")
+        return 1 if problems else 0
+    return 1 if report["timeouts"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""anti_recall 消息段 / 缓存原语的微基准（每条被监听的群消息都会走这些函数）。
+
+目标：
+- 可复现：语料由固定种子生成，不依赖网络 / 账号 / OneBot 实现
+- 每个原语在每种语料上给出 ops/s 与单次调用的内存分配（tracemalloc 峰值 / 残留字节）
+- 与 JSON 基线比较，吞吐下降或分配增加超过容忍度时退出码为 1（基线只在同一台机器上有可比性）
+
+语料（每种 --size 条）：
+- plain：纯文本（10~200 字）
+- images：多图（1~9 张，带 url / file）+ 少量文字
+- reply：reply 段 + @ + 文本（NoneBot 预解析失败时 reply 段会留在消息里）
+- forward：外层 forward 段；以及 NapCat 以 CQ 字符串返回的嵌套转发内容
+- cq_escaped：大量需要转义的字符（& [ ] ,），考验 CQ 编解码
+
+用法：
+    python -m bench.anti_recall_micro
+    python -m bench.anti_recall_micro --filter segments_to_cq --json
+    python -m bench.anti_recall_micro --save-baseline bench/anti_recall_micro.baseline.json
+    python -m bench.anti_recall_micro --baseline bench/anti_recall_micro.baseline.json --tolerance 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+
+CORPORA = ("plain", "images", "reply", "forward", "cq_escaped")
+_CJK = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体"
+_ESCAPE_CHARS = "&[],"
+
+
+def _text(rng: random.Random, lo: int, hi: int) -> str:
+    return "".join(rng.choice(_CJK) for _ in range(rng.randint(lo, hi)))
+
+
+def _image(rng: random.Random) -> dict[str, Any]:
+    h = "%032x" % rng.getrandbits(128)
+    return {
+        "type": "image",
+        "data": {
+            "file": f"{h}.jpg",
+            "url": f"https://multimedia.nt.qq.com.cn/download?appid=1407&fileid={h}&rkey=CAQSK{h}",
+            "summary": "",
+            "sub_type": 0,
+        },
+    }
+
+
+def build_corpora(size: int, seed: int) -> dict[str, list[list[dict[str, Any]]]]:
+    """各语料的 OneBot message 数组（list[segment]）。"""
+
+    rng = random.Random(seed)
+    out: dict[str, list[list[dict[str, Any]]]] = {k: [] for k in CORPORA}
+    for i in range(size):
+        out["plain"].append([{"type": "text", "data": {"text": _text(rng, 10, 200)}}])
+
+        segs = [_image(rng) for _ in range(rng.randint(1, 9))]
+        if rng.random() < 0.5:
+            segs.insert(rng.randint(0, len(segs)), {"type": "text", "data": {"text": _text(rng, 2, 20)}})
+        out["images"].append(segs)
+
+        out["reply"].append(
+            [
+                {"type": "reply", "data": {"id": str(1_000_000 + i)}},
+                {"type": "at", "data": {"qq": str(rng.randint(10_000, 9_999_999_999))}},
+                {"type": "text", "data": {"text": " " + _text(rng, 5, 80)}},
+            ]
+        )
+
+        out["forward"].append([{"type": "forward", "data": {"id": "%020d" % rng.getrandbits(64)}}])
+
+        raw = "".join(
+            rng.choice(_ESCAPE_CHARS) if rng.random() < 0.3 else rng.choice(_CJK) for _ in range(rng.randint(20, 200))
+        )
+        out["cq_escaped"].append([{"type": "text", "data": {"text": raw}}])
+    return out
+
+
+def nested_forward_cq(rng: random.Random, depth: int = 2) -> str:
+    """NapCat 以 CQ 字符串返回的合并转发节点内容（含嵌套 forward / 图片 / 转义文本）。"""
+
+    parts = [_text(rng, 5, 40)]
+    for _ in range(rng.randint(1, 3)):
+        img = _image(rng)["data"]
+        parts.append(f"[CQ:image,file={img['file']},url={img['url'].replace('&', '&amp;')}]")
+    if depth > 0:
+        parts.append(f"[CQ:forward,id={'%020d' % rng.getrandbits(64)}]")
+    parts.append("&#91;原文&#93;&amp;" + _text(rng, 5, 20))
+    return "".join(parts)
+
+
+@dataclass(slots=True)
+class Case:
+    name: str
+    corpus: str
+    # 一次调用处理一条语料；返回“对第 i 条执行一次”的函数
+    make: Callable[[], Callable[[int], Any]]
+    size: int
+
+
+def build_cases(size: int, seed: int) -> list[Case]:
+    from nonebot.adapters.onebot.v11.message import Message, MessageSegment
+
+    from plugin.anti_recall import cache, segments
+
+    corpora = build_corpora(size, seed)
+    messages = {
+        k: [Message(MessageSegment(s["type"], dict(s["data"])) for s in segs) for segs in v]
+        for k, v in corpora.items()
+    }
+    rng = random.Random(seed + 1)
+    forward_cq = [nested_forward_cq(rng) for _ in range(size)]
+
+    cases: list[Case] = []
+    for corpus in CORPORA:
+        msgs = messages[corpus]
+        segs = corpora[corpus]
+        cases.append(Case("message_to_segments", corpus, lambda m=msgs: lambda i: segments.message_to_segments(m[i]), size))
+        cases.append(Case("segments_to_cq", corpus, lambda s=segs: lambda i: segments.segments_to_cq(s[i]), size))
+        cases.append(Case("extract_forward_ids", corpus, lambda m=msgs: lambda i: segments.extract_forward_ids(m[i]), size))
+        cases.append(
+            Case(
+                "normalize_content_to_segments",
+                corpus,
+                lambda s=segs: lambda i: segments.normalize_content_to_segments(s[i]),
+                size,
+            )
+        )
+
+    for corpus in ("plain", "images", "cq_escaped"):
+        segs = corpora[corpus]
+        cases.append(
+            Case(
+                "_summarize_reply_segments",
+                corpus,
+                lambda s=segs: lambda i: segments._summarize_reply_segments(s[i], offset_up=3),
+                size,
+            )
+        )
+
+    # 字符串形态：NapCat 返回的 CQ 字符串需要先解析
+    cq_plain = [segments.segments_to_cq(s) for s in corpora["cq_escaped"]]
+    cases.append(
+        Case("normalize_content_to_segments", "cq_string", lambda: lambda i: segments.normalize_content_to_segments(cq_plain[i]), size)
+    )
+    cases.append(
+        Case(
+            "normalize_content_to_segments",
+            "forward_cq_string",
+            lambda: lambda i: segments.normalize_content_to_segments(forward_cq[i]),
+            size,
+        )
+    )
+
+    # 缓存：模拟连续写入（超过上限后 FIFO 淘汰）、命中读取、计算“往上第 N 条”
+    entries = [
+        cache.CachedMessage(
+            sender_name="用户",
+            message=messages["plain"][i],
+            group_id=1,
+            sender_user_id=2,
+            forward_ids=None,
+            expanded_segments=corpora["plain"][i],
+        )
+        for i in range(size)
+    ]
+
+    def make_put() -> Callable[[int], Any]:
+        counter = iter(range(10**12))
+        return lambda i: cache.put(next(counter), entries[i])
+
+    def make_get() -> Callable[[int], Any]:
+        for mid in range(cache.MAX_CACHE_SIZE):
+            cache.put(mid, entries[mid % size])
+        return lambda i: cache.get(i % cache.MAX_CACHE_SIZE)
+
+    def make_offset_up() -> Callable[[int], Any]:
+        for mid in range(cache.MAX_CACHE_SIZE):
+            cache.put(mid, entries[mid % size])
+        return lambda i: cache.offset_up(cache.MAX_CACHE_SIZE - 1, i % cache.MAX_CACHE_SIZE)
+
+    cases.append(Case("cache.put", "plain", make_put, size))
+    cases.append(Case("cache.get", "plain", make_get, size))
+    cases.append(Case("cache.offset_up", "plain", make_offset_up, size))
+    return cases
+
+
+def measure(case: Case, *, repeat: int, min_time: float) -> dict[str, Any]:
+    fn = case.make()
+    n = case.size
+
+    def one_pass() -> float:
+        started = time.perf_counter()
+        for i in range(n):
+            fn(i)
+        return time.perf_counter() - started
+
+    # 预热 + 估算：每轮至少 min_time 秒；计时期间关闭 GC（与 timeit 相同），减少抖动
+    first = one_pass()
+    loops = max(1, int(min_time / first) if first > 0 else 1)
+    timings: list[float] = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            total = 0.0
+            for _ in range(loops):
+                total += one_pass()
+            timings.append(total / (loops * n))
+    finally:
+        gc.enable()
+    timings.sort()
+    best = timings[0]
+
+    # 内存：逐次调用测 tracemalloc 峰值增量（瞬时分配）与残留增量
+    tracemalloc.start()
+    peak_sum = 0
+    retained_sum = 0
+    for i in range(n):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = fn(i)
+        current, peak = tracemalloc.get_traced_memory()
+        peak_sum += peak - before
+        retained_sum += current - before
+        del result
+    tracemalloc.stop()
+
+    return {
+        "ops_per_s": 1.0 / best if best else 0.0,
+        "ns_per_op_best": best * 1e9,
+        "ns_per_op_median": timings[len(timings) // 2] * 1e9,
+        "peak_bytes_per_op": peak_sum / n,
+        "retained_bytes_per_op": retained_sum / n,
+        "ops_per_repeat": loops * n,
+    }
+
+
+def setup() -> None:
+    os.environ.setdefault("NB_CONFIG_JSON_PATH", str(Path(tempfile.mkdtemp(prefix="micro-")) / "config.json"))
+    os.environ.setdefault("ANTI_RECALL__MONITOR_GROUPS", "[]")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, str(ROOT))
+    import nonebot
+
+    nonebot.init(driver="~none")
+    nonebot.load_plugin("plugin.anti_recall")
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    setup()
+    results: dict[str, Any] = {}
+    for case in build_cases(args.size, args.seed):
+        key = f"{case.name}/{case.corpus}"
+        if args.filter and args.filter not in key:
+            continue
+        results[key] = measure(case, repeat=args.repeat, min_time=args.min_time)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "size": args.size,
+        "seed": args.seed,
+        "results": results,
+    }
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """与基线比较，返回回归项（吞吐下降或单次峰值分配增加超过容忍度）。"""
+
+    problems: list[str] = []
+    for key, base in (baseline.get("results") or {}).items():
+        cur = report["results"].get(key)
+        if not cur:
+            continue
+        if base.get("ops_per_s") and cur["ops_per_s"] < base["ops_per_s"] * (1 - tolerance):
+            problems.append(f"{key} {cur['ops_per_s']:,.0f} ops/s < baseline {base['ops_per_s']:,.0f} ops/s")
+        base_peak = base.get("peak_bytes_per_op") or 0
+        # 很小的分配量（几十字节）受解释器内部缓存影响，绝对值变化不足 64B 时不算回归
+        if base_peak and cur["peak_bytes_per_op"] > base_peak * (1 + tolerance) + 64:
+            problems.append(f"{key} peak {cur['peak_bytes_per_op']:.0f}B/op > baseline {base_peak:.0f}B/op")
+    return problems
+
+
+def print_report(report: dict[str, Any], baseline: dict[str, Any] | None = None) -> None:
+    base_results = (baseline or {}).get("results") or {}
+    print(f"python={report['python']} size={report['size']} seed={report['seed']}")
+    print(f"{'case':<52}{'ops/s':>14}{'ns/op':>10}{'peak B/op':>12}{'kept B/op':>12}{'vs base':>10}")
+    for key, r in report["results"].items():
+        base = base_results.get(key)
+        delta = f"{r['ops_per_s'] / base['ops_per_s'] - 1:+.0%}" if base and base.get("ops_per_s") else ""
+        print(
+            f"{key:<52}{r['ops_per_s']:>14,.0f}{r['ns_per_op_best']:>10.0f}"
+            f"{r['peak_bytes_per_op']:>12.0f}{r['retained_bytes_per_op']:>12.0f}{delta:>10}"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=200, help="每种语料的消息条数")
+    parser.add_argument("--seed", type=int, default=20240601, help="语料随机种子")
+    parser.add_argument("--repeat", type=int, default=5, help="计时重复次数（取最快一次）")
+    parser.add_argument("--min-time", type=float, default=0.1, help="每次计时的最短时长（秒）")
+    parser.add_argument("--filter", default="", help="只运行名称包含该子串的用例，例如 segments_to_cq 或 /images")
+    parser.add_argument("--json", action="store_true", help="输出完整 JSON 报告")
+    parser.add_argument("--save-baseline", type=Path, help="把本次结果保存为基线")
+    parser.add_argument("--baseline", type=Path, help="与基线比较，回归时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="回归容忍度（相对值）")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline else None
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report, baseline)
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"baseline saved: {args.save_baseline}")
+
+    if baseline is not None:
+        problems = compare(report, baseline, args.tolerance)
+        for p in problems:
+            print(f"REGRESSION: {p}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
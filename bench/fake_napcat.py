@@ -0,0 +1,494 @@
+"""本地假 NapCat（OneBot V11 反向 WebSocket 客户端）：不用真实 QQ 号对机器人做持续压测。
+
+目标：
+- 机器人照常以 FastAPI 驱动监听 `/onebot/v11/ws`，本脚本像 NapCat 一样连上去（反向 WS），
+  收发的都是真实的 OneBot V11 JSON 帧：适配器、API hook、插件全链路都会被走到
+- 实现本项目会调用的 API：get_msg / get_group_msg_history / get_friend_msg_history / send_*_msg /
+  send_*_forward_msg / forward_group_single_msg / forward_friend_single_msg / delete_msg / get_record
+- 每个 API 可配置延迟、失败率、超时率（超时 = 永不回包，由机器人侧的 API 超时兜底）
+
+流量：
+- 以 --rate 条/秒向 --groups 个群投递群消息（文本 / 多图 / 回复 / 合并转发混合）
+- 每条消息以 --recall-ratio 的概率在 0.5~--recall-delay 秒后被撤回（group_recall 通知）
+
+统计：
+- 撤回 → 送达延迟：从发出撤回通知，到机器人把带有“撤回消息ID: N”的内容发给接收人（首次送达）
+- 缓存未命中率：撤回后 --delivery-timeout 秒内没有送达的比例（anti_recall 缓存已淘汰 / 处理失败）
+- 各 API 的调用次数、注入的失败 / 超时次数
+
+用法：
+    # 由脚本拉起 bot.py（临时配置，监听的群 / 接收人自动对上）
+    python -m bench.fake_napcat --spawn --rate 20 --duration 60
+    # 连接已在运行的机器人（需自行把 ANTI_RECALL__MONITOR_GROUPS 配成 --group-base 起的群号）
+    python -m bench.fake_napcat --url ws://127.0.0.1:8080/onebot/v11/ws --rate 50 \\
+        --latency-ms 40 --api get_group_msg_history=300:0.05 --api delete_msg=50:0.2:0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from nb_shared.metrics import Histogram  # noqa: E402
+
+_RECALL_ID = re.compile(r"撤回消息ID: ?(\d+)")
+_WORDS = "今天天气不错我们去吃饭吧哈哈好的收到了明白"
+
+
+@dataclass(slots=True)
+class ApiFault:
+    """单个 API 的注入配置。"""
+
+    latency: float = 0.02
+    fail_rate: float = 0.0
+    timeout_rate: float = 0.0
+
+
+def parse_api_fault(spec: str, default: ApiFault) -> tuple[str, ApiFault]:
+    """`name=延迟ms[:失败率[:超时率]]`。"""
+
+    name, _, rest = spec.partition("=")
+    parts = rest.split(":") if rest else []
+    fault = ApiFault(default.latency, default.fail_rate, default.timeout_rate)
+    if len(parts) > 0 and parts[0]:
+        fault.latency = float(parts[0]) / 1000
+    if len(parts) > 1 and parts[1]:
+        fault.fail_rate = float(parts[1])
+    if len(parts) > 2 and parts[2]:
+        fault.timeout_rate = float(parts[2])
+    return name.strip(), fault
+
+
+@dataclass(slots=True)
+class StoredMessage:
+    message_id: int
+    message_type: str
+    chat_id: int
+    user_id: int
+    message: list[dict[str, Any]]
+    time: int
+
+    def to_onebot(self) -> dict[str, Any]:
+        return {
+            "message_id": self.message_id,
+            "real_id": self.message_id,
+            "message_seq": self.message_id,
+            "message_type": self.message_type,
+            "group_id": self.chat_id if self.message_type == "group" else None,
+            "user_id": self.user_id,
+            "time": self.time,
+            "sender": {"user_id": self.user_id, "nickname": f"u{self.user_id}", "card": ""},
+            "message": self.message,
+            "raw_message": "",
+            "font": 0,
+        }
+
+
+@dataclass
+class Stats:
+    events: Counter[str] = field(default_factory=Counter)
+    calls: Counter[str] = field(default_factory=Counter)
+    failed: Counter[str] = field(default_factory=Counter)
+    timed_out: Counter[str] = field(default_factory=Counter)
+    # message_id -> 撤回通知发出时刻
+    recalled_at: dict[int, float] = field(default_factory=dict)
+    delivered: dict[int, float] = field(default_factory=dict)
+    delivery: Histogram = field(default_factory=Histogram)
+
+
+class FakeNapCat:
+    """维护消息存储，应答 API，并向机器人推送事件。"""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.self_id = args.self_id
+        self.rng = random.Random(args.seed)
+        default = ApiFault(args.latency_ms / 1000, args.fail_rate, args.timeout_rate)
+        self.default_fault = default
+        self.faults = dict(parse_api_fault(s, default) for s in args.api)
+        self.groups = [args.group_base + i for i in range(args.groups)]
+        self.stats = Stats()
+        self.messages: dict[int, StoredMessage] = {}
+        self.history: dict[tuple[str, int], list[int]] = {}
+        self._next_id = 1_000_000
+        self._voice = base64.b64encode(os.urandom(8000)).decode()
+        self._ws: Any = None
+        self._tasks: set[asyncio.Task[Any]] = set()
+
+    # ---------- 存储 ----------
+
+    def _store(self, message_type: str, chat_id: int, user_id: int, message: list[dict[str, Any]]) -> StoredMessage:
+        self._next_id += 1
+        msg = StoredMessage(self._next_id, message_type, chat_id, user_id, message, int(time.time()))
+        self.messages[msg.message_id] = msg
+        hist = self.history.setdefault((message_type, chat_id), [])
+        hist.append(msg.message_id)
+        if len(hist) > 2000:
+            for mid in hist[:1000]:
+                self.messages.pop(mid, None)
+            del hist[:1000]
+        return msg
+
+    def _history(self, message_type: str, chat_id: int, message_seq: int, count: int) -> list[dict[str, Any]]:
+        ids = self.history.get((message_type, chat_id), [])
+        if message_seq:
+            ids = [i for i in ids if i <= message_seq]
+        return [self.messages[i].to_onebot() for i in ids[-max(1, count):] if i in self.messages]
+
+    def _note_delivery(self, params: dict[str, Any]) -> None:
+        text = json.dumps(params, ensure_ascii=False)
+        now = time.perf_counter()
+        for m in _RECALL_ID.finditer(text):
+            mid = int(m.group(1))
+            recalled = self.stats.recalled_at.get(mid)
+            if recalled is not None and mid not in self.stats.delivered:
+                self.stats.delivered[mid] = now
+                self.stats.delivery.observe(now - recalled)
+
+    # ---------- API ----------
+
+    def handle(self, action: str, params: dict[str, Any]) -> Any:
+        if action in ("send_private_msg", "send_group_msg", "send_msg"):
+            self._note_delivery(params)
+            is_group = action == "send_group_msg" or params.get("message_type") == "group" or (
+                action == "send_msg" and params.get("group_id")
+            )
+            chat = int(params.get("group_id") or 0) if is_group else int(params.get("user_id") or 0)
+            message = params.get("message")
+            segs = message if isinstance(message, list) else [{"type": "text", "data": {"text": str(message)}}]
+            msg = self._store("group" if is_group else "private", chat, self.self_id, segs)
+            return {"message_id": msg.message_id}
+        if action in ("send_private_forward_msg", "send_group_forward_msg", "send_forward_msg"):
+            self._note_delivery(params)
+            is_group = action == "send_group_forward_msg" or bool(params.get("group_id"))
+            chat = int(params.get("group_id") or 0) if is_group else int(params.get("user_id") or 0)
+            fid = "%020d" % self.rng.getrandbits(64)
+            segs = [{"type": "forward", "data": {"id": fid}}]
+            msg = self._store("group" if is_group else "private", chat, self.self_id, segs)
+            return {"message_id": msg.message_id, "res_id": fid}
+        if action == "forward_group_single_msg":
+            src = self.messages.get(int(params.get("message_id") or 0))
+            if src is None:
+                raise LookupError("message not found")
+            self._store("group", int(params["group_id"]), self.self_id, src.message)
+            return None
+        if action == "forward_friend_single_msg":
+            # 转发消息的送达按随后的 header（send_private_msg，含撤回消息ID）计入
+            return None
+        if action == "get_msg":
+            msg = self.messages.get(int(params.get("message_id") or 0))
+            if msg is None:
+                raise LookupError("message not found")
+            return msg.to_onebot()
+        if action in ("get_group_msg_history", "get_friend_msg_history"):
+            is_group = action == "get_group_msg_history"
+            chat = int(params["group_id"] if is_group else params["user_id"])
+            seq = int(params.get("message_seq") or 0)
+            count = int(params.get("count") or 20)
+            return {"messages": self._history("group" if is_group else "private", chat, seq, count)}
+        if action == "delete_msg":
+            if self.messages.pop(int(params.get("message_id") or 0), None) is None:
+                raise LookupError("message not found")
+            return None
+        if action == "get_record":
+            return {"file": "record.amr", "base64": self._voice}
+        if action == "get_login_info":
+            return {"user_id": self.self_id, "nickname": "fake-napcat"}
+        if action == "get_forward_msg":
+            return {"messages": []}
+        return None
+
+    async def _answer(self, frame: dict[str, Any]) -> None:
+        action = str(frame.get("action", ""))
+        params = frame.get("params") or {}
+        echo = frame.get("echo")
+        fault = self.faults.get(action, self.default_fault)
+        self.stats.calls[action] += 1
+
+        if fault.latency:
+            await asyncio.sleep(fault.latency * self.rng.uniform(0.5, 1.5))
+        if self.rng.random() < fault.timeout_rate:
+            self.stats.timed_out[action] += 1
+            return
+        if self.rng.random() < fault.fail_rate:
+            self.stats.failed[action] += 1
+            reply = {"status": "failed", "retcode": 1200, "data": None, "message": "injected failure", "echo": echo}
+        else:
+            try:
+                reply = {"status": "ok", "retcode": 0, "data": self.handle(action, params), "echo": echo}
+            except Exception as e:
+                self.stats.failed[action] += 1
+                reply = {"status": "failed", "retcode": 1404, "data": None, "message": str(e), "echo": echo}
+        await self._ws.send(json.dumps(reply, ensure_ascii=False))
+
+    # ---------- 事件 ----------
+
+    def _base(self) -> dict[str, Any]:
+        return {"time": int(time.time()), "self_id": self.self_id}
+
+    def _random_message(self, group_id: int) -> list[dict[str, Any]]:
+        r = self.rng.random()
+        text = "".join(self.rng.choice(_WORDS) for _ in range(self.rng.randint(4, 60)))
+        if r < 0.6:
+            return [{"type": "text", "data": {"text": text}}]
+        if r < 0.8:
+            images = []
+            for _ in range(self.rng.randint(1, 4)):
+                h = f"{self.rng.getrandbits(64):x}"
+                images.append({"type": "image", "data": {"file": f"{h}.jpg", "url": f"https://example.invalid/{h}"}})
+            return images
+        if r < 0.95:
+            hist = self.history.get(("group", group_id)) or []
+            if hist:
+                reply = {"type": "reply", "data": {"id": str(self.rng.choice(hist[-50:]))}}
+                return [reply, {"type": "text", "data": {"text": text}}]
+            return [{"type": "text", "data": {"text": text}}]
+        return [{"type": "forward", "data": {"id": "%020d" % self.rng.getrandbits(64)}}]
+
+    async def _send_event(self, event: dict[str, Any]) -> None:
+        kind = f"{event['post_type']}.{event.get('message_type') or event.get('notice_type') or ''}"
+        self.stats.events[kind] += 1
+        await self._ws.send(json.dumps(event, ensure_ascii=False))
+
+    async def _recall_later(self, msg: StoredMessage) -> None:
+        await asyncio.sleep(self.rng.uniform(0.5, max(0.5, self.args.recall_delay)))
+        self.stats.recalled_at[msg.message_id] = time.perf_counter()
+        await self._send_event(
+            {
+                **self._base(),
+                "post_type": "notice",
+                "notice_type": "group_recall",
+                "group_id": msg.chat_id,
+                "user_id": msg.user_id,
+                "operator_id": msg.user_id,
+                "message_id": msg.message_id,
+            }
+        )
+
+    def _spawn(self, coro: Any) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def generate(self, duration: float) -> None:
+        interval = 1.0 / self.args.rate
+        started = time.perf_counter()
+        n = 0
+        while True:
+            due = started + n * interval
+            if due - started >= duration:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            n += 1
+            group_id = self.rng.choice(self.groups)
+            user_id = self.rng.randint(20_000, 20_000 + self.args.users)
+            msg = self._store("group", group_id, user_id, self._random_message(group_id))
+            await self._send_event(
+                {
+                    **self._base(),
+                    "post_type": "message",
+                    "message_type": "group",
+                    "sub_type": "normal",
+                    "message_id": msg.message_id,
+                    "message_seq": msg.message_id,
+                    "group_id": group_id,
+                    "user_id": user_id,
+                    "anonymous": None,
+                    "message": msg.message,
+                    "raw_message": "",
+                    "font": 0,
+                    "sender": {"user_id": user_id, "nickname": f"u{user_id}", "card": "", "role": "member"},
+                    "message_format": "array",
+                }
+            )
+            if self.rng.random() < self.args.recall_ratio:
+                self._spawn(self._recall_later(msg))
+
+    # ---------- 连接 ----------
+
+    async def _receive(self) -> None:
+        async for raw in self._ws:
+            try:
+                frame = json.loads(raw)
+            except ValueError:
+                continue
+            if isinstance(frame, dict) and "action" in frame:
+                self._spawn(self._answer(frame))
+
+    async def run(self, url: str, *, connect_timeout: float) -> None:
+        from websockets.asyncio.client import connect
+
+        headers = {"X-Self-ID": str(self.self_id), "X-Client-Role": "Universal", "User-Agent": "FakeNapCat"}
+        if self.args.access_token:
+            headers["Authorization"] = f"Bearer {self.args.access_token}"
+
+        deadline = time.monotonic() + connect_timeout
+        while True:
+            try:
+                self._ws = await connect(url, additional_headers=headers, max_size=None)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.5)
+
+        receiver = asyncio.create_task(self._receive())
+        try:
+            await self._send_event(
+                {**self._base(), "post_type": "meta_event", "meta_event_type": "lifecycle", "sub_type": "connect"}
+            )
+            # 等适配器完成连接初始化
+            await asyncio.sleep(1.0)
+            await self.generate(self.args.duration)
+            # 等待尚未触发的撤回与送达
+            await asyncio.sleep(self.args.recall_delay + self.args.delivery_timeout)
+        finally:
+            receiver.cancel()
+            await self._ws.close()
+            for task in list(self._tasks):
+                task.cancel()
+
+    def report(self, wall: float) -> dict[str, Any]:
+        recalled = len(self.stats.recalled_at)
+        delivered = len(self.stats.delivered)
+        messages = self.stats.events.get("message.group", 0)
+        return {
+            "duration_seconds": wall,
+            "target_rate": self.args.rate,
+            "actual_rate": messages / self.args.duration if self.args.duration else 0.0,
+            "events": dict(self.stats.events),
+            "recalls": recalled,
+            "delivered": delivered,
+            "cache_miss_rate": (recalled - delivered) / recalled if recalled else 0.0,
+            "recall_to_delivery": self.stats.delivery.summary(),
+            "api_calls": dict(self.stats.calls.most_common()),
+            "api_failed": dict(self.stats.failed),
+            "api_timed_out": dict(self.stats.timed_out),
+        }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_bot(args: argparse.Namespace) -> tuple[subprocess.Popen[bytes], str]:
+    """以临时配置启动 bot.py：监听的群 / 接收人与本脚本生成的流量对上，agent 指向不可达地址。"""
+
+    port = _free_port()
+    workdir = Path(tempfile.mkdtemp(prefix="fake-napcat-"))
+    groups = [args.group_base + i for i in range(args.groups)]
+    env = {
+        **os.environ,
+        "DRIVER": "~fastapi",
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "ONEBOT_ACCESS_TOKEN": args.access_token or "",
+        "NB_CONFIG_JSON_PATH": str(workdir / "config.json"),
+        "ANTI_RECALL__MONITOR_GROUPS": json.dumps(groups),
+        "ANTI_RECALL__TARGET_USER_ID": json.dumps([args.target_user]),
+        "ANTI_RECALL__ARCHIVE_GROUP_ID": str(args.archive_group),
+        "AGENT__GEMINI_API_KEY": "fake",
+        "AGENT__GEMINI_BASE_URL": "http://127.0.0.1:9",
+        "AGENT__N8N_BASE_URL": "http://127.0.0.1:9",
+        "AGENT__N8N_WEBHOOK_PATH": "webhook/agent",
+        "AGENT__CHECKPOINT_PATH": str(workdir / "checkpoints.sqlite"),
+        "AGENT__OUTBOX_PATH": str(workdir / "outbox.sqlite"),
+    }
+    proc = subprocess.Popen([sys.executable, "bot.py"], cwd=ROOT, env=env)
+    return proc, f"ws://127.0.0.1:{port}/onebot/v11/ws"
+
+
+def print_report(report: dict[str, Any]) -> None:
+    d = report["recall_to_delivery"]
+    print(
+        f"rate={report['actual_rate']:.1f}/{report['target_rate']:g} msg/s events={sum(report['events'].values())} "
+        f"recalls={report['recalls']} delivered={report['delivered']} miss_rate={report['cache_miss_rate']:.1%}"
+    )
+    if d["count"]:
+        print(
+            f"recall->delivery p50={d['p50'] * 1000:.0f}ms p95={d['p95'] * 1000:.0f}ms "
+            f"p99={d['p99'] * 1000:.0f}ms max={d['max'] * 1000:.0f}ms"
+        )
+    print(f"{'api':<32}{'calls':>8}{'failed':>8}{'timeout':>8}")
+    for api, n in report["api_calls"].items():
+        print(f"{api:<32}{n:>8}{report['api_failed'].get(api, 0):>8}{report['api_timed_out'].get(api, 0):>8}")
+
+
+async def main_async(args: argparse.Namespace) -> dict[str, Any]:
+    proc = None
+    url = args.url
+    if args.spawn:
+        proc, url = spawn_bot(args)
+    napcat = FakeNapCat(args)
+    started = time.perf_counter()
+    try:
+        await napcat.run(url, connect_timeout=60 if args.spawn else 5)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return napcat.report(time.perf_counter() - started)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="ws://127.0.0.1:8080/onebot/v11/ws", help="机器人的反向 WS 地址")
+    parser.add_argument("--spawn", action="store_true", help="以临时配置启动 bot.py 并连接")
+    parser.add_argument("--access-token", default="", help="ONEBOT_ACCESS_TOKEN")
+    parser.add_argument("--self-id", type=int, default=10000, help="假账号 QQ 号")
+    parser.add_argument("--duration", type=float, default=30, help="投递消息的时长（秒）")
+    parser.add_argument("--rate", type=float, default=20, help="群消息速率（条/秒）")
+    parser.add_argument("--groups", type=int, default=5, help="群数量")
+    parser.add_argument("--group-base", type=int, default=900_000_001, help="第一个群的群号")
+    parser.add_argument("--users", type=int, default=200, help="发言用户数")
+    parser.add_argument("--recall-ratio", type=float, default=0.1, help="被撤回的消息比例")
+    parser.add_argument("--recall-delay", type=float, default=5, help="撤回发生在发送后 0.5~N 秒")
+    parser.add_argument("--delivery-timeout", type=float, default=10, help="撤回后多久未送达算未命中")
+    parser.add_argument("--target-user", type=int, default=10001, help="反撤回接收人（--spawn 时写入配置）")
+    parser.add_argument("--archive-group", type=int, default=900_000_000, help="转发消息归档群（--spawn 时写入配置）")
+    parser.add_argument("--latency-ms", type=float, default=20, help="API 默认延迟")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="API 默认失败率")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="API 默认超时率（不回包）")
+    parser.add_argument(
+        "--api", action="append", default=[], metavar="NAME=MS[:FAIL[:TIMEOUT]]", help="单个 API 的注入配置，可重复"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--json", action="store_true", help="输出完整 JSON 报告")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
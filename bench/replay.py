@@ -0,0 +1,228 @@
+"""事件回放：把 `test capture` 录制的 JSONL 事件按原始节奏（或 N 倍速）喂给进程内的 NoneBot。
+
+目标：
+- 离线复现线上流量形态（例如繁忙群 + 撤回风暴），验证 anti_recall / agent 等插件的性能改动
+- 不连接真实 OneBot 实现：适配器的 _call_api 被替换为本地记录器（可模拟后端延迟），API hook 照常执行
+
+做法：
+- 加载全部插件（环境变量与 bench/agent_e2e.py 相同：checkpoint / outbox 写临时目录，Gemini / n8n 指向本地桩服务）
+- 录制里出现的群默认全部加入 ANTI_RECALL__MONITOR_GROUPS（录制脱敏后群号是伪号，原配置对不上）
+- 每条事件按 (ts - 首条 ts) / speed 的时刻投递（speed=0 表示不等待、尽快投递），
+  各事件并发执行 nonebot.message.handle_event，与真实驱动一致
+
+输出：
+- 吞吐（事件/秒）、投递滞后（实际投递时刻 - 计划时刻）
+- 按事件类型的处理耗时（handle_event 完成为止，p50/p95/p99）
+- 各 API 的调用次数与模拟耗时、各 matcher 耗时（来自 dev_debug 的追踪指标）
+
+用法：
+    python -m bench.replay data/capture/events-20250101-120000.jsonl --speed 10
+    python -m bench.replay events.jsonl --speed 0 --api-latency-ms 30 --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+from bench.agent_e2e import StubOptions, StubState, setup_nonebot, start_stub
+
+
+def load_events(path: Path) -> list[tuple[float, dict[str, Any]]]:
+    out: list[tuple[float, dict[str, Any]]] = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            out.append((float(row["ts"]), row["event"]))
+    out.sort(key=lambda r: r[0])
+    return out
+
+
+def event_kind(data: dict[str, Any]) -> str:
+    post_type = data.get("post_type", "?")
+    detail = data.get(f"{post_type}_type") or data.get("message_type") or ""
+    return f"{post_type}.{detail}" if detail else str(post_type)
+
+
+class RecordingOneBot:
+    """替换适配器的 _call_api：记录每次调用，按配置模拟延迟，返回足够让插件继续走下去的结果。"""
+
+    def __init__(self, *, latency: float, jitter: float = 0.3) -> None:
+        import nonebot
+        from nonebot.adapters.onebot.v11 import Adapter as V11Adapter
+
+        self.adapter = nonebot.get_adapter(V11Adapter)
+        self.adapter._call_api = self._call_api  # type: ignore[method-assign]
+        self.latency = latency
+        self.jitter = jitter
+        self.calls: Counter[str] = Counter()
+        self._bots: dict[str, Any] = {}
+        self._msg_id = 10_000_000
+        self._voice = base64.b64encode(os.urandom(2000)).decode()
+
+    def bot(self, self_id: str):
+        from nonebot.adapters.onebot.v11 import Bot
+
+        bot = self._bots.get(self_id)
+        if bot is None:
+            bot = Bot(self.adapter, self_id)
+            self._bots[self_id] = bot
+        return bot
+
+    async def _call_api(self, bot, api: str, **data: Any) -> Any:
+        self.calls[api] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        if api.startswith("send_") or api.endswith("_forward_msg"):
+            self._msg_id += 1
+            return {"message_id": self._msg_id}
+        if api.endswith("_msg_history"):
+            return {"messages": []}
+        if api == "get_record":
+            return {"base64": self._voice}
+        if api == "get_msg":
+            return {"message_id": data.get("message_id"), "message": [], "sender": {}, "time": int(time.time())}
+        return {}
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    events = load_events(args.file)
+    if args.limit:
+        events = events[: args.limit]
+    if not events:
+        raise SystemExit(f"{args.file} 中没有事件")
+
+    workdir = Path(tempfile.mkdtemp(prefix="replay-"))
+    state = StubState(StubOptions(ttft=args.llm_ms / 1000, per_token=0.0))
+    server, server_task, port = await start_stub(state)
+
+    groups = sorted({int(e["group_id"]) for _, e in events if e.get("group_id")})
+    os.environ.setdefault("ANTI_RECALL__MONITOR_GROUPS", json.dumps(groups))
+    os.environ.setdefault("ANTI_RECALL__TARGET_USER_ID", json.dumps([args.anti_recall_target]))
+    setup_nonebot(port, workdir, users=[], debounce_ms=0, stream=False)
+
+    from nonebot.adapters.onebot.v11 import Adapter as V11Adapter
+    from nonebot.message import handle_event
+
+    from nb_shared import metrics
+    from nb_shared.metrics import Histogram
+    from plugin.agent.outbox import get_dispatcher
+
+    onebot = RecordingOneBot(latency=args.api_latency_ms / 1000)
+    handler: dict[str, Histogram] = {}
+    lateness = Histogram()
+    errors: Counter[str] = Counter()
+
+    async def deliver(data: dict[str, Any]) -> None:
+        kind = event_kind(data)
+        try:
+            event = V11Adapter.json_to_event(data)
+        except Exception:
+            errors["parse"] += 1
+            return
+        if event is None:
+            errors["parse"] += 1
+            return
+        started = time.perf_counter()
+        try:
+            await handle_event(onebot.bot(str(data.get("self_id", "0"))), event)
+        except Exception:
+            errors[kind] += 1
+        handler.setdefault(kind, Histogram()).observe(time.perf_counter() - started)
+
+    ts0 = events[0][0]
+    tasks: list[asyncio.Task[None]] = []
+    started = time.perf_counter()
+    for ts, data in events:
+        if args.speed > 0:
+            due = started + (ts - ts0) / args.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lateness.observe(max(0.0, time.perf_counter() - due))
+        tasks.append(asyncio.create_task(deliver(data)))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+
+    api_stats: dict[str, Any] = {}
+    for labels, hist in metrics.registry.series("onebot_api_seconds"):
+        api_stats[labels["api"]] = hist.summary()
+    matcher_stats: dict[str, Any] = {}
+    for labels, hist in metrics.registry.series("nonebot_matcher_seconds"):
+        matcher_stats[labels["matcher"]] = hist.summary()
+
+    await get_dispatcher().stop()
+    server.should_exit = True
+    await server_task
+
+    return {
+        "file": str(args.file),
+        "events": len(events),
+        "speed": args.speed,
+        "captured_span_seconds": events[-1][0] - ts0,
+        "wall_seconds": wall,
+        "throughput_events_per_s": len(events) / wall if wall else 0.0,
+        "lateness": lateness.summary(),
+        "handler": {k: h.summary() for k, h in sorted(handler.items())},
+        "errors": dict(errors),
+        "api_calls": dict(onebot.calls.most_common()),
+        "api": api_stats,
+        "matchers": matcher_stats,
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(
+        f"events={report['events']} span={report['captured_span_seconds']:.1f}s speed={report['speed']:g}x "
+        f"wall={report['wall_seconds']:.2f}s throughput={report['throughput_events_per_s']:.1f} events/s "
+        f"lateness_p99={report['lateness']['p99'] * 1000:.1f}ms errors={sum(report['errors'].values())}"
+    )
+
+    def table(title: str, rows: dict[str, Any]) -> None:
+        if not rows:
+            return
+        print(f"{title:<52}{'count':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+        for name, s in rows.items():
+            print(
+                f"{name:<52}{s['count']:>8}{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}"
+                f"{s['p99'] * 1000:>10.1f}{s['max'] * 1000:>10.1f}"
+            )
+
+    table("handler", report["handler"])
+    table("api", report["api"])
+    table("matcher", report["matchers"])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", type=Path, help="test capture 录制的 JSONL 文件")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速；0 表示不等待、尽快投递")
+    parser.add_argument("--limit", type=int, default=0, help="只回放前 N 条")
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="模拟 OneBot API 延迟")
+    parser.add_argument("--llm-ms", type=float, default=300, help="桩 Gemini 延迟")
+    parser.add_argument("--anti-recall-target", type=int, default=10001, help="反撤回转发目标（任意 QQ 号即可）")
+    parser.add_argument("--json", action="store_true", help="输出完整 JSON 报告")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -27,6 +27,8 @@ import json
 import os
 import threading
 
+from . import memstats
+
 
 DEFAULT_ENV_KEY = "NB_CONFIG_JSON_PATH"
 DEFAULT_PATH = "data/config.json"
@@ -77,6 +79,11 @@ class JsonConfigStore:
             self._data = {}
         return self._data
 
+    def cached(self) -> dict[str, Any] | None:
+        """已加载到内存的配置（未加载时返回 None，不触发读盘）。"""
+
+        return self._data
+
     def reload(self) -> None:
         """强制从磁盘重新加载。"""
 
@@ -150,7 +157,9 @@ def get_store() -> JsonConfigStore:
         # 相对路径默认以当前工作目录为基准（与 bot.py 运行方式一致）
         path = (Path.cwd() / path).resolve()
 
-    _store_singleton = JsonConfigStore(JsonConfigLocation(path=path))
+    store = JsonConfigStore(JsonConfigLocation(path=path))
+    memstats.register("nb_shared.json_config", lambda: [] if (data := store.cached()) is None else [data])
+    _store_singleton = store
     return _store_singleton
 
 
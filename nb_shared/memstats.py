@@ -0,0 +1,167 @@
+"""进程内缓存的内存占用登记（所有插件共用）。
+
+目标：
+- 容器被 OOM 杀掉之前就能看到各个缓存有多大：条目数、估算字节数、条目年龄分布
+- 为缓存上限（例如 anti_recall 的 MAX_CACHE_SIZE）提供依据
+
+用法：
+    from nb_shared import memstats
+    memstats.register(
+        "anti_recall.messages",
+        lambda: list(_message_cache.values()),
+        created_at=lambda m: m.cached_at,
+        limit=MAX_CACHE_SIZE,
+    )
+    for r in memstats.report():
+        ...
+
+说明：
+- 登记的是“取条目的函数”而不是缓存对象本身：只在查看时调用，平时没有任何开销
+- 字节数为估算值：递归累加 `sys.getsizeof`（同一对象只算一次，类型 / 模块 / 函数等共享对象不算），
+  条目超过 SAMPLE_SIZE 时随机抽样后按比例放大；不含缓存容器（dict / deque）本身
+"""
+
+from __future__ import annotations
+
+import random
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+from typing import Any, Callable, Collection
+
+# 估算字节数时最多逐个计算的条目数
+SAMPLE_SIZE = 256
+# 递归深度上限（防止意外的深层引用）
+MAX_DEPTH = 12
+
+_SKIP_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+
+
+@dataclass(slots=True)
+class _Entry:
+    entries: Callable[[], Collection[Any]]
+    created_at: Callable[[Any], float | None] | None
+    limit: int | None
+
+
+@dataclass(slots=True)
+class CacheReport:
+    name: str
+    entries: int
+    bytes: int
+    # 实际逐个计算的条目数（小于 entries 时 bytes 为按比例放大的估算）
+    sampled: int
+    limit: int | None
+    # 条目年龄（秒）：没有登记 created_at 时为 None
+    age_p50: float | None = None
+    age_p90: float | None = None
+    age_max: float | None = None
+    error: str | None = None
+
+
+_registry: dict[str, _Entry] = {}
+
+
+def register(
+    name: str,
+    entries: Callable[[], Collection[Any]],
+    *,
+    created_at: Callable[[Any], float | None] | None = None,
+    limit: int | None = None,
+) -> None:
+    """登记一个缓存；同名重复登记时覆盖（插件热重载）。created_at 返回条目的创建时间（time.time()）。"""
+
+    _registry[name] = _Entry(entries=entries, created_at=created_at, limit=limit)
+
+
+def unregister(name: str) -> None:
+    _registry.pop(name, None)
+
+
+def names() -> list[str]:
+    return sorted(_registry)
+
+
+def deep_sizeof(obj: Any, seen: set[int] | None = None, depth: int = 0) -> int:
+    """估算 obj 及其引用对象占用的字节数（同一对象只计一次）。"""
+
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, _SKIP_TYPES) or depth > MAX_DEPTH:
+        return 0
+    seen.add(id(obj))
+    try:
+        size = sys.getsizeof(obj)
+    except TypeError:
+        return 0
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+
+    nxt = depth + 1
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_sizeof(k, seen, nxt) + deep_sizeof(v, seen, nxt)
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        for v in obj:
+            size += deep_sizeof(v, seen, nxt)
+    d = getattr(obj, "__dict__", None)
+    if isinstance(d, dict):
+        size += deep_sizeof(d, seen, nxt)
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            if slot in ("__dict__", "__weakref__"):
+                continue
+            try:
+                size += deep_sizeof(getattr(obj, slot), seen, nxt)
+            except AttributeError:
+                continue
+    return size
+
+
+def _quantile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _report_one(name: str, entry: _Entry) -> CacheReport:
+    try:
+        items = list(entry.entries())
+    except Exception as e:
+        return CacheReport(name=name, entries=0, bytes=0, sampled=0, limit=entry.limit, error=repr(e))
+
+    sample = items if len(items) <= SAMPLE_SIZE else random.sample(items, SAMPLE_SIZE)
+    seen: set[int] = set()
+    sampled_bytes = sum(deep_sizeof(item, seen) for item in sample)
+    estimated = sampled_bytes * len(items) // len(sample) if sample else 0
+    out = CacheReport(name=name, entries=len(items), bytes=estimated, sampled=len(sample), limit=entry.limit)
+
+    if entry.created_at is not None and items:
+        now = time.time()
+        ages: list[float] = []
+        for item in items:
+            try:
+                ts = entry.created_at(item)
+            except Exception:
+                ts = None
+            if ts is not None:
+                ages.append(max(0.0, now - ts))
+        if ages:
+            ages.sort()
+            out.age_p50 = _quantile(ages, 0.5)
+            out.age_p90 = _quantile(ages, 0.9)
+            out.age_max = ages[-1]
+    return out
+
+
+def report(name: str | None = None) -> list[CacheReport]:
+    """各登记缓存的当前占用（name 给定时只看名字以它开头的缓存）。"""
+
+    return [
+        _report_one(n, e)
+        for n, e in sorted(_registry.items())
+        if name is None or n.startswith(name)
+    ]
+
+
+__all__ = ["CacheReport", "deep_sizeof", "names", "register", "report", "unregister"]
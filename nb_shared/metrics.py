@@ -0,0 +1,248 @@
+"""进程内指标（所有插件共用）。
+
+设计目标：
+- 零依赖：计数器 / 仪表 / 流式直方图，足够支撑“调参看数据”的需求
+- 记录开销小：直方图用固定的对数分桶，observe 只是一次二分查找 + 计数
+- 统一出口：`render_prometheus()` 输出 Prometheus 文本格式，`snapshot()` 给调试命令用
+
+用法：
+    from nb_shared import metrics
+    metrics.counter("agent_turns_total", result="ok").inc()
+    metrics.histogram("agent_llm_seconds", model="gemini-2.5-flash").observe(1.23)
+"""
+
+from __future__ import annotations
+
+import math
+from bisect import bisect_left
+from typing import Any, Iterator
+
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, Any]) -> LabelKey:
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _build_bounds() -> tuple[float, ...]:
+    # 0.1ms ~ 约 300s，每个桶相邻比例 2^(1/4)（相对误差 < 10%）
+    bounds: list[float] = []
+    value = 0.0001
+    while value < 300:
+        bounds.append(value)
+        value *= 2 ** 0.25
+    return tuple(bounds)
+
+
+class Counter:
+    """单调递增计数器。"""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Gauge:
+    """可增可减的瞬时值。"""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class Histogram:
+    """流式直方图（固定对数分桶，单位通常为秒）。
+
+    分位数由桶内线性插值估算，误差受桶宽限制（约 ±10%），用于观测趋势足够。
+    """
+
+    BOUNDS: tuple[float, ...] = _build_bounds()
+
+    __slots__ = ("_buckets", "count", "sum", "min", "max")
+
+    def __init__(self) -> None:
+        # 最后一个桶收纳超出上界的值
+        self._buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        value = max(0.0, float(value))
+        self._buckets[bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """估算分位数（q ∈ [0, 1]），无数据返回 0。"""
+
+        if self.count == 0:
+            return 0.0
+        rank = min(max(q, 0.0), 1.0) * self.count
+        seen = 0
+        for idx, n in enumerate(self._buckets):
+            if n == 0:
+                continue
+            if seen + n >= rank:
+                lower = self.BOUNDS[idx - 1] if idx > 0 else 0.0
+                upper = self.BOUNDS[idx] if idx < len(self.BOUNDS) else self.max
+                est = lower + (upper - lower) * ((rank - seen) / n)
+                return min(max(est, self.min), self.max)
+            seen += n
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def merge(self, other: Histogram) -> None:
+        for idx, n in enumerate(other._buckets):
+            self._buckets[idx] += n
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+_KINDS = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+
+class MetricsRegistry:
+    """指标注册表：按 (name, labels) 取得（或创建）指标实例。"""
+
+    def __init__(self) -> None:
+        self._kinds: dict[str, str] = {}
+        self._help: dict[str, str] = {}
+        self._series: dict[str, dict[LabelKey, Any]] = {}
+
+    def _get(self, kind: str, name: str, help: str, labels: dict[str, Any]) -> Any:
+        known = self._kinds.setdefault(name, kind)
+        if known != kind:
+            raise ValueError(f"metric {name!r} already registered as {known}")
+        if help:
+            self._help.setdefault(name, help)
+        series = self._series.setdefault(name, {})
+        key = _label_key(labels)
+        metric = series.get(key)
+        if metric is None:
+            metric = _KINDS[kind]()
+            series[key] = metric
+        return metric
+
+    def counter(self, name: str, help: str = "", **labels: Any) -> Counter:
+        return self._get("counter", name, help, labels)
+
+    def gauge(self, name: str, help: str = "", **labels: Any) -> Gauge:
+        return self._get("gauge", name, help, labels)
+
+    def histogram(self, name: str, help: str = "", **labels: Any) -> Histogram:
+        return self._get("histogram", name, help, labels)
+
+    def series(self, name: str) -> Iterator[tuple[dict[str, str], Any]]:
+        """遍历某个指标的全部 label 组合。"""
+
+        for key, metric in self._series.get(name, {}).items():
+            yield dict(key), metric
+
+    def snapshot(self, prefix: str = "") -> dict[str, list[dict[str, Any]]]:
+        """导出为普通 dict（调试命令/日志用）。"""
+
+        out: dict[str, list[dict[str, Any]]] = {}
+        for name in sorted(self._series):
+            if not name.startswith(prefix):
+                continue
+            rows: list[dict[str, Any]] = []
+            for labels, metric in self.series(name):
+                if isinstance(metric, Histogram):
+                    rows.append({"labels": labels, **metric.summary()})
+                else:
+                    rows.append({"labels": labels, "value": metric.value})
+            out[name] = rows
+        return out
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式（直方图以 summary 形式输出分位数）。"""
+
+        def fmt_labels(labels: dict[str, str], extra: dict[str, str] | None = None) -> str:
+            merged = {**labels, **(extra or {})}
+            if not merged:
+                return ""
+            body = ",".join(f'{k}="{_escape(v)}"' for k, v in merged.items())
+            return "{" + body + "}"
+
+        lines: list[str] = []
+        for name in sorted(self._series):
+            kind = self._kinds[name]
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {'summary' if kind == 'histogram' else kind}")
+            for labels, metric in self.series(name):
+                if isinstance(metric, Histogram):
+                    for q in (0.5, 0.9, 0.99):
+                        lines.append(f"{name}{fmt_labels(labels, {'quantile': str(q)})} {metric.quantile(q):.6g}")
+                    lines.append(f"{name}_sum{fmt_labels(labels)} {metric.sum:.6g}")
+                    lines.append(f"{name}_count{fmt_labels(labels)} {metric.count}")
+                else:
+                    lines.append(f"{name}{fmt_labels(labels)} {metric.value:.6g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def counter(name: str, help: str = "", **labels: Any) -> Counter:
+    return registry.counter(name, help, **labels)
+
+
+def gauge(name: str, help: str = "", **labels: Any) -> Gauge:
+    return registry.gauge(name, help, **labels)
+
+
+def histogram(name: str, help: str = "", **labels: Any) -> Histogram:
+    return registry.histogram(name, help, **labels)
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "registry",
+    "counter",
+    "gauge",
+    "histogram",
+]
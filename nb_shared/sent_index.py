@@ -0,0 +1,184 @@
+"""机器人自己发送的消息索引（按会话的环形缓冲，仅 OneBot V11）。
+
+目标：
+- 撤回自己的消息时不必再查询后端历史：发送 API 的返回值里已经有 message_id
+- 内存占用有上限：每个会话只保留最近 N 条，会话数超过上限时淘汰最久未发送的会话
+
+做法：
+- `install()` 注册一个 `on_called_api` 钩子（幂等），从 send_* / *_forward_msg 的返回值里记录
+  (message_id, 发送时间)，delete_msg 成功后从索引中移除
+- 超过保留时长（默认 120s，即 QQ 可撤回时限）的记录在读取 / 写入时顺带清理
+
+完整性：
+- 只有经过本进程发送的消息才会进索引（重启前发送的、其他客户端发送的都不在）
+- `covered_since` 记录钩子安装时间：安装超过可撤回时限后，索引里的就是全部仍可撤回的消息；
+  在此之前数量不够时，调用方应回退到查询后端历史
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict, deque
+from typing import Any
+
+from nonebot.adapters import Bot as BaseBot
+
+from . import memstats
+
+# (self_id, "group" | "private", 群号 / QQ 号)
+ChatKey = tuple[str, str, int]
+
+
+def group_key(self_id: str, group_id: int) -> ChatKey:
+    return (str(self_id), "group", int(group_id))
+
+
+def private_key(self_id: str, user_id: int) -> ChatKey:
+    return (str(self_id), "private", int(user_id))
+
+
+class SentIndex:
+    """按会话保存最近发送的 message_id。"""
+
+    def __init__(self, *, per_chat: int = 200, max_chats: int = 1024, ttl: float = 120.0) -> None:
+        self.per_chat = per_chat
+        self.max_chats = max_chats
+        self.ttl = ttl
+        self.covered_since = time.time()
+        self._chats: OrderedDict[ChatKey, deque[tuple[int, float]]] = OrderedDict()
+        self._where: dict[int, ChatKey] = {}
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def records(self) -> list[tuple[int, float]]:
+        """全部 (message_id, 发送时间)。"""
+
+        return [r for ring in self._chats.values() for r in ring]
+
+    def add(self, chat: ChatKey, message_id: int, ts: float | None = None) -> None:
+        ring = self._chats.pop(chat, None)
+        if ring is None:
+            ring = deque(maxlen=self.per_chat)
+        elif len(ring) == ring.maxlen:
+            # 环满：最旧的一条即将被挤出
+            self._where.pop(ring[0][0], None)
+        ring.append((int(message_id), time.time() if ts is None else ts))
+        self._chats[chat] = ring
+        self._where[int(message_id)] = chat
+        self._prune(ring)
+
+        while len(self._chats) > self.max_chats:
+            _, old = self._chats.popitem(last=False)
+            for mid, _ in old:
+                self._where.pop(mid, None)
+
+    def discard(self, message_id: int) -> None:
+        chat = self._where.pop(int(message_id), None)
+        if chat is None:
+            return
+        ring = self._chats.get(chat)
+        if ring is not None:
+            kept = [e for e in ring if e[0] != int(message_id)]
+            ring.clear()
+            ring.extend(kept)
+
+    def recent(self, chat: ChatKey, count: int, *, window: float | None = None) -> list[int]:
+        """从新到旧返回最多 count 条仍在 window（默认 ttl）内的 message_id。"""
+
+        ring = self._chats.get(chat)
+        if not ring or count <= 0:
+            return []
+        self._prune(ring)
+        cutoff = time.time() - (self.ttl if window is None else window)
+        out: list[int] = []
+        for mid, ts in reversed(ring):
+            if ts <= cutoff:
+                break
+            out.append(mid)
+            if len(out) >= count:
+                break
+        return out
+
+    def complete_for(self, window: float) -> bool:
+        """安装时长超过 window：该时间窗内本进程发出的消息都已进入索引。"""
+
+        return time.time() - self.covered_since >= window
+
+    def _prune(self, ring: deque[tuple[int, float]]) -> None:
+        cutoff = time.time() - self.ttl
+        while ring and ring[0][1] <= cutoff:
+            mid, _ = ring.popleft()
+            self._where.pop(mid, None)
+
+
+def chat_of(api: str, data: dict[str, Any], self_id: str) -> ChatKey | None:
+    """从发送 API 的参数推断会话。"""
+
+    group_id = data.get("group_id")
+    user_id = data.get("user_id")
+    message_type = data.get("message_type") or data.get("detail_type")
+    if message_type == "group" or (message_type is None and group_id is not None):
+        return group_key(self_id, group_id) if group_id is not None else None
+    if user_id is not None:
+        return private_key(self_id, user_id)
+    return None
+
+
+_index = SentIndex()
+memstats.register("nb_shared.sent_index", _index.records, created_at=lambda r: r[1])
+_installed = False
+
+
+def get_sent_index() -> SentIndex:
+    return _index
+
+
+async def _on_called_api(
+    bot: BaseBot,
+    exception: Exception | None,
+    api: str,
+    data: dict[str, Any],
+    result: Any,
+):
+    if exception is not None:
+        return
+    # 延迟导入：nb_shared 不强依赖具体适配器
+    from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+    if not isinstance(bot, V11Bot):
+        return
+
+    if api == "delete_msg":
+        if "message_id" in data:
+            _index.discard(data["message_id"])
+        return
+    if not (api.startswith("send_") or api.endswith("_forward_msg")):
+        return
+    if not isinstance(result, dict) or result.get("message_id") is None:
+        return
+    chat = chat_of(api, data, bot.self_id)
+    if chat is not None:
+        _index.add(chat, int(result["message_id"]))
+
+
+def install() -> None:
+    """注册 on_called_api 钩子（重复调用无副作用）。"""
+
+    global _installed
+    if _installed:
+        return
+    BaseBot.on_called_api(_on_called_api)
+    _index.covered_since = time.time()
+    _installed = True
+
+
+__all__ = [
+    "ChatKey",
+    "SentIndex",
+    "chat_of",
+    "get_sent_index",
+    "group_key",
+    "install",
+    "private_key",
+]
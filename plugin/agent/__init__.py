@@ -11,6 +11,7 @@ Agent 插件
 说明：
 - 这个插件会在需要更多信息时进入会话模式：后续用户消息会被该插件接管并继续追问/整理需求
 - 当需求明确时，会将“普通文本 requirement”交给 n8n，由 n8n 决定如何执行与如何回复
+- n8n 可以通过回调路由（见 callback.py）把结果/进度发回机器人，并可重新打开会话继续追问
 """
 
 from nonebot.plugin import PluginMetadata
@@ -24,3 +25,5 @@ __plugin_meta__ = PluginMetadata(
 
 from . import config
 from . import commands as _commands
+from . import callback as _callback
+from . import metrics_http as _metrics_http
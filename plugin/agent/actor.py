@@ -0,0 +1,161 @@
+"""会话内轮次串行化与连发合并（每个会话一个 actor）。
+
+目标：
+- 同一会话同一时刻只有一个轮次在执行，避免多次并发 LLM 请求在同一份历史上竞争、回复多条
+- debounce 窗口内连续到达的消息合并为一条 user 轮次，再交给 LLM
+- 抢占：LLM 生成途中收到新消息（例如用户补充/纠正），取消进行中的生成（连同 HTTP 请求），
+  把被取消的轮次与新消息合并后重新发起一轮
+
+说明：
+- 消息的结构化提取（例如语音转 base64）在 submit 时立即以 task 形式启动，合并时按到达顺序收集，
+  因此慢的语音提取不会让后到的文本“插队”
+- actor 在没有待处理消息时自动退出，不常驻
+- 只有通过 `run_cancellable()` 包裹的阶段可被抢占；已发出的回复 / n8n 调用不会被撤销
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from nonebot.log import logger
+
+from nb_shared import metrics
+
+from .exceptions import TurnSuperseded
+from .message_extract import ChatMessage, merge_turns
+
+
+# runner(session_key, merged_turn, context)
+TurnRunner = Callable[[str, ChatMessage, Any], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class _Mailbox:
+    pending: list[asyncio.Future[ChatMessage]] = field(default_factory=list)
+    last_arrival: float = 0.0
+    # 最近一条消息附带的上下文（例如 (bot, event)），用于回复
+    context: Any = None
+    worker: asyncio.Task[None] | None = None
+    # 进行中、可被抢占的 LLM 调用
+    inflight: asyncio.Task[Any] | None = None
+    inflight_started: float = 0.0
+
+
+class SessionActors:
+    """按 session_key 维护 actor。"""
+
+    def __init__(self, runner: TurnRunner, *, debounce: float = 1.2, preempt: bool = True) -> None:
+        self._runner = runner
+        self._debounce = max(0.0, debounce)
+        self._preempt = preempt
+        self._boxes: dict[str, _Mailbox] = {}
+
+    def submit(self, session_key: str, turn: Awaitable[ChatMessage], context: Any = None) -> None:
+        """投递一条消息（turn 为结构化提取的 awaitable，立即开始执行）。"""
+
+        loop = asyncio.get_running_loop()
+        box = self._boxes.get(session_key)
+        if box is None:
+            box = _Mailbox()
+            self._boxes[session_key] = box
+
+        box.pending.append(asyncio.ensure_future(turn))
+        box.last_arrival = loop.time()
+        box.context = context
+
+        if self._preempt and box.inflight is not None and not box.inflight.done():
+            box.inflight.cancel()
+            metrics.counter(
+                "agent_turn_preemptions_total", "被新消息抢占取消的 LLM 生成次数"
+            ).inc()
+            metrics.histogram(
+                "agent_turn_preempted_after_seconds", "被抢占时 LLM 生成已进行的时长"
+            ).observe(loop.time() - box.inflight_started)
+
+        if box.worker is None or box.worker.done():
+            box.worker = asyncio.create_task(self._run(session_key, box))
+
+    def discard(self, session_key: str) -> None:
+        """丢弃尚未处理的消息（会话结束时调用）；正在执行的轮次不受影响。"""
+
+        box = self._boxes.get(session_key)
+        if box is None:
+            return
+        for task in box.pending:
+            task.cancel()
+        box.pending.clear()
+
+    def busy(self, session_key: str) -> bool:
+        return session_key in self._boxes
+
+    async def run_cancellable(self, session_key: str, aw: Awaitable[Any]) -> Any:
+        """执行一个可被新消息抢占的阶段（通常是 LLM 调用）。
+
+        被抢占时抛出 TurnSuperseded；actor 会把本轮用户消息放回队首，与新消息合并后重跑。
+        """
+
+        task = asyncio.ensure_future(aw)
+        box = self._boxes.get(session_key)
+        if box is None:
+            return await task
+
+        box.inflight = task
+        box.inflight_started = asyncio.get_running_loop().time()
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if task.cancelled() and (current is None or current.cancelling() == 0):
+                raise TurnSuperseded() from None
+            raise
+        finally:
+            if box.inflight is task:
+                box.inflight = None
+
+    async def _wait_quiet(self, box: _Mailbox) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = box.last_arrival + self._debounce - loop.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _run(self, session_key: str, box: _Mailbox) -> None:
+        try:
+            while True:
+                await self._wait_quiet(box)
+                if not box.pending:
+                    return
+
+                tasks, box.pending = box.pending, []
+                turns: list[ChatMessage] = []
+                for task in tasks:
+                    try:
+                        turns.append(await task)
+                    except asyncio.CancelledError:
+                        continue
+                    except Exception:
+                        logger.exception("消息结构化提取失败（已跳过该条）")
+                if not turns:
+                    continue
+
+                merged = merge_turns(turns)
+                try:
+                    await self._runner(session_key, merged, box.context)
+                except TurnSuperseded:
+                    # 被抢占：放回队首，等 debounce 窗口结束后与新消息一起重跑
+                    requeued = asyncio.get_running_loop().create_future()
+                    requeued.set_result(merged)
+                    box.pending.insert(0, requeued)
+                    logger.info("会话轮次被新消息抢占，合并后重跑：{}", session_key)
+                except Exception:
+                    logger.exception("会话轮次执行失败：{}", session_key)
+        finally:
+            if self._boxes.get(session_key) is box:
+                self._boxes.pop(session_key, None)
+
+
+__all__ = ["SessionActors", "TurnRunner"]
@@ -0,0 +1,144 @@
+"""按 token 预算裁剪上下文（替代固定的“最近 15 条”）。
+
+目标：
+- 15 条语音可能远超合理的请求体积，15 条单字消息又浪费了可用上下文；改为按估算 token 数裁剪
+- 从最新一条往前填充，直到达到预算；被挤出预算的较早轮次折叠进“滚动摘要”
+
+说明：
+- 每条 ChatMessage 的 token 估算只算一次，缓存在消息对象上
+- 估算规则（偏保守，只用于预算控制，不追求精确）：
+  - 文本：非 ASCII 字符（中文等）约 1 token/字，ASCII 约 4 字符/token
+  - 图片：Gemini 按固定 258 token 计
+  - 语音：按 mp3 约 4KB/s、Gemini 32 token/s 折算
+- 滚动摘要是本地抽取式摘要（每轮一行、截断长文本、媒体用占位符），增量追加、超长时丢弃最早的行；
+  不额外调用 LLM
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+
+from nb_shared import metrics
+
+from ..message_extract import AudioContent, ChatMessage, ImageContent, TextContent
+
+
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_TOKENS = 258
+AUDIO_BYTES_PER_SECOND = 4000
+AUDIO_TOKENS_PER_SECOND = 32
+
+SUMMARY_HEADER = "【较早的对话摘要（原文已省略）】"
+
+
+def _text_tokens(text: str) -> int:
+    wide = sum(1 for ch in text if ord(ch) > 0x7F)
+    narrow = len(text) - wide
+    return wide + (narrow + 3) // 4
+
+
+def estimate_tokens(msg: ChatMessage) -> int:
+    """估算一条消息的 token 数（结果缓存在消息上）。"""
+
+    cached = msg._token_estimate
+    if cached is not None:
+        return cached
+
+    total = MESSAGE_OVERHEAD_TOKENS
+    for c in msg.content:
+        if isinstance(c, TextContent):
+            total += _text_tokens(c.text or "")
+        elif isinstance(c, ImageContent):
+            total += IMAGE_TOKENS
+        elif isinstance(c, AudioContent):
+            audio_bytes = len(c.audio or "") * 3 // 4
+            total += max(1, audio_bytes // AUDIO_BYTES_PER_SECOND) * AUDIO_TOKENS_PER_SECOND
+
+    msg._token_estimate = total
+    return total
+
+
+def _summary_line(msg: ChatMessage, *, max_chars: int) -> str:
+    who = "用户" if msg.role == "user" else "助手"
+    parts: list[str] = []
+    for c in msg.content:
+        if isinstance(c, TextContent):
+            text = " ".join((c.text or "").split())
+            if len(text) > max_chars:
+                text = text[:max_chars] + "…"
+            if text:
+                parts.append(text)
+        elif isinstance(c, ImageContent):
+            parts.append("[图片]")
+        elif isinstance(c, AudioContent):
+            parts.append("[语音]")
+    return f"{who}：{' '.join(parts) or '[空]'}"
+
+
+@dataclass(slots=True)
+class ContextWindow:
+    """单个会话的上下文窗口状态（滚动摘要 + 已折叠的轮次数）。"""
+
+    line_max_chars: int = 60
+    summary_max_chars: int = 800
+    # turns[:summarized_upto] 已折叠进摘要
+    summarized_upto: int = 0
+    _lines: deque[str] = field(default_factory=deque)
+    _summary_msg: ChatMessage | None = None
+
+    @property
+    def summary(self) -> str:
+        return "\n".join(self._lines)
+
+    def _fold(self, turns: list[ChatMessage]) -> None:
+        for msg in turns:
+            self._lines.append(_summary_line(msg, max_chars=self.line_max_chars))
+        # 超长时丢弃最早的行（越旧越不重要）
+        while len(self._lines) > 1 and sum(len(x) + 1 for x in self._lines) > self.summary_max_chars:
+            self._lines.popleft()
+        self._summary_msg = None
+
+    def _summary_message(self) -> ChatMessage | None:
+        if not self._lines:
+            return None
+        if self._summary_msg is None:
+            self._summary_msg = ChatMessage(
+                role="user",
+                content=[TextContent(text=f"{SUMMARY_HEADER}\n{self.summary}")],
+            )
+        return self._summary_msg
+
+    def select(self, turns: list[ChatMessage], *, budget: int) -> list[ChatMessage]:
+        """从最新往前按预算选取轮次；最新一条总会被保留。"""
+
+        if not turns:
+            return []
+
+        summary = self._summary_message()
+        used = estimate_tokens(summary) if summary is not None else 0
+        cut = len(turns) - 1
+        used += estimate_tokens(turns[cut])
+        while cut > self.summarized_upto:
+            cost = estimate_tokens(turns[cut - 1])
+            if used + cost > budget:
+                break
+            used += cost
+            cut -= 1
+
+        if cut > self.summarized_upto:
+            self._fold(turns[self.summarized_upto:cut])
+            self.summarized_upto = cut
+            summary = self._summary_message()
+
+        selected = turns[cut:]
+        if summary is not None:
+            selected = [summary, *selected]
+
+        metrics.histogram("agent_context_tokens", "每轮请求的估算上下文 token 数").observe(
+            sum(estimate_tokens(m) for m in selected)
+        )
+        return selected
+
+
+__all__ = ["ContextWindow", "estimate_tokens"]
@@ -1,175 +1,296 @@
 from nonebot_plugin_alconna.pattern import Audio
 
+import base64
+import math
+import time
+from typing import Any
+
 from plugin.agent.message_extract import ChatMessage, TextContent, ImageContent, AudioContent
 from ..config import config
-from .router import system_prompt, AiResponse
+from .router import system_prompt, prompt_version
+from .prompt_cache import GeminiCacheBackend, PromptCache, PromptCostModel
+from .providers import Provider, ProviderResult
+from . import telemetry
 
+from nonebot.log import logger
 
-async def request(messages: list[ChatMessage]) -> AiResponse:
-    """调用 Gemini（google-genai）并返回严格 JSON 字符串。
 
-    约定：
-    - `messages` 为对话历史，最后一条为用户最新输入
-    - 上下文最多取最近 15 条
-    - 支持多模态：图片 URL、音频 base64(mp3)
-    - 支持联网搜索：Google Search grounding（若模型/网关不支持则自动降级）
-    """
+# 运行时缓存：client 与上下文缓存按 (api_key, base_url) 复用，避免每轮重建
+_clients: dict[tuple[str, str], object] = {}
+_prompt_caches: dict[tuple[str, str], PromptCache] = {}
+
+cost_model = PromptCostModel()
+
+RESPONSE_SCHEMA: dict[str, Any] = {
+    "type": "OBJECT",
+    "required": ["trigger_n8n", "payload", "response"],
+    "properties": {
+        "trigger_n8n": {"type": "BOOLEAN"},
+        "payload": {"type": "STRING"},
+        "response": {"type": "STRING"},
+    },
+}
 
-    import asyncio
-    import base64
-    import json
-    import re
-    from typing import Any
 
+def _genai_types():
     try:
-        from google import genai
         from google.genai import types
     except Exception as e:
         raise RuntimeError(
             "缺少依赖：请安装 google-genai（Python 包名通常为 google-genai）。"
         ) from e
+    return types
 
-    base_url = (config.gemini_base_url or "").strip()
-    api_key = (config.gemini_api_key or "").strip()
-    model = (config.gemini_model or "").strip()
-
-    if not api_key:
-        raise RuntimeError("Gemini API Key 为空：请配置 AGENT__GEMINI_API_KEY。")
-    if not model:
-        raise RuntimeError("Gemini model 为空：请配置 AGENT__GEMINI_MODEL。")
-
-    def _strip_data_url_prefix(data: str) -> str:
-        if "," in data and data.strip().lower().startswith("data:"):
-            return data.split(",", 1)[1]
-        return data
-
-    def _guess_image_mime_type(file_name: str) -> str:
-        clean = file_name.lower()
-        if clean.endswith(".png"):
-            return "image/png"
-        if clean.endswith(".webp"):
-            return "image/webp"
-        if clean.endswith(".gif"):
-            return "image/gif"
-        if clean.endswith(".bmp"):
-            return "image/bmp"
-        if clean.endswith(".tiff") or clean.endswith(".tif"):
-            return "image/tiff"
-        # 兜底：多数场景可用
-        return "image/jpeg"
-
-    def _parts_from_message(msg: ChatMessage) -> list[Any]:
-        parts: list[Any] = []
-        for c in msg.content:
-            if isinstance(c, TextContent):
-                c: TextContent = c
-                text = c.text
-                if text:
-                    parts.append(types.Part.from_text(text=text))
-                continue
-
-            if isinstance(c, ImageContent):
-                c: ImageContent = c
-                url = c.image
-                if url:
-                    parts.append(
-                        types.Part.from_uri(
-                            file_uri=url,
-                            mime_type=_guess_image_mime_type(c.file_name),
-                        )
-                    )
-                continue
-
-            if isinstance(c, AudioContent):
-                c: AudioContent = c
-                try:
-                    audio_bytes = base64.b64decode(c.audio)
-                except Exception:
-                    # 不让整条请求失败：把原始内容作为文本兜底给模型
-                    parts.append(types.Part.from_text(text=f"[语音base64解析失败] {c.audio[:80]}"))
-                else:
-                    parts.append(types.Part.from_bytes(data=audio_bytes, mime_type="audio/mp3"))
-                continue
-
-        # 如果整条消息没有可用 parts，避免构造空 content
-        return parts
-
-    def _build_contents(history: list[ChatMessage]) -> list[Any]:
-        contents: list[Any] = []
-        for m in history:
-            role = (m.role or "").strip().lower()
-            genai_role = "user" if role == "user" else "model"
-            parts = _parts_from_message(m)
-            if not parts:
-                continue
-            contents.append(types.Content(role=genai_role, parts=parts))
-        return contents
-
-    def _parse(text: str) -> AiResponse:
-        raw = (text or "").strip()
-        if not raw:
-            return AiResponse()
-
-        # “```json ... ```”
-        fence = re.search(r"```(?:json)?\\s*(\\{.*?\\})\\s*```", raw, flags=re.S)
-        if fence:
-            raw = fence.group(1).strip()
 
-        try:
-            obj = json.loads(raw)
-        except Exception:
-            # 把模型输出塞到 question，确保上层始终拿到 JSON
-            return AiResponse(response=raw)
-
-        if not isinstance(obj, dict):
-            return AiResponse(response=raw)
-        # 规范化字段，避免缺 key
-
-        return AiResponse(
-            trigger_n8n=bool(obj.get("trigger_n8n", False)),
-            payload=str(obj.get("payload", "") or ""),
-            response=str(obj.get("response", "") or "")
-        )
+def _get_client(api_key: str, base_url: str):
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
 
-    # 上下文最多 15 条（含最后一条用户输入）
-    trimmed = messages[-15:]
-
-    response_schema: dict[str, Any] = {
-        "type": "OBJECT",
-        "required": ["trigger_n8n", "payload", "response"],
-        "properties": {
-            "trigger_n8n": {"type": "BOOLEAN"},
-            "payload": {"type": "STRING"},
-            "response": {"type": "STRING"},
-        },
-    }
+    _genai_types()
+    from google import genai
 
-    client_kwargs: dict[str, Any] = {"api_key": api_key}
+    client_kwargs: dict = {"api_key": api_key}
     if base_url:
         # 兼容自建网关/反代
         client_kwargs["http_options"] = {"base_url": base_url}
-
     client = genai.Client(**client_kwargs)
+    _clients[key] = client
+    return client
+
 
-    contents = _build_contents(trimmed)
-    req_config: dict[str, Any] = {
-        "system_instruction": system_prompt.strip(),
-        "response_mime_type": "application/json",
-        "response_schema": response_schema,
+def _get_prompt_cache(api_key: str, base_url: str) -> PromptCache:
+    key = (api_key, base_url)
+    cache = _prompt_caches.get(key)
+    if cache is None:
+        cache = PromptCache(
+            GeminiCacheBackend(_get_client(api_key, base_url)),
+            ttl_seconds=config.gemini_context_cache_ttl,
+            refresh_margin=config.gemini_context_cache_refresh_margin,
+        )
+        _prompt_caches[key] = cache
+    return cache
+
+
+def _usage(response, model: str) -> dict[str, int]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {}
+    out = {
+        "prompt": int(getattr(usage, "prompt_token_count", 0) or 0),
+        "cached": int(getattr(usage, "cached_content_token_count", 0) or 0),
+        "output": int(getattr(usage, "candidates_token_count", 0) or 0),
     }
+    logger.debug(
+        "Gemini usage: model={} prompt={} cached={} output={} saving=${:.6f}",
+        model,
+        out["prompt"],
+        out["cached"],
+        out["output"],
+        cost_model.saving_per_turn(out["cached"]),
+    )
+    return out
+
+
+def _confidence(response) -> float | None:
+    candidates = getattr(response, "candidates", None) or []
+    avg = getattr(candidates[0], "avg_logprobs", None) if candidates else None
+    if avg is None:
+        return None
+    return math.exp(min(0.0, float(avg)))
+
+
+def _is_cache_miss(e: Exception) -> bool:
+    """请求失败是否因为上下文缓存不存在 / 已过期（服务端提前回收）。
+
+    只有这种情况值得去掉 cached_content 重试；429 / 5xx / 超时等重试只会让失败路径多花一整次调用。
+    """
+
+    try:
+        from google.genai import errors
+    except ImportError:
+        return False
+    if not isinstance(e, errors.APIError) or e.code not in (400, 404):
+        return False
+    text = f"{e.status or ''} {e.message or ''}".lower()
+    return "cache" in text
+
+
+def _guess_image_mime_type(file_name: str) -> str:
+    clean = file_name.lower()
+    if clean.endswith(".png"):
+        return "image/png"
+    if clean.endswith(".webp"):
+        return "image/webp"
+    if clean.endswith(".gif"):
+        return "image/gif"
+    if clean.endswith(".bmp"):
+        return "image/bmp"
+    if clean.endswith(".tiff") or clean.endswith(".tif"):
+        return "image/tiff"
+    # 兜底：多数场景可用
+    return "image/jpeg"
+
 
-    async def _call_generate(cfg: dict[str, Any]):
-        return await asyncio.to_thread(
-            client.models.generate_content,
+def _parts_from_message(msg: ChatMessage) -> list[Any]:
+    types = _genai_types()
+    parts: list[Any] = []
+    for c in msg.content:
+        if isinstance(c, TextContent):
+            c: TextContent = c
+            text = c.text
+            if text:
+                parts.append(types.Part.from_text(text=text))
+            continue
+
+        if isinstance(c, ImageContent):
+            c: ImageContent = c
+            url = c.image
+            if url:
+                parts.append(
+                    types.Part.from_uri(
+                        file_uri=url,
+                        mime_type=_guess_image_mime_type(c.file_name),
+                    )
+                )
+            continue
+
+        if isinstance(c, AudioContent):
+            c: AudioContent = c
+            try:
+                audio_bytes = base64.b64decode(c.audio)
+            except Exception:
+                # 不让整条请求失败：把原始内容作为文本兜底给模型
+                parts.append(types.Part.from_text(text=f"[语音base64解析失败] {c.audio[:80]}"))
+            else:
+                parts.append(types.Part.from_bytes(data=audio_bytes, mime_type="audio/mp3"))
+            continue
+
+    # 如果整条消息没有可用 parts，避免构造空 content
+    return parts
+
+
+def _build_contents(history: list[ChatMessage]) -> list[Any]:
+    types = _genai_types()
+    contents: list[Any] = []
+    for m in history:
+        role = (m.role or "").strip().lower()
+        genai_role = "user" if role == "user" else "model"
+        parts = _parts_from_message(m)
+        if not parts:
+            continue
+        contents.append(types.Content(role=genai_role, parts=parts))
+    return contents
+
+
+class GeminiProvider(Provider):
+    """调用 Gemini（google-genai）并返回模型输出的原始 JSON 文本。
+
+    约定：
+    - `messages` 为对话历史，最后一条为用户最新输入
+    - 上下文裁剪由调用方按 token 预算完成（见 ai/context.py），这里不再截断
+    - 支持多模态：图片 URL、音频 base64(mp3)
+    - 可选上下文缓存：system_prompt 通过 cached content 按 name 复用（见 prompt_cache）
+    - 可选流式请求（AGENT__GEMINI_STREAM）：拼接全部分片后再解析，用于测量首 token 延迟
+    - 请求失败直接抛异常，由 providers.HedgedDispatcher 负责故障转移
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        base_url: str,
+        api_key: str,
+        model: str,
+        deadline: float = 30.0,
+        tier_models: dict[str, str] | None = None,
+    ):
+        super().__init__(name, deadline=deadline, tier_models=tier_models)
+        self.base_url = (base_url or "").strip()
+        self.api_key = (api_key or "").strip()
+        self.model = (model or "").strip()
+
+    @property
+    def default_model(self) -> str:
+        return self.model
+
+    async def generate(self, messages: list[ChatMessage], *, model: str | None = None) -> ProviderResult:
+        model = (model or self.model).strip()
+        if not self.api_key:
+            raise RuntimeError("Gemini API Key 为空：请配置 AGENT__GEMINI_API_KEY。")
+        if not model:
+            raise RuntimeError("Gemini model 为空：请配置 AGENT__GEMINI_MODEL。")
+
+        client = _get_client(self.api_key, self.base_url)
+
+        contents = _build_contents(messages)
+        instruction = system_prompt.strip()
+        req_config: dict[str, Any] = {
+            "response_mime_type": "application/json",
+            "response_schema": RESPONSE_SCHEMA,
+        }
+
+        # 上下文缓存：命中时按 name 引用 system_prompt，不再内联发送
+        cached_name: str | None = None
+        prompt_cache = _get_prompt_cache(self.api_key, self.base_url) if config.gemini_context_cache else None
+        if prompt_cache is not None:
+            cached_name = await prompt_cache.get(model=model, version=prompt_version, system_instruction=instruction)
+        if cached_name:
+            req_config["cached_content"] = cached_name
+        else:
+            req_config["system_instruction"] = instruction
+
+        async def _call_generate(cfg: dict[str, Any]) -> tuple[str, Any, float | None]:
+            """返回 (文本, 带 usage_metadata 的响应, 首 token 延迟)。"""
+
+            # 使用原生异步接口：外层任务被取消时，底层 HTTP 请求会一并取消
+            if not config.gemini_stream:
+                response = await client.aio.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=cfg,
+                )
+                return getattr(response, "text", "") or "", response, None
+
+            started = time.monotonic()
+            ttft: float | None = None
+            chunks: list[str] = []
+            last = None
+            async for chunk in await client.aio.models.generate_content_stream(
+                model=model,
+                contents=contents,
+                config=cfg,
+            ):
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                chunks.append(getattr(chunk, "text", "") or "")
+                # usage_metadata / avg_logprobs 在最后一个分片里
+                last = chunk
+            return "".join(chunks), last, ttft
+
+        try:
+            text, response, ttft = await _call_generate(req_config)
+        except Exception as e:
+            if not cached_name or prompt_cache is None or not _is_cache_miss(e):
+                raise
+            # 缓存已被服务端提前回收：丢弃句柄，本轮改为内联重试一次
+            prompt_cache.invalidate(model=model, version=prompt_version)
+            req_config.pop("cached_content", None)
+            req_config["system_instruction"] = instruction
+            call = telemetry.current()
+            if call is not None:
+                call.attempts += 1
+            text, response, ttft = await _call_generate(req_config)
+
+        return ProviderResult(
+            text=text,
+            provider=self.name,
             model=model,
-            contents=contents,
-            config=cfg,
+            usage=_usage(response, model),
+            confidence=_confidence(response),
+            ttft=ttft,
         )
 
-    try:
-        response = await _call_generate(req_config)
-    except Exception:
-        response = ""
 
-    parsed = _parse(getattr(response, "text", "") or "")
-    return parsed
+__all__ = ["GeminiProvider", "RESPONSE_SCHEMA"]
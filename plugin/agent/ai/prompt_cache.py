@@ -0,0 +1,228 @@
+"""Gemini 上下文缓存（Context Caching）。
+
+目标：
+- `system_prompt` 有数 KB，每轮都作为 system_instruction 发送会重复计费、拉长首 token 时间
+- 按 (model, prompt_version) 只创建一次 cached content，之后按 name 复用
+- 在 TTL 到期前主动续期；续期失败则重建；创建失败时返回 None，由调用方降级为内联 system_instruction
+
+说明：
+- 后端抽象为 `CacheBackend`：`GeminiCacheBackend` 调用真实 API，`StubCacheBackend` 用于离线测试
+- `PromptCostModel` 是本地成本模型，用于估算“缓存 vs 内联”的单轮成本与回本所需轮数
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from nonebot.log import logger
+
+
+@dataclass(frozen=True, slots=True)
+class CachedPrompt:
+    """一条已创建的缓存内容句柄。"""
+
+    name: str
+    model: str
+    version: str
+    # 过期时间（unix 时间戳，秒）
+    expire_at: float
+
+
+class CacheBackend(ABC):
+    """缓存内容的创建/续期后端。"""
+
+    @abstractmethod
+    async def create(self, *, model: str, system_instruction: str, ttl_seconds: int, display_name: str) -> tuple[str, float]:
+        """创建缓存，返回 (name, expire_at)。"""
+
+    @abstractmethod
+    async def refresh(self, *, name: str, ttl_seconds: int) -> float:
+        """续期缓存，返回新的 expire_at。"""
+
+
+class GeminiCacheBackend(CacheBackend):
+    """基于 google-genai `client.aio.caches` 的实现。"""
+
+    def __init__(self, client: Any):
+        self._client = client
+
+    @staticmethod
+    def _expire_at(cached: Any, ttl_seconds: int) -> float:
+        expire_time = getattr(cached, "expire_time", None)
+        if expire_time is not None:
+            try:
+                return float(expire_time.timestamp())
+            except Exception:
+                pass
+        return time.time() + ttl_seconds
+
+    async def create(self, *, model: str, system_instruction: str, ttl_seconds: int, display_name: str) -> tuple[str, float]:
+        cached = await self._client.aio.caches.create(
+            model=model,
+            config={
+                "system_instruction": system_instruction,
+                "ttl": f"{ttl_seconds}s",
+                "display_name": display_name,
+            },
+        )
+        return str(cached.name), self._expire_at(cached, ttl_seconds)
+
+    async def refresh(self, *, name: str, ttl_seconds: int) -> float:
+        cached = await self._client.aio.caches.update(name=name, config={"ttl": f"{ttl_seconds}s"})
+        return self._expire_at(cached, ttl_seconds)
+
+
+@dataclass(slots=True)
+class StubCacheBackend(CacheBackend):
+    """离线桩实现：不访问网络，记录调用次数，便于测试缓存复用/续期逻辑。"""
+
+    clock: Callable[[], float] = time.time
+    fail_create: bool = False
+    creates: int = 0
+    refreshes: int = 0
+    _alive: dict[str, float] = field(default_factory=dict)
+
+    async def create(self, *, model: str, system_instruction: str, ttl_seconds: int, display_name: str) -> tuple[str, float]:
+        if self.fail_create:
+            raise RuntimeError("stub: create failed")
+        self.creates += 1
+        name = f"cachedContents/stub-{self.creates}"
+        expire_at = self.clock() + ttl_seconds
+        self._alive[name] = expire_at
+        return name, expire_at
+
+    async def refresh(self, *, name: str, ttl_seconds: int) -> float:
+        if self._alive.get(name, 0) <= self.clock():
+            raise RuntimeError("stub: cache not found")
+        self.refreshes += 1
+        expire_at = self.clock() + ttl_seconds
+        self._alive[name] = expire_at
+        return expire_at
+
+
+class PromptCache:
+    """按 (model, prompt_version) 管理缓存句柄。
+
+    - `get()` 命中且未临近过期：直接返回 name
+    - 临近过期（剩余 < refresh_margin）：先续期，续期失败再重建
+    - 创建失败：在 retry_after 秒内不再尝试（避免每轮都白白多一次失败请求）
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        *,
+        ttl_seconds: int = 3600,
+        refresh_margin: int = 300,
+        retry_after: int = 60,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._backend = backend
+        self._ttl = max(60, int(ttl_seconds))
+        self._margin = max(0, min(int(refresh_margin), self._ttl // 2))
+        self._retry_after = retry_after
+        self._clock = clock
+        self._entries: dict[tuple[str, str], CachedPrompt] = {}
+        self._failed_until: dict[tuple[str, str], float] = {}
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+    @property
+    def backend(self) -> CacheBackend:
+        return self._backend
+
+    async def get(self, *, model: str, version: str, system_instruction: str) -> str | None:
+        key = (model, version)
+        entry = self._entries.get(key)
+        now = self._clock()
+        if entry is not None and entry.expire_at - now > self._margin:
+            return entry.name
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # 双重检查：等待锁期间其他协程可能已完成创建/续期
+            entry = self._entries.get(key)
+            now = self._clock()
+            if entry is not None and entry.expire_at - now > self._margin:
+                return entry.name
+
+            if entry is not None and entry.expire_at > now:
+                try:
+                    expire_at = await self._backend.refresh(name=entry.name, ttl_seconds=self._ttl)
+                except Exception:
+                    logger.warning("上下文缓存续期失败，尝试重建：{}", entry.name)
+                else:
+                    self._entries[key] = CachedPrompt(entry.name, model, version, expire_at)
+                    return entry.name
+
+            self._entries.pop(key, None)
+            if self._failed_until.get(key, 0) > now:
+                return None
+
+            try:
+                name, expire_at = await self._backend.create(
+                    model=model,
+                    system_instruction=system_instruction,
+                    ttl_seconds=self._ttl,
+                    display_name=f"agent-system-prompt-{version}",
+                )
+            except Exception:
+                logger.exception("创建上下文缓存失败，降级为内联 system_instruction")
+                self._failed_until[key] = now + self._retry_after
+                return None
+
+            self._failed_until.pop(key, None)
+            self._entries[key] = CachedPrompt(name, model, version, expire_at)
+            logger.info("已创建上下文缓存：{} (model={}, version={})", name, model, version)
+            return name
+
+    def invalidate(self, *, model: str, version: str) -> None:
+        """丢弃句柄（例如服务端已提前删除缓存，生成请求返回 404）。"""
+
+        self._entries.pop((model, version), None)
+
+
+@dataclass(frozen=True, slots=True)
+class PromptCostModel:
+    """本地成本模型（单位：美元 / 百万 token）。
+
+    默认值取 gemini-2.5-flash 的公开价格量级，仅用于相对比较，按实际账单调整。
+    """
+
+    input_per_mtok: float = 0.30
+    cached_input_per_mtok: float = 0.03
+    storage_per_mtok_hour: float = 1.00
+
+    def turn_cost(self, *, prompt_tokens: int, cached_tokens: int = 0) -> float:
+        """单轮输入成本（prompt_tokens 含 cached_tokens，与 usage_metadata 口径一致）。"""
+
+        uncached = max(0, prompt_tokens - cached_tokens)
+        return (uncached * self.input_per_mtok + cached_tokens * self.cached_input_per_mtok) / 1_000_000
+
+    def saving_per_turn(self, cached_tokens: int) -> float:
+        return cached_tokens * (self.input_per_mtok - self.cached_input_per_mtok) / 1_000_000
+
+    def storage_cost(self, *, cached_tokens: int, seconds: float) -> float:
+        return cached_tokens * self.storage_per_mtok_hour * (seconds / 3600) / 1_000_000
+
+    def break_even_turns_per_hour(self, cached_tokens: int) -> float:
+        """每小时至少多少轮请求，缓存才比内联便宜。"""
+
+        saving = self.saving_per_turn(cached_tokens)
+        if saving <= 0:
+            return float("inf")
+        return self.storage_cost(cached_tokens=cached_tokens, seconds=3600) / saving
+
+
+__all__ = [
+    "CachedPrompt",
+    "CacheBackend",
+    "GeminiCacheBackend",
+    "StubCacheBackend",
+    "PromptCache",
+    "PromptCostModel",
+]
@@ -0,0 +1,434 @@
+"""多 Provider 调度：截止时间、对冲请求、熔断与故障转移。
+
+目标：
+- 尾延迟由 SLO 决定，而不是由最慢的网关决定
+- 单个网关失败/超时不再变成“静默空回复”，而是自动切换到下一个 provider
+
+调度策略（`HedgedDispatcher.dispatch`）：
+1) 按注册顺序挑选熔断器允许的 provider，先发主请求（受该 provider 的 deadline 约束）
+2) 主请求超过其近期 p95 延迟仍未返回：对冲（hedge）发给下一个 provider
+3) 任一请求返回“合法的结构化 JSON”即采用，其余请求立即取消
+4) 请求失败/非结构化输出：立即故障转移到下一个 provider
+5) 超过整体 SLO：取消全部请求并抛出 AiTimeoutError
+
+说明：
+- `FakeProvider` 不访问网络，可配置延迟/失败率/输出，用于离线验证调度逻辑
+- 所有 provider 都返回原始文本，由 router.parse_response 统一做结构化解析
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+
+from nonebot.log import logger
+
+from nb_shared import metrics
+
+from ..exceptions import AgentError
+from ..message_extract import ChatMessage
+from . import telemetry
+from .router import AiResponse, parse_response
+
+
+class AiProviderError(AgentError):
+    """所有 provider 都未能给出可用结果。"""
+
+
+class AiTimeoutError(AiProviderError):
+    """超过整体 SLO 仍未得到结果。"""
+
+
+class AiInvalidOutputError(AiProviderError):
+    """有 provider 返回了结果，但都不是合法的结构化输出（require_structured=True 时）。"""
+
+
+@dataclass(slots=True)
+class ProviderResult:
+    """provider 的原始输出。"""
+
+    text: str
+    provider: str
+    model: str
+    latency: float = 0.0
+    # 例如 {"prompt": 1200, "cached": 1000, "output": 80}
+    usage: dict[str, int] = field(default_factory=dict)
+    # 模型置信度 exp(avg_logprobs)，网关不返回时为 None
+    confidence: float | None = None
+    # 首 token 延迟（仅流式请求可测，否则为 None）
+    ttft: float | None = None
+
+
+class Provider(ABC):
+    """模型 provider（一个网关 / endpoint）。"""
+
+    def __init__(self, name: str, *, deadline: float = 30.0, tier_models: dict[str, str] | None = None) -> None:
+        self.name = name
+        self.deadline = deadline
+        # 档位 -> 模型（见 tiering.py）；未配置的档位使用 default_model
+        self.tier_models = {k: v.strip() for k, v in (tier_models or {}).items() if v and v.strip()}
+
+    @property
+    @abstractmethod
+    def default_model(self) -> str:
+        ...
+
+    def model_for(self, tier: str | None) -> str:
+        """该 provider 在指定档位使用的模型（不同网关的模型名可能不同）。"""
+
+        return (self.tier_models.get(tier) if tier else None) or self.default_model
+
+    @abstractmethod
+    async def generate(self, messages: list[ChatMessage], *, model: str | None = None) -> ProviderResult:
+        """生成一轮回复；失败直接抛异常（不要吞掉）。"""
+
+
+class FakeProvider(Provider):
+    """离线假 provider：按配置的延迟/失败率返回固定输出。"""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        latency: float | tuple[float, float] = 0.05,
+        fail_rate: float = 0.0,
+        text: str = '{"trigger_n8n": false, "payload": "", "response": "ok"}',
+        confidence: float | None = None,
+        deadline: float = 30.0,
+        model: str = "fake-model",
+        tier_models: dict[str, str] | None = None,
+        seed: int | None = None,
+    ) -> None:
+        super().__init__(name, deadline=deadline, tier_models=tier_models)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.text = text
+        self.confidence = confidence
+        self.model = model
+        self.calls = 0
+        self.cancelled = 0
+        self._rng = random.Random(seed)
+
+    @property
+    def default_model(self) -> str:
+        return self.model
+
+    async def generate(self, messages: list[ChatMessage], *, model: str | None = None) -> ProviderResult:
+        self.calls += 1
+        delay = self.latency if isinstance(self.latency, (int, float)) else self._rng.uniform(*self.latency)
+        started = time.monotonic()
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self._rng.random() < self.fail_rate:
+            raise RuntimeError(f"{self.name}: injected failure")
+        return ProviderResult(
+            self.text, self.name, model or self.model, time.monotonic() - started, confidence=self.confidence
+        )
+
+
+class ProviderHealth:
+    """provider 健康度：滑动窗口延迟 + 熔断器（closed / open / half_open）。"""
+
+    def __init__(self, *, window: int = 50, failure_threshold: int = 3, cooldown: float = 30.0) -> None:
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._failure_threshold = max(1, failure_threshold)
+        self._cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        # 当前 half_open 探测的令牌（0 表示没有探测在进行）
+        self._probe = 0
+        self._tokens = itertools.count(1)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self._cooldown:
+            return "half_open"
+        return "open"
+
+    def acquire(self) -> int | None:
+        """申请发一个请求；返回令牌，None 表示不放行。
+
+        closed 状态返回 0；half_open 状态同一时刻只放行一个探测请求，返回该探测独有的令牌。
+        请求结束时凭令牌调用 record_failure / release：只有探测的持有者才能释放探测名额，
+        别的请求（例如被取消的对冲）不会误放出第二个探测。
+        """
+
+        state = self.state
+        if state == "closed":
+            return 0
+        if state == "half_open" and not self._probe:
+            self._probe = next(self._tokens)
+            return self._probe
+        return None
+
+    def _end_probe(self, token: int) -> None:
+        if token and token == self._probe:
+            self._probe = 0
+
+    def latency_quantile(self, q: float, default: float) -> float:
+        if len(self._latencies) < 5:
+            return default
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def record_success(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        # 成功即闭合熔断器，探测自然结束
+        self._probe = 0
+
+    def record_failure(self, token: int = 0) -> None:
+        self.consecutive_failures += 1
+        self._end_probe(token)
+        if self.opened_at is not None or self.consecutive_failures >= self._failure_threshold:
+            # half_open 探测失败：重新计时
+            self.opened_at = time.monotonic()
+
+    def release(self, token: int) -> None:
+        """请求被取消（既非成功也非失败）：令牌匹配时释放探测名额。"""
+
+        self._end_probe(token)
+
+
+@dataclass(slots=True)
+class _Entry:
+    provider: Provider
+    health: ProviderHealth
+
+
+class ProviderRegistry:
+    """按优先级顺序注册的 provider 集合。"""
+
+    def __init__(self) -> None:
+        self._entries: list[_Entry] = []
+
+    def register(self, provider: Provider, health: ProviderHealth | None = None) -> None:
+        self._entries.append(_Entry(provider, health or ProviderHealth()))
+
+    def get(self, name: str) -> Provider | None:
+        for e in self._entries:
+            if e.provider.name == name:
+                return e.provider
+        return None
+
+    def health(self, name: str) -> ProviderHealth | None:
+        for e in self._entries:
+            if e.provider.name == name:
+                return e.health
+        return None
+
+    def entries(self) -> list[_Entry]:
+        return list(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass(slots=True)
+class DispatchResult:
+    response: AiResponse
+    result: ProviderResult
+    # 结构化解析是否成功（False 表示把原始文本当作 response 兜底）
+    structured: bool
+    hedged: bool = False
+
+
+class HedgedDispatcher:
+    """按对冲/故障转移策略调用 registry 中的 provider。"""
+
+    def __init__(
+        self,
+        registry: ProviderRegistry,
+        *,
+        slo: float = 45.0,
+        hedge: bool = True,
+        hedge_min_delay: float = 2.0,
+        hedge_default_delay: float = 8.0,
+    ) -> None:
+        self.registry = registry
+        self.slo = slo
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+
+    def _hedge_delay(self, entry: _Entry) -> float:
+        p95 = entry.health.latency_quantile(0.95, self.hedge_default_delay)
+        return min(max(p95, self.hedge_min_delay), entry.provider.deadline)
+
+    async def _call(self, entry: _Entry, messages: list[ChatMessage], tier: str | None) -> ProviderResult:
+        started = time.monotonic()
+        result = await asyncio.wait_for(
+            entry.provider.generate(messages, model=entry.provider.model_for(tier)), timeout=entry.provider.deadline
+        )
+        result.latency = time.monotonic() - started
+        return result
+
+    async def dispatch(
+        self,
+        messages: list[ChatMessage],
+        *,
+        tier: str | None = None,
+        require_structured: bool = False,
+        slo: float | None = None,
+    ) -> DispatchResult:
+        """调度一轮请求。
+
+        tier 为模型档位：每个 provider 按自己的配置选模型（Provider.model_for），没有该档位时用默认模型。
+        require_structured=True 时，非结构化输出视为失败（用于 tiering 的自动升级判断）。
+        slo 覆盖本次调度的整体上限（秒）：升级重跑时传入剩余时间，两次调度合计不超过 SLO。
+        """
+
+        entries = self.registry.entries()
+        if not entries:
+            raise AiProviderError("未配置任何模型 provider")
+
+        # 熔断判断推迟到真正发出请求时（launch）：half_open 的 allow() 会占用探测名额，
+        # 提前判断而未发出的候选会一直占着名额，导致该 provider 再也无法恢复
+        candidates = list(entries)
+
+        loop = asyncio.get_running_loop()
+        budget = self.slo if slo is None else slo
+        deadline = loop.time() + budget
+        running: dict[asyncio.Task[ProviderResult], _Entry] = {}
+        # 每个任务的熔断器令牌（见 ProviderHealth.acquire）
+        tokens: dict[asyncio.Task[ProviderResult], int] = {}
+        fallback: DispatchResult | None = None
+        errors: list[str] = []
+        hedged = False
+        timed_out = False
+        invalid = False
+        call = telemetry.current()
+
+        def launch(force: bool = False) -> _Entry | None:
+            entry: _Entry | None = None
+            token: int | None = None
+            while candidates:
+                e = candidates.pop(0)
+                token = e.health.acquire()
+                if token is not None:
+                    entry = e
+                    break
+            if entry is None:
+                if not force:
+                    return None
+                # 全部熔断：与其直接失败，不如冒险试一下优先级最高的（不占探测名额）
+                entry, token = entries[0], 0
+            if call is not None:
+                call.attempts += 1
+            task = asyncio.create_task(self._call(entry, messages, tier))
+            running[task] = entry
+            tokens[task] = token or 0
+            return entry
+
+        primary = launch(force=True)
+        next_hedge_at = loop.time() + self._hedge_delay(primary) if primary else deadline
+
+        try:
+            while running:
+                now = loop.time()
+                if now >= deadline:
+                    timed_out = True
+                    break
+                wait_until = deadline
+                if self.hedge and candidates:
+                    wait_until = min(wait_until, next_hedge_at)
+
+                done, _ = await asyncio.wait(
+                    running, timeout=max(0.0, wait_until - now), return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    if self.hedge and candidates and loop.time() >= next_hedge_at:
+                        entry = launch()
+                        if entry is not None:
+                            hedged = True
+                            metrics.counter("agent_ai_hedges_total", "对冲请求次数", provider=entry.provider.name).inc()
+                            logger.info("模型请求超过 p95，对冲到 {}", entry.provider.name)
+                            next_hedge_at = loop.time() + self._hedge_delay(entry)
+                    continue
+
+                for task in done:
+                    entry = running.pop(task)
+                    token = tokens.pop(task)
+                    name = entry.provider.name
+                    try:
+                        result = task.result()
+                    except asyncio.TimeoutError:
+                        entry.health.record_failure(token)
+                        errors.append(f"{name}: timeout")
+                        metrics.counter("agent_ai_provider_requests_total", "provider 请求结果", provider=name, result="timeout").inc()
+                        continue
+                    except Exception as e:
+                        entry.health.record_failure(token)
+                        errors.append(f"{name}: {e!r}")
+                        metrics.counter("agent_ai_provider_requests_total", "provider 请求结果", provider=name, result="error").inc()
+                        logger.warning("模型 provider {} 失败：{!r}", name, e)
+                        continue
+
+                    if call is not None:
+                        call.add_usage(result)
+                    response, structured = parse_response(result.text)
+                    if structured:
+                        entry.health.record_success(result.latency)
+                        metrics.counter("agent_ai_provider_requests_total", "provider 请求结果", provider=name, result="ok").inc()
+                        if call is not None:
+                            call.adopt(result)
+                        return DispatchResult(response, result, True, hedged)
+
+                    # 非结构化输出：网关是通的（记成功延迟），但本次结果不可用
+                    entry.health.record_success(result.latency)
+                    metrics.counter("agent_ai_provider_requests_total", "provider 请求结果", provider=name, result="invalid").inc()
+                    errors.append(f"{name}: invalid output")
+                    invalid = True
+                    if call is not None:
+                        call.parse_failures += 1
+                    if fallback is None and response.response:
+                        fallback = DispatchResult(response, result, False, hedged)
+
+                # 有请求失败：立即故障转移（不等对冲计时）
+                if not running and candidates:
+                    entry = launch()
+                    if entry is not None:
+                        next_hedge_at = loop.time() + self._hedge_delay(entry)
+        finally:
+            for task, entry in running.items():
+                task.cancel()
+                entry.health.release(tokens.get(task, 0))
+                metrics.counter(
+                    "agent_ai_provider_requests_total", "provider 请求结果", provider=entry.provider.name, result="cancelled"
+                ).inc()
+
+        if fallback is not None and not require_structured:
+            if call is not None:
+                call.adopt(fallback.result)
+            return fallback
+        if timed_out:
+            raise AiTimeoutError(f"模型请求超过 SLO（{budget:.3g}s）：" + "; ".join(errors))
+        if invalid:
+            raise AiInvalidOutputError("模型输出均不是合法的结构化结果：" + "; ".join(errors))
+        raise AiProviderError("所有模型 provider 均失败：" + "; ".join(errors))
+
+
+__all__ = [
+    "AiInvalidOutputError",
+    "AiProviderError",
+    "AiTimeoutError",
+    "ProviderResult",
+    "Provider",
+    "FakeProvider",
+    "ProviderHealth",
+    "ProviderRegistry",
+    "DispatchResult",
+    "HedgedDispatcher",
+]
@@ -0,0 +1,107 @@
+"""闲聊/问答回复缓存（可选开启）。
+
+目标：
+- 同样的通用问题反复出现时，直接返回上次的回复，省掉整轮 LLM 延迟与成本
+
+约定：
+- 只缓存“单轮、纯文本、trigger_n8n=false 且 response 非空”的结果
+- 会话已有上下文（不止一条消息）或包含图片/语音时，既不读也不写
+- key = 规范化文本 + 模型分档配置（fast / strong 模型与分档阈值，见 tiering.TierPolicy.signature）+ prompt_version；
+  修改提示词 / 切换模型 / 调整分档后自动失效
+- TTL + 容量上限（LRU 淘汰），由 cachetools.TTLCache 实现
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass
+
+from cachetools import TTLCache
+
+from nb_shared import metrics
+
+from ..message_extract import ChatMessage, TextContent
+from .router import AiResponse
+
+
+_WS = re.compile(r"\s+")
+# 中文等非 ASCII 字符两侧的空白没有语义（“西红柿炒蛋 怎么做” == “西红柿炒蛋怎么做”）
+_WS_NEAR_WIDE = re.compile(r"(?<=[^\x00-\x7f])\s+|\s+(?=[^\x00-\x7f])")
+_TRAILING = "。.！!？?~～…,，、；;"
+
+
+def normalize_query(text: str) -> str:
+    """规范化用户文本：全半角统一、大小写折叠、空白折叠、去掉末尾标点。"""
+
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _WS_NEAR_WIDE.sub("", text)
+    text = _WS.sub(" ", text).strip()
+    return text.rstrip(_TRAILING).strip()
+
+
+@dataclass(slots=True)
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ResponseCache:
+    """按规范化问题缓存 AiResponse。"""
+
+    def __init__(self, *, maxsize: int = 256, ttl: float = 3600) -> None:
+        self._cache: TTLCache[str, AiResponse] = TTLCache(maxsize=max(1, maxsize), ttl=ttl)
+        self.stats = ResponseCacheStats()
+
+    @staticmethod
+    def key_for(messages: list[ChatMessage], *, model: str, version: str) -> str | None:
+        """计算缓存 key；不满足缓存条件时返回 None。"""
+
+        if len(messages) != 1:
+            return None
+        msg = messages[0]
+        if msg.role != "user" or not msg.content:
+            return None
+        if not all(isinstance(c, TextContent) for c in msg.content):
+            return None
+
+        query = normalize_query("\n".join(c.text for c in msg.content))
+        if not query:
+            return None
+        raw = f"{model}\0{version}\0{query}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> AiResponse | None:
+        hit = self._cache.get(key)
+        if hit is None:
+            self.stats.misses += 1
+            metrics.counter("agent_response_cache_total", "回复缓存查询次数", result="miss").inc()
+            return None
+        self.stats.hits += 1
+        metrics.counter("agent_response_cache_total", "回复缓存查询次数", result="hit").inc()
+        return hit.model_copy()
+
+    def put(self, key: str, response: AiResponse) -> None:
+        if response.trigger_n8n or not response.response:
+            return
+        self._cache[key] = response.model_copy()
+        self.stats.stores += 1
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def values(self) -> list[AiResponse]:
+        return list(self._cache.values())
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+__all__ = ["ResponseCache", "ResponseCacheStats", "normalize_query"]
@@ -1,5 +1,13 @@
+import hashlib
+import json
+import re
+import time
+from collections.abc import Callable
+from contextlib import AbstractAsyncContextManager, nullcontext
+
 from pydantic import BaseModel
 
+from nb_shared import memstats
 from plugin.agent.message_extract import ChatMessage
 from ..config import config
 
@@ -8,14 +16,210 @@ class AiResponse(BaseModel):
     payload: str = ""
     response: str = ""
 
-async def request(messages: list[ChatMessage]) -> AiResponse:
-    provider = config.provider
-    match provider:
-        case 'gemini':
-            from .gemini import request as gemini_request
-            return await gemini_request(messages)
 
-    raise RuntimeError("Unsupported provider")
+_FENCE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", flags=re.S)
+
+
+def parse_response(text: str) -> tuple[AiResponse, bool]:
+    """把模型输出解析为 AiResponse，返回 (response, 是否为合法的结构化 JSON)。
+
+    解析失败时把模型输出塞到 response，确保上层始终拿到 AiResponse。
+    """
+
+    raw = (text or "").strip()
+    if not raw:
+        return AiResponse(), False
+
+    # “```json ... ```”
+    fence = _FENCE.search(raw)
+    if fence:
+        raw = fence.group(1).strip()
+
+    try:
+        obj = json.loads(raw)
+    except Exception:
+        return AiResponse(response=raw), False
+
+    if not isinstance(obj, dict) or "trigger_n8n" not in obj:
+        return AiResponse(response=raw), False
+
+    # 规范化字段，避免缺 key
+    return AiResponse(
+        trigger_n8n=bool(obj.get("trigger_n8n", False)),
+        payload=str(obj.get("payload", "") or ""),
+        response=str(obj.get("response", "") or ""),
+    ), True
+
+_response_cache = None
+
+
+def get_response_cache():
+    """回复缓存（AGENT__RESPONSE_CACHE_ENABLED 关闭时返回 None）。"""
+
+    global _response_cache
+    if not config.response_cache_enabled:
+        return None
+    if _response_cache is None:
+        from .response_cache import ResponseCache
+
+        _response_cache = ResponseCache(
+            maxsize=config.response_cache_size,
+            ttl=config.response_cache_ttl,
+        )
+        memstats.register("agent.response_cache", _response_cache.values, limit=config.response_cache_size)
+    return _response_cache
+
+
+async def request(
+    messages: list[ChatMessage], *, slot: Callable[[], AbstractAsyncContextManager[object]] | None = None
+) -> AiResponse:
+    """一轮模型请求。
+
+    slot：真正调用模型前需要进入的上下文（LLM 调度名额）；回复缓存命中时不进入，
+    避免缓存命中也要排队、占用并发名额、触发“已排队”提示。
+    """
+
+    cache = get_response_cache()
+    cache_key = None
+    if cache is not None:
+        # 分档后回复可能来自 fast 或 strong 模型：按整套分档配置区分，避免两档结果互相串用
+        cache_key = cache.key_for(messages, model=get_tier_policy().signature(), version=prompt_version)
+        if cache_key is not None:
+            hit = cache.get(cache_key)
+            if hit is not None:
+                from .telemetry import current
+
+                call = current()
+                if call is not None:
+                    call.response_cache_hit = True
+                return hit
+
+    async with slot() if slot is not None else nullcontext():
+        response = await _dispatch(messages)
+
+    if cache_key is not None:
+        cache.put(cache_key, response)
+    return response
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    """按配置构建 provider 注册表与对冲调度器（首次调用时构建）。
+
+    顺序：主 provider（AGENT__GEMINI_*）在前，AGENT__PROVIDERS 中的备用 provider 依次在后。
+    每个 provider 各自配置 fast 档模型（主 provider 为 AGENT__GEMINI_FAST_MODEL），未配置时 fast 档也用其默认模型。
+    """
+
+    global _dispatcher
+    if _dispatcher is not None:
+        return _dispatcher
+
+    from .providers import HedgedDispatcher, ProviderHealth, ProviderRegistry
+    from .tiering import FAST
+
+    registry = ProviderRegistry()
+    specs = [
+        {
+            "name": config.provider,
+            "kind": config.provider,
+            "base_url": config.gemini_base_url,
+            "api_key": config.gemini_api_key,
+            "model": config.gemini_model,
+            "fast_model": config.gemini_fast_model,
+            "deadline": config.ai_deadline,
+        },
+        *(spec.model_dump() for spec in config.providers),
+    ]
+    for spec in specs:
+        match spec["kind"]:
+            case 'gemini':
+                from .gemini import GeminiProvider
+
+                provider = GeminiProvider(
+                    spec["name"],
+                    base_url=spec["base_url"],
+                    api_key=spec["api_key"] or config.gemini_api_key,
+                    model=spec["model"] or config.gemini_model,
+                    deadline=spec["deadline"] or config.ai_deadline,
+                    tier_models={FAST: spec["fast_model"]},
+                )
+            case _:
+                raise RuntimeError(f"Unsupported provider: {spec['kind']}")
+        registry.register(
+            provider,
+            ProviderHealth(
+                failure_threshold=config.ai_breaker_failures,
+                cooldown=config.ai_breaker_cooldown,
+            ),
+        )
+
+    _dispatcher = HedgedDispatcher(
+        registry,
+        slo=config.ai_slo,
+        hedge=config.ai_hedge and len(registry) > 1,
+        hedge_min_delay=config.ai_hedge_min_delay,
+        hedge_default_delay=config.ai_hedge_default_delay,
+    )
+    return _dispatcher
+
+
+def get_tier_policy():
+    from .tiering import TierPolicy
+
+    return TierPolicy(
+        fast_model=config.gemini_fast_model.strip(),
+        strong_model=config.gemini_model.strip(),
+        max_history=config.tier_fast_max_history,
+        max_chars=config.tier_fast_max_chars,
+        min_confidence=config.tier_min_confidence,
+    )
+
+
+async def _dispatch(messages: list[ChatMessage]) -> AiResponse:
+    """按档位调度；fast 升级到 strong 时两次调度共享同一个 SLO（整轮耗时不超过 AGENT__AI_SLO）。"""
+
+    from nb_shared import metrics
+    from nonebot.log import logger
+
+    from .providers import AiInvalidOutputError, AiProviderError, AiTimeoutError
+    from .tiering import FAST, STRONG, extract_features
+
+    dispatcher = get_dispatcher()
+    policy = get_tier_policy()
+    tier, reason = policy.choose(extract_features(messages))
+    started = time.monotonic()
+    slo: float | None = None
+
+    if tier == FAST:
+        try:
+            result = await dispatcher.dispatch(messages, tier=FAST, require_structured=True)
+        except AiTimeoutError:
+            # 已经超过整体 SLO：再升级只会更慢
+            raise
+        except AiInvalidOutputError:
+            escalate = "schema"
+        except AiProviderError:
+            # 网络失败 / provider 全部不可用，与输出不合法区分开
+            escalate = "error"
+        else:
+            escalate = policy.should_escalate(structured=result.structured, confidence=result.result.confidence)
+            if escalate is None:
+                metrics.counter("agent_ai_tier_total", "模型档位选择", tier=FAST, reason=reason).inc()
+                return result.response
+
+        slo = dispatcher.slo - (time.monotonic() - started)
+        if slo <= 0:
+            metrics.counter("agent_ai_tier_total", "模型档位选择", tier=FAST, reason=f"timeout_{escalate}").inc()
+            raise AiTimeoutError(f"fast 模型结果不可用（{escalate}），且已超过 SLO（{dispatcher.slo:g}s），不再升级")
+
+        logger.info("fast 模型结果不可用（{}），升级到 strong 模型（剩余 {:.1f}s）", escalate, slo)
+        tier, reason = STRONG, f"escalated_{escalate}"
+
+    metrics.counter("agent_ai_tier_total", "模型档位选择", tier=tier, reason=reason).inc()
+    result = await dispatcher.dispatch(messages, tier=STRONG, slo=slo)
+    return result.response
 
 
 system_prompt = """
@@ -117,3 +321,5 @@ Output:
 }
 """
 
+# system_prompt 的版本号：用于上下文缓存等按提示词区分的场景，修改提示词后自动失效
+prompt_version = hashlib.sha256(system_prompt.strip().encode("utf-8")).hexdigest()[:12]
@@ -0,0 +1,161 @@
+"""全局 LLM 调度：并发上限 + 按用户公平排队 + 优先级。
+
+目标：
+- 多个会话同时请求时，不再全部同时打到网关（触发限流后所有会话一起变慢）
+- 超过并发上限的请求排队；排队已满时直接拒绝，不无限堆积
+- 排队时立即告诉用户“当前较忙，第 N 位”，而不是静默等待
+
+调度规则：
+- 优先级（数字越小越先）：纯文本 < 带图片/语音；同类中会话首轮 < 后续轮次
+  即：文本首轮 0、文本追问 1、媒体首轮 2、媒体追问 3
+- 同一优先级内按用户做公平排队（start-time fair queuing）：每个用户的请求依次占用虚拟时间，
+  一个用户连发多条不会把其他用户挤到后面
+- 等待中的请求被取消（例如被新消息抢占）或因其他异常退出时自动出队；已拿到名额后才退出会归还名额
+
+指标：
+- `agent_llm_queue_seconds{priority}`：排队耗时（未排队记 0）
+- `agent_llm_queue_depth` / `agent_llm_inflight`：当前排队数 / 占用名额数
+- `agent_llm_rejected_total`：排队已满被拒绝的次数
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import itertools
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from nonebot.log import logger
+
+from nb_shared import metrics
+
+from ..exceptions import AgentError
+from ..message_extract import AudioContent, ChatMessage, ImageContent
+
+
+class SchedulerBusy(AgentError):
+    """排队已满，请求被拒绝。"""
+
+
+def turn_priority(turn: ChatMessage, *, first_turn: bool) -> int:
+    media = any(isinstance(c, (ImageContent, AudioContent)) for c in turn.content)
+    return (2 if media else 0) + (0 if first_turn else 1)
+
+
+@dataclass(order=True, slots=True)
+class _Ticket:
+    # (priority, 虚拟开始时间, 到达序号)
+    sort_key: tuple[int, float, int]
+    user: str = field(compare=False)
+    future: asyncio.Future[None] = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+# on_queued(position)：请求进入排队时回调一次（position 从 1 开始）
+QueuedCallback = Callable[[int], Awaitable[object]]
+
+
+class LlmScheduler:
+    def __init__(self, *, concurrency: int = 4, max_queue: int = 32) -> None:
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self._active = 0
+        self._waiting: list[_Ticket] = []
+        self._vtime = 0.0
+        self._user_vtime: dict[str, float] = {}
+        self._seq = itertools.count()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def _update_gauges(self) -> None:
+        metrics.gauge("agent_llm_queue_depth", "LLM 调度排队数").set(len(self._waiting))
+        metrics.gauge("agent_llm_inflight", "LLM 调度占用名额数").set(self._active)
+
+    def position(self, ticket: _Ticket) -> int:
+        return bisect.bisect_left(self._waiting, ticket) + 1
+
+    async def acquire(self, user: str, *, priority: int = 0, on_queued: QueuedCallback | None = None) -> None:
+        loop = asyncio.get_running_loop()
+        hist = metrics.histogram("agent_llm_queue_seconds", "LLM 请求排队耗时", priority=priority)
+
+        if self._active < self.concurrency and not self._waiting:
+            self._active += 1
+            self._update_gauges()
+            hist.observe(0.0)
+            return
+
+        if len(self._waiting) >= self.max_queue:
+            metrics.counter("agent_llm_rejected_total", "LLM 调度排队已满被拒绝次数").inc()
+            raise SchedulerBusy(f"排队已满（{self.max_queue}）")
+
+        start = max(self._vtime, self._user_vtime.get(user, 0.0))
+        self._user_vtime[user] = start + 1
+        ticket = _Ticket((priority, start, next(self._seq)), user, loop.create_future(), loop.time())
+        bisect.insort(self._waiting, ticket)
+        self._update_gauges()
+
+        try:
+            if on_queued is not None:
+                try:
+                    await on_queued(self.position(ticket))
+                except Exception as e:
+                    # 排队提示发送失败不影响本轮继续排队
+                    logger.warning("LLM 排队提示发送失败：{!r}", e)
+            await ticket.future
+        except BaseException:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                self._update_gauges()
+            elif ticket.future.done() and not ticket.future.cancelled():
+                # 已经拿到名额才被取消：交给下一个
+                self.release()
+            raise
+        hist.observe(loop.time() - ticket.enqueued_at)
+
+    def release(self) -> None:
+        while self._waiting:
+            ticket = self._waiting.pop(0)
+            if ticket.future.done():
+                continue
+            # 名额直接交接给下一个，不经过 _active 减一再加一
+            self._vtime = max(self._vtime, ticket.sort_key[1])
+            ticket.future.set_result(None)
+            break
+        else:
+            self._active -= 1
+        if len(self._user_vtime) > 1024:
+            self._user_vtime = {u: v for u, v in self._user_vtime.items() if v > self._vtime}
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(
+        self, user: str, *, priority: int = 0, on_queued: QueuedCallback | None = None
+    ) -> AsyncIterator[None]:
+        await self.acquire(user, priority=priority, on_queued=on_queued)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+_scheduler: LlmScheduler | None = None
+
+
+def get_scheduler() -> LlmScheduler:
+    global _scheduler
+    if _scheduler is None:
+        from ..config import config
+
+        _scheduler = LlmScheduler(concurrency=config.llm_concurrency, max_queue=config.llm_max_queue)
+    return _scheduler
+
+
+__all__ = ["LlmScheduler", "SchedulerBusy", "get_scheduler", "turn_priority"]
@@ -0,0 +1,283 @@
+"""LLM 调用埋点：排队、首 token、总耗时、token 用量、缓存命中、重试与解析失败。
+
+目标：
+- 调上下文预算 / 选模型时有数据可看，而不是只有一行“LLM 执行失败”
+- 每次调用（一轮 llm 节点）记录一条 `LlmCall`，按会话 / 模型 / provider 三个维度聚合
+
+记录方式：
+- graph 的 llm 节点用 `track(...)` 包住整次调用；调用链上的各层通过 `current()` 往同一条记录里补字段：
+  - 调度器排队耗时（graph）、回复缓存命中（router）
+  - 每次 provider 尝试（providers.HedgedDispatcher：对冲 / 故障转移 / 升级都会计入 attempts）
+  - 结构化解析失败（parse_response 回退为原始文本）
+  - token 用量与首 token 延迟（ProviderResult.usage / ttft；首 token 延迟需开启 AGENT__GEMINI_STREAM）
+- 记录通过 contextvars 传递：dispatcher 内部 create_task 会复制上下文，拿到的是同一条记录
+
+指标（Prometheus 出口见 metrics_http.py）：
+- `agent_llm_calls_total{provider,model,result}`
+- `agent_llm_latency_seconds{provider,model}` / `agent_llm_ttft_seconds{provider,model}`（不含排队）
+- `agent_llm_tokens_total{provider,model,kind}`（kind=prompt/cached/output）
+- `agent_llm_cache_hits_total{cache}`（cache=response/prompt）
+- `agent_llm_retries_total{provider}` / `agent_llm_parse_failures_total{provider,model}`
+
+说明：
+- 按会话的聚合只保存在内存（最近 AGENT__LLM_STATS_SESSIONS 个会话），不进 Prometheus，避免标签基数失控
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from nb_shared import metrics
+from nb_shared.metrics import Histogram
+
+from ..exceptions import TurnSuperseded
+from .scheduler import SchedulerBusy
+
+if TYPE_CHECKING:
+    from .providers import ProviderResult
+
+
+@dataclass(slots=True)
+class LlmCall:
+    """一次 LLM 调用（一轮 llm 节点）的埋点记录。"""
+
+    session: str
+    user: str = ""
+    started: float = field(default_factory=time.monotonic)
+    # 调度器排队耗时（秒）
+    queue: float = 0.0
+    # 首 token 延迟 / 总耗时（不含排队；非流式时 ttft 为 None）
+    ttft: float | None = None
+    latency: float = 0.0
+    provider: str = ""
+    model: str = ""
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    # 命中回复缓存（完全没有请求模型）
+    response_cache_hit: bool = False
+    # provider 请求次数（含对冲 / 故障转移 / 升级 / 缓存失效后的内联重试）
+    attempts: int = 0
+    parse_failures: int = 0
+    # ok / error / busy / cancelled
+    result: str = "ok"
+    error: str = ""
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.attempts - 1)
+
+    @property
+    def prompt_cache_hit(self) -> bool:
+        return self.cached_tokens > 0
+
+    def add_usage(self, result: ProviderResult) -> None:
+        """累加一次 provider 返回的 token 用量（未被采用的结果也消耗了 token）。"""
+
+        self.prompt_tokens += int(result.usage.get("prompt", 0))
+        self.cached_tokens += int(result.usage.get("cached", 0))
+        self.output_tokens += int(result.usage.get("output", 0))
+
+    def adopt(self, result: ProviderResult) -> None:
+        """记录最终采用的结果来自哪个 provider / 模型。"""
+
+        self.provider = result.provider
+        self.model = result.model
+        self.ttft = result.ttft
+
+
+class Aggregate:
+    """某个维度（会话 / 模型 / provider）上的累计值。"""
+
+    __slots__ = (
+        "calls",
+        "errors",
+        "queue",
+        "ttft",
+        "latency",
+        "prompt_tokens",
+        "cached_tokens",
+        "output_tokens",
+        "response_cache_hits",
+        "prompt_cache_hits",
+        "retries",
+        "parse_failures",
+        "last_seen",
+    )
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.queue = Histogram()
+        self.ttft = Histogram()
+        self.latency = Histogram()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.response_cache_hits = 0
+        self.prompt_cache_hits = 0
+        self.retries = 0
+        self.parse_failures = 0
+        self.last_seen = 0.0
+
+    def add(self, call: LlmCall) -> None:
+        self.calls += 1
+        if call.result != "ok":
+            self.errors += 1
+        self.queue.observe(call.queue)
+        if call.ttft is not None:
+            self.ttft.observe(call.ttft)
+        if not call.response_cache_hit and call.result == "ok":
+            self.latency.observe(call.latency)
+        self.prompt_tokens += call.prompt_tokens
+        self.cached_tokens += call.cached_tokens
+        self.output_tokens += call.output_tokens
+        self.response_cache_hits += int(call.response_cache_hit)
+        self.prompt_cache_hits += int(call.prompt_cache_hit)
+        self.retries += call.retries
+        self.parse_failures += call.parse_failures
+        self.last_seen = time.time()
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "queue_p95": self.queue.quantile(0.95),
+            "ttft_p50": self.ttft.quantile(0.5),
+            "ttft_p95": self.ttft.quantile(0.95),
+            "latency_p50": self.latency.quantile(0.5),
+            "latency_p95": self.latency.quantile(0.95),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "response_cache_hits": self.response_cache_hits,
+            "prompt_cache_hits": self.prompt_cache_hits,
+            "retries": self.retries,
+            "parse_failures": self.parse_failures,
+        }
+
+
+class LlmStats:
+    """按会话 / 模型 / provider 聚合的调用统计，外加最近若干条原始记录。"""
+
+    def __init__(self, *, max_sessions: int = 256, recent: int = 50) -> None:
+        self.max_sessions = max(1, max_sessions)
+        self.total = Aggregate()
+        self.by_session: OrderedDict[str, Aggregate] = OrderedDict()
+        self.by_model: dict[str, Aggregate] = {}
+        self.by_provider: dict[str, Aggregate] = {}
+        self.recent: deque[LlmCall] = deque(maxlen=recent)
+        # session -> user（展示用）
+        self._users: dict[str, str] = {}
+
+    def record(self, call: LlmCall) -> None:
+        self.total.add(call)
+
+        agg = self.by_session.pop(call.session, None) or Aggregate()
+        agg.add(call)
+        self.by_session[call.session] = agg
+        self._users[call.session] = call.user
+        while len(self.by_session) > self.max_sessions:
+            old, _ = self.by_session.popitem(last=False)
+            self._users.pop(old, None)
+
+        model = call.model or "-"
+        provider = call.provider or "-"
+        self.by_model.setdefault(model, Aggregate()).add(call)
+        self.by_provider.setdefault(provider, Aggregate()).add(call)
+        self.recent.append(call)
+        _export(call, model, provider)
+
+    def user_of(self, session: str) -> str:
+        return self._users.get(session, "")
+
+    def reset(self) -> None:
+        self.total = Aggregate()
+        self.by_session.clear()
+        self.by_model.clear()
+        self.by_provider.clear()
+        self.recent.clear()
+        self._users.clear()
+
+
+def _export(call: LlmCall, model: str, provider: str) -> None:
+    metrics.counter(
+        "agent_llm_calls_total", "LLM 调用次数", provider=provider, model=model, result=call.result
+    ).inc()
+    if call.response_cache_hit:
+        metrics.counter("agent_llm_cache_hits_total", "LLM 缓存命中次数", cache="response").inc()
+        return
+    if call.prompt_cache_hit:
+        metrics.counter("agent_llm_cache_hits_total", "LLM 缓存命中次数", cache="prompt").inc()
+    if call.result == "ok":
+        metrics.histogram(
+            "agent_llm_latency_seconds", "LLM 调用耗时（不含排队）", provider=provider, model=model
+        ).observe(call.latency)
+    if call.ttft is not None:
+        metrics.histogram(
+            "agent_llm_ttft_seconds", "LLM 首 token 延迟（流式）", provider=provider, model=model
+        ).observe(call.ttft)
+    for kind, n in (("prompt", call.prompt_tokens), ("cached", call.cached_tokens), ("output", call.output_tokens)):
+        if n:
+            metrics.counter(
+                "agent_llm_tokens_total", "LLM token 用量", provider=provider, model=model, kind=kind
+            ).inc(n)
+    if call.retries:
+        metrics.counter("agent_llm_retries_total", "LLM 额外请求次数", provider=provider).inc(call.retries)
+    if call.parse_failures:
+        metrics.counter(
+            "agent_llm_parse_failures_total", "LLM 结构化解析失败次数", provider=provider, model=model
+        ).inc(call.parse_failures)
+
+
+_current: ContextVar[LlmCall | None] = ContextVar("agent_llm_call", default=None)
+_stats: LlmStats | None = None
+
+
+def get_stats() -> LlmStats:
+    global _stats
+    if _stats is None:
+        from ..config import config
+
+        _stats = LlmStats(max_sessions=config.llm_stats_sessions)
+    return _stats
+
+
+def current() -> LlmCall | None:
+    """当前正在记录的调用；不在 track 范围内时为 None（例如离线脚本直接调用 dispatcher）。"""
+
+    return _current.get()
+
+
+@asynccontextmanager
+async def track(session: str, *, user: str = "") -> AsyncIterator[LlmCall]:
+    """记录一次 LLM 调用；退出时按异常类型填写 result 并汇总。"""
+
+    call = LlmCall(session=session, user=user)
+    token = _current.set(call)
+    try:
+        yield call
+    except (asyncio.CancelledError, TurnSuperseded):
+        call.result = "cancelled"
+        raise
+    except SchedulerBusy:
+        call.result = "busy"
+        raise
+    except Exception as e:
+        call.result = "error"
+        call.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        call.latency = max(0.0, time.monotonic() - call.started - call.queue)
+        get_stats().record(call)
+
+
+__all__ = ["Aggregate", "LlmCall", "LlmStats", "current", "get_stats", "track"]
@@ -0,0 +1,85 @@
+"""按轮次选择模型档位（fast / strong）。
+
+目标：
+- “你好”这种短文本轮次用便宜快速的模型；带图片/语音或上下文很长的轮次用更强的模型
+- fast 模型输出不合法（结构化解析失败）、置信度过低或调用失败时，自动升级到 strong 模型重跑
+  （`agent_ai_tier_total{reason}`：escalated_schema / escalated_low_confidence / escalated_error）
+- 升级重跑只能用剩余的 SLO：fast + strong 合计不超过 AGENT__AI_SLO，已超时则不再升级
+
+特征：
+- 最新一条用户消息的内容类型（图片 / 语音）
+- 历史条数、最新消息文本长度
+- fast 模型的置信度：exp(avg_logprobs)，网关不返回时视为未知（不参与判断）
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from ..message_extract import AudioContent, ChatMessage, ImageContent, TextContent
+
+
+FAST = "fast"
+STRONG = "strong"
+
+
+@dataclass(frozen=True, slots=True)
+class TurnFeatures:
+    has_image: bool
+    has_audio: bool
+    history_len: int
+    text_chars: int
+
+
+def extract_features(messages: list[ChatMessage]) -> TurnFeatures:
+    last = messages[-1] if messages else None
+    content = last.content if last is not None else []
+    return TurnFeatures(
+        has_image=any(isinstance(c, ImageContent) for c in content),
+        has_audio=any(isinstance(c, AudioContent) for c in content),
+        history_len=len(messages),
+        text_chars=sum(len(c.text or "") for c in content if isinstance(c, TextContent)),
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class TierPolicy:
+    fast_model: str
+    strong_model: str
+    max_history: int = 6
+    max_chars: int = 200
+    # 0 表示不按置信度升级
+    min_confidence: float = 0.0
+
+    def choose(self, features: TurnFeatures) -> tuple[str, str]:
+        """返回 (tier, reason)。"""
+
+        if not self.fast_model:
+            return STRONG, "disabled"
+        if features.has_image or features.has_audio:
+            return STRONG, "media"
+        if features.history_len > self.max_history:
+            return STRONG, "long_history"
+        if features.text_chars > self.max_chars:
+            return STRONG, "long_text"
+        return FAST, "short_text"
+
+    def signature(self) -> str:
+        """分档配置的指纹：同一条消息在不同配置下可能由不同模型作答（用于回复缓存 key）。"""
+
+        return (
+            f"fast={self.fast_model};strong={self.strong_model};history={self.max_history};"
+            f"chars={self.max_chars};confidence={self.min_confidence:g}"
+        )
+
+    def should_escalate(self, *, structured: bool, confidence: float | None) -> str | None:
+        """fast 模型结果是否需要升级；需要时返回原因。"""
+
+        if not structured:
+            return "schema"
+        if self.min_confidence > 0 and confidence is not None and confidence < self.min_confidence:
+            return "low_confidence"
+        return None
+
+
+__all__ = ["FAST", "STRONG", "TurnFeatures", "TierPolicy", "extract_features"]
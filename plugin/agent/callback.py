@@ -0,0 +1,182 @@
+"""n8n 结果回调：挂在 NoneBot FastAPI driver 的 ASGI app 上。
+
+目标：
+- n8n 执行完（或执行中）直接 POST 回机器人，不再需要单独的 OneBot 连接
+- 结果需要追问时可以“重新打开”原会话，用户直接回复即可继续，不必再 /a
+
+接口（AGENT__CALLBACK_PATH，默认 /agent/n8n/callback）：
+- 鉴权：`Authorization: Bearer <AGENT__CALLBACK_TOKEN>`；token 未配置时不挂载该路由
+- `Content-Type: application/json`：单条结果
+    {"session_id": "...", "message": "...", "final": true, "reopen": false}
+- `Content-Type: application/x-ndjson`：进度流，每行一条（字段同上，session_id 可放在查询参数里），
+  边读边投递，适合 n8n 在长任务中持续推送进度
+- session_id 按 outbox 入队时记录的 reply_to 找回投递目标；未知 session_id 返回 404，bot 不在线返回 503
+
+说明：
+- 发送走共用的投递池：全局并发上限（AGENT__CALLBACK_SEND_CONCURRENCY），同一 session_id 内按到达顺序串行
+- `reopen` 只在 final 消息上生效；用户已经开启了别的会话时不会覆盖，只投递消息
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from nonebot import get_bot, get_driver
+from nonebot.log import logger
+from pydantic import BaseModel, ValidationError
+
+from nb_shared import metrics
+
+from .config import config
+from .outbox import get_outbox
+
+
+class N8NCallback(BaseModel):
+    session_id: str = ""
+    message: str = ""
+    # 是否为最后一条（进度流中间的更新为 False）
+    final: bool = True
+    # final 消息投递后重新打开会话，用户可直接回复
+    reopen: bool = False
+
+
+class CallbackError(Exception):
+    def __init__(self, status: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class DeliveryPool:
+    """回调消息投递：全局并发上限 + 同一 session_id 内保序。"""
+
+    def __init__(self, *, concurrency: int = 4) -> None:
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._waiters: dict[str, int] = {}
+
+    async def send(self, session_id: str, session_key: str, message: str) -> None:
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._waiters[session_id] = self._waiters.get(session_id, 0) + 1
+        try:
+            async with lock, self._sem:
+                await _send_to(session_key, message)
+        finally:
+            self._waiters[session_id] -= 1
+            if not self._waiters[session_id]:
+                self._waiters.pop(session_id, None)
+                self._locks.pop(session_id, None)
+
+
+async def _send_to(session_key: str, message: str) -> None:
+    self_id, _, user_id = session_key.partition(":")
+    try:
+        bot = get_bot(self_id)
+    except (KeyError, ValueError):
+        raise CallbackError(503, f"bot {self_id} 不在线") from None
+    await bot.call_api("send_private_msg", user_id=int(user_id), message=message)
+
+
+_pool: DeliveryPool | None = None
+
+
+def get_pool() -> DeliveryPool:
+    global _pool
+    if _pool is None:
+        _pool = DeliveryPool(concurrency=config.callback_send_concurrency)
+    return _pool
+
+
+def check_token(authorization: str | None) -> bool:
+    expected = config.callback_token
+    if not expected or not authorization:
+        return False
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+        token = authorization
+    return hmac.compare_digest(token.strip().encode(), expected.encode())
+
+
+async def handle_update(update: N8NCallback) -> None:
+    """投递一条回调；final + reopen 时重新打开会话。"""
+
+    if not update.session_id:
+        raise CallbackError(422, "缺少 session_id")
+    session_key = await asyncio.to_thread(get_outbox().reply_to, update.session_id)
+    if session_key is None:
+        raise CallbackError(404, f"未知 session_id：{update.session_id}")
+
+    if update.message:
+        await get_pool().send(update.session_id, session_key, update.message)
+    metrics.counter(
+        "agent_callback_total", "n8n 回调消息数", kind="final" if update.final else "progress"
+    ).inc()
+
+    if update.final and update.reopen:
+        # 延迟导入：commands 依赖较多，回调模块只在需要时用到
+        from .commands import reopen_session
+
+        await reopen_session(session_key, update.session_id, update.message)
+
+
+def _mount() -> None:
+    driver = get_driver()
+    if driver.type != "fastapi":
+        logger.warning("当前 driver 不是 FastAPI（{}），n8n 回调路由未挂载", driver.type)
+        return
+
+    app = driver.server_app  # type: ignore[attr-defined]
+
+    async def n8n_callback(request: Request) -> JSONResponse:
+        if not check_token(request.headers.get("authorization")):
+            return JSONResponse({"ok": False, "error": "unauthorized"}, status_code=401)
+
+        delivered = 0
+        try:
+            if "ndjson" in request.headers.get("content-type", ""):
+                default_sid = request.query_params.get("session_id", "")
+                buffer = b""
+                async for chunk in request.stream():
+                    buffer += chunk
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        delivered += await _handle_line(line, default_sid)
+                delivered += await _handle_line(buffer, default_sid)
+            else:
+                await handle_update(N8NCallback.model_validate(await request.json()))
+                delivered = 1
+        except CallbackError as e:
+            return JSONResponse({"ok": False, "error": e.detail, "delivered": delivered}, status_code=e.status)
+        except (ValidationError, ValueError) as e:
+            return JSONResponse({"ok": False, "error": str(e), "delivered": delivered}, status_code=422)
+        except Exception as e:
+            logger.exception("处理 n8n 回调失败")
+            return JSONResponse({"ok": False, "error": repr(e), "delivered": delivered}, status_code=500)
+        return JSONResponse({"ok": True, "delivered": delivered})
+
+    app.add_api_route(config.callback_path, n8n_callback, methods=["POST"])
+    logger.info("n8n 回调路由已挂载：POST {}", config.callback_path)
+
+
+async def _handle_line(line: bytes, default_sid: str) -> int:
+    line = line.strip()
+    if not line:
+        return 0
+    data: Any = json.loads(line)
+    update = N8NCallback.model_validate(data)
+    if not update.session_id:
+        update.session_id = default_sid
+    await handle_update(update)
+    return 1
+
+
+if config.callback_token:
+    _mount()
+
+
+__all__ = ["DeliveryPool", "N8NCallback", "check_token", "handle_update"]
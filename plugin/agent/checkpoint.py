@@ -0,0 +1,421 @@
+"""LangGraph checkpointer：本地 SQLite 持久化。
+
+目标：
+- 会话图（见 graph.py）的状态按 thread_id 落盘，进程重启后会话可以接着进行
+- 增量写入：每个 checkpoint 只写本步发生变化的 channel（按 channel + version 存 blob），
+  未变化的 channel 复用之前的版本
+
+说明：
+- 只依赖标准库 sqlite3（没有引入 langgraph-checkpoint-sqlite）；异步接口通过 asyncio.to_thread 执行
+- 同一个连接 + 线程锁串行访问，WAL 模式；单进程 bot 的写入量很小，足够
+- 额外维护 session_key -> thread_id 的绑定，用于重启后恢复“正在进行中的会话”；
+  updated_at 为会话最近活跃时间，超过 TTL 的绑定连同其 thread 在启动时清理（prune_sessions）
+- path 为 ":memory:" 时不落盘（用于离线验证）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator, Sequence
+from pathlib import Path
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_key TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def _parent_config(thread_id: str, checkpoint_ns: str, parent_id: str | None) -> RunnableConfig | None:
+    if not parent_id:
+        return None
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": parent_id,
+        }
+    }
+
+
+class SqliteSaver(BaseCheckpointSaver[str]):
+    """基于 sqlite3 的 checkpointer（同步实现 + to_thread 异步包装）。"""
+
+    def __init__(self, path: str | Path, *, serde: SerializerProtocol | None = None) -> None:
+        super().__init__(serde=serde)
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ---- 内部工具 ----
+
+    def _query(self, sql: str, params: Sequence[Any] = ()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict[str, Any]:
+        values: dict[str, Any] = {}
+        for channel, version in versions.items():
+            rows = self._query(
+                "SELECT type, blob FROM blobs WHERE thread_id=? AND checkpoint_ns=? AND channel=? AND version=?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            )
+            if rows and rows[0][0] != "empty":
+                values[channel] = self.serde.loads_typed((rows[0][0], rows[0][1]))
+        return values
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list[tuple[str, str, Any]]:
+        rows = self._query(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        return [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, channel, type_, value in rows]
+
+    def _to_tuple(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: str,
+        parent_id: str | None,
+        checkpoint: tuple[str, bytes],
+        metadata: tuple[str, bytes],
+    ) -> CheckpointTuple:
+        checkpoint_: Checkpoint = self.serde.loads_typed(checkpoint)
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint_,
+                "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint_["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed(metadata),
+            parent_config=_parent_config(thread_id, checkpoint_ns, parent_id),
+            pending_writes=self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    # ---- BaseCheckpointSaver（同步） ----
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id: str = config["configurable"]["thread_id"]
+        checkpoint_ns: str = config["configurable"].get("checkpoint_ns", "")
+        sql = (
+            "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints WHERE thread_id=? AND checkpoint_ns=?"
+        )
+        params: list[Any] = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            sql += " AND checkpoint_id=?"
+            params.append(checkpoint_id)
+        else:
+            sql += " ORDER BY checkpoint_id DESC LIMIT 1"
+
+        rows = self._query(sql, params)
+        if not rows:
+            return None
+        cid, parent_id, type_, checkpoint, metadata_type, metadata = rows[0]
+        return self._to_tuple(thread_id, checkpoint_ns, cid, parent_id, (type_, checkpoint), (metadata_type, metadata))
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        sql = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints"
+        )
+        where: list[str] = []
+        params: list[Any] = []
+        if config:
+            where.append("thread_id=?")
+            params.append(config["configurable"]["thread_id"])
+            if (ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns=?")
+                params.append(ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id=?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id<?")
+            params.append(before_id)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY checkpoint_id DESC"
+
+        remaining = limit
+        for thread_id, ns, cid, parent_id, type_, checkpoint, metadata_type, metadata in self._query(sql, params):
+            if remaining is not None and remaining <= 0:
+                break
+            if filter:
+                meta = self.serde.loads_typed((metadata_type, metadata))
+                if not all(meta.get(k) == v for k, v in filter.items()):
+                    continue
+            if remaining is not None:
+                remaining -= 1
+            yield self._to_tuple(thread_id, ns, cid, parent_id, (type_, checkpoint), (metadata_type, metadata))
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        c = checkpoint.copy()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        values: dict[str, Any] = c.pop("channel_values")  # type: ignore[misc]
+
+        blob_rows = []
+        for channel, version in new_versions.items():
+            type_, blob = self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)
+            blob_rows.append((thread_id, checkpoint_ns, channel, str(version), type_, blob))
+        type_, serialized = self.serde.dumps_typed(c)
+        meta_type, meta = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blob_rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        type_,
+                        serialized,
+                        meta_type,
+                        meta,
+                    ),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        # 普通写入不覆盖已有记录；错误/中断等特殊写入（负 idx）总是覆盖
+        regular: list[tuple] = []
+        special: list[tuple] = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            widx = WRITES_IDX_MAP.get(channel, idx)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, widx, channel, type_, blob, task_path)
+            (special if widx < 0 else regular).append(row)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", regular)
+                self._conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", special)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for table in ("checkpoints", "blobs", "writes"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE thread_id=?", (thread_id,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_next_version(self, current: str | None, channel: None) -> str:
+        # 与 InMemorySaver 一致：定长整数前缀保证按字符串排序即按版本排序
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---- BaseCheckpointSaver（异步） ----
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ---- 会话绑定（session_key -> thread_id） ----
+
+    def bind_session(self, session_key: str, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (session_key, thread_id, time.time())
+            )
+
+    def unbind_session(self, session_key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_key=?", (session_key,))
+
+    def session_thread(self, session_key: str) -> str | None:
+        rows = self._query("SELECT thread_id FROM sessions WHERE session_key=?", (session_key,))
+        return rows[0][0] if rows else None
+
+    def session_bindings(self) -> dict[str, tuple[str, float]]:
+        """全部绑定：session_key -> (thread_id, updated_at)。"""
+
+        rows = self._query("SELECT session_key, thread_id, updated_at FROM sessions")
+        return {key: (thread_id, updated_at) for key, thread_id, updated_at in rows}
+
+    def prune_sessions(self, max_age: float) -> tuple[int, int]:
+        """删除超过 max_age 秒未活跃的绑定，以及不再被任何绑定引用的 thread。
+
+        返回 (删除的绑定数, 删除的 thread 数)。未绑定的 thread 一律视为已放弃：
+        只应在没有进行中轮次时调用（启动时）。
+        """
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                bindings = 0
+                if max_age > 0:
+                    bindings = self._conn.execute(
+                        "DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age,)
+                    ).rowcount
+                threads = self._conn.execute(
+                    "SELECT COUNT(DISTINCT thread_id) FROM checkpoints "
+                    "WHERE thread_id NOT IN (SELECT thread_id FROM sessions)"
+                ).fetchone()[0]
+                for table in ("checkpoints", "blobs", "writes"):
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE thread_id NOT IN (SELECT thread_id FROM sessions)"
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return bindings, threads
+
+
+__all__ = ["SqliteSaver"]
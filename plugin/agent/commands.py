@@ -8,7 +8,12 @@
    - `/a`：只开启会话，下一条普通私聊消息作为开场词（无需再带 /a）
 4) 会话中每条消息进入 LLM（python-ai-sdk + Gemini）：
    - 需求不明确 => 追问（此时 bot 回复 + 会话继续）
-   - 需求明确 => 把 requirement（普通文本）+ session_id POST 给 n8n webhook，随后结束会话
+   - 需求明确 => 把 requirement（普通文本）+ session_id 写入 outbox，由后台投递给 n8n webhook（见 outbox.py），
+     立即回复确认并结束会话
+5) 同一会话的轮次串行执行；短时间内连发的多条消息合并为一轮（见 actor.py）
+6) LLM 生成途中收到新消息：取消旧生成，合并新消息后重新生成（旧输出不发送、不入历史）
+7) 句式固定的需求先走本地规则快速通道（见 fastpath.py），命中则不调用 LLM
+8) 每一轮由 LangGraph 会话图执行（见 graph.py），状态落盘到本地 SQLite；重启后会话可继续
 """
 
 from __future__ import annotations
@@ -20,8 +25,8 @@ from nonebot.adapters import Bot as BaseBot, Event
 from nonebot.log import logger
 from nonebot.permission import SUPERUSER
 
+from nb_shared import memstats
 from nb_shared.alconna_ns import build_default_namespace
-from .n8n import webhook_request, N8NRequest
 
 require("nonebot_plugin_alconna")
 
@@ -35,12 +40,16 @@ from nonebot_plugin_alconna import (
 )
 from nonebot_plugin_alconna.uniseg import UniMessage  # noqa: E402
 
-from .message_extract import extract_turn
-from .session import SessionStore
-from .ai.router import request
+from .actor import SessionActors
+from .config import config
+from .exceptions import TurnSuperseded
+from .graph import TurnContext, append_history, forget_session, lookup_session, remember_session, run_turn
+from .message_extract import ChatMessage, TextContent, extract_turn
+from .session import AgentSession, SessionStore
 
 
 _sessions = SessionStore()
+memstats.register("agent.sessions", _sessions.values, created_at=lambda s: s.created_at.timestamp())
 
 # 运行时缓存：避免每条消息都重建 client
 _runtime_cache: dict[str, Any] = {}
@@ -50,6 +59,26 @@ def _session_key(bot: BaseBot, event: Event) -> str:
     return f"{bot.self_id}:{event.get_session_id()}"
 
 
+async def _get_session(key: str) -> AgentSession | None:
+    """取进程内会话；没有时尝试从 checkpoint 恢复重启前进行中的会话。"""
+
+    sess = _sessions.get(key)
+    if sess is not None:
+        return sess
+    try:
+        found = await lookup_session(key)
+    except Exception:
+        logger.exception("恢复会话失败：{}", key)
+        return None
+    if found is None:
+        return None
+    thread_id, history = found
+    sess = _sessions.create(key, n8n_session_id=thread_id)
+    sess.turns.extend(history)
+    logger.info("已从 checkpoint 恢复会话：{}（{} 条历史）", key, len(history))
+    return sess
+
+
 
 agent_cmd = on_alconna(
     Alconna(
@@ -79,22 +108,21 @@ async def open_session(
 
     opening = text.result.strip() if text.available else ""
 
-    sess = _sessions.create(key) if not _sessions.has(key) else _sessions.get(key)
+    if await _get_session(key) is None:
+        await remember_session(key, _sessions.create(key))
 
     if not opening:
         await agent_cmd.finish("start")
         return
 
     user_msg = UniMessage.text(opening)
-    sess.add(await extract_turn(bot, "user", user_msg))
-
-    await _process_session_turn(bot, event, sess)
+    _actors.submit(key, extract_turn(bot, "user", user_msg), (bot, event))
 
 
 def _in_session_rule():
     async def _checker(bot: BaseBot, event: Event) -> bool:
         key = _session_key(bot, event)  # type: ignore[arg-type]
-        return _sessions.has(key)
+        return await _get_session(key) is not None
 
     return _checker
 
@@ -111,44 +139,85 @@ session_msg = on_message(
 async def handle_session_message(bot: BaseBot, event: Event, msg: UniMsg):
 
     key = _session_key(bot, event)
-    sess = _sessions.get(key)
 
-    # 用户输入结构化
+    # 用户输入结构化（立即开始提取），交给会话 actor 串行处理
     user_msg: UniMessage = msg
-    structured = await extract_turn(bot, "user", user_msg)
+    _actors.submit(key, extract_turn(bot, "user", user_msg), (bot, event))
+
+
+async def _run_turn(key: str, turn: ChatMessage, context: tuple[BaseBot, Event]) -> None:
+    """actor 回调：把合并后的用户轮次写入历史并执行一轮。"""
 
-    sess.add(structured)
+    sess = _sessions.get(key)
+    if sess is None:
+        # 会话已结束（例如上一轮已交给 n8n）：丢弃残留消息
+        logger.info("会话已结束，丢弃未处理消息：{}", key)
+        return
 
-    await _process_session_turn(bot, event, sess)
+    bot, event = context
+    sess.add(turn)
+    try:
+        await _process_session_turn(bot, event, sess)
+    except TurnSuperseded:
+        # 回滚本轮用户消息，由 actor 与新消息合并后重跑
+        if sess.turns and sess.turns[-1] is turn:
+            sess.turns.pop()
+        raise
+
+
+_actors = SessionActors(
+    _run_turn,
+    debounce=config.session_debounce_ms / 1000,
+    preempt=config.session_preempt,
+)
 
 
 async def _process_session_turn(
     bot: BaseBot,
     event: Event,
-    sess
+    sess: AgentSession,
 ) -> None:
-    """把一条用户消息交给 LLM 处理，并按约定决定是否回复/结束会话。"""
-
-    try:
-        history = [t for t in sess.turns]
-        decision = await request(history)
-    except Exception as e:
-        logger.exception("LLM 执行失败")
-        await bot.send(event=event, message=f"LLM 执行失败：{e}")
-        return
+    """执行会话图：快速通道/LLM 决策，并按约定决定是否回复/结束会话。"""
 
-    if not decision.trigger_n8n:
-        await bot.send(event=event, message=decision.response)
-        sess.add(await extract_turn(bot, "assistant", UniMessage.text(decision.response)))
-        return
-
-    # 需求明确：交给 n8n。n8n 侧再决定是否/如何让机器人回复。
-    try:
-        await webhook_request(N8NRequest(requirement=decision.payload, session_id=sess.n8n_session_id))
-    except Exception as e:
-        logger.exception("调用 n8n 失败")
-        await bot.send(event=event, message=f"调用 n8n 失败：{e}")
+    key = _session_key(bot, event)
+    state = await run_turn(
+        TurnContext(
+            bot=bot,
+            event=event,
+            key=key,
+            session=sess,
+            turn=sess.turns[-1],
+            cancellable=lambda aw: _actors.run_cancellable(key, aw),
+        )
+    )
+    if not state.get("done"):
         return
 
-    key = _session_key(bot, event)
     _sessions.pop(key)
+    _actors.discard(key)
+    try:
+        await forget_session(key, sess)
+    except Exception:
+        logger.exception("清理会话 checkpoint 失败：{}", key)
+
+
+async def reopen_session(key: str, n8n_session_id: str, text: str) -> AgentSession | None:
+    """n8n 回调要求继续对话：按原 session_id 重新开启会话，n8n 的结果作为助手消息进入上下文。
+
+    该用户已经开启了别的会话时不覆盖，返回 None。
+    """
+
+    sess = await _get_session(key)
+    if sess is not None and sess.n8n_session_id != n8n_session_id:
+        logger.info("会话已被占用，跳过 n8n 重新打开：{}", key)
+        return None
+    if sess is None:
+        sess = _sessions.create(key, n8n_session_id=n8n_session_id)
+        await remember_session(key, sess)
+
+    if text:
+        msg = ChatMessage(role="assistant", content=[TextContent(text=text)])
+        sess.add(msg)
+        await append_history(sess, [msg])
+    logger.info("n8n 回调重新打开会话：{}", key)
+    return sess
@@ -8,11 +8,49 @@
 - AGENT__N8N_BASE_URL=http://n8n:5678
 - AGENT__N8N_API_KEY=xxxxxx
 - AGENT__N8N_WEBHOOK_PATH=xxx  # 历史命名，实际为 agent webhook 路径
+- AGENT__N8N_ACK_MESSAGE=收到，已交给 n8n 处理。  # 需求写入 outbox 后立即回复的确认语，留空则不回复
+- AGENT__OUTBOX_PATH=data/agent_outbox.sqlite  # n8n 投递队列（见 outbox.py）
+- AGENT__OUTBOX_CONCURRENCY=4     # 后台同时投递的最大请求数
+- AGENT__OUTBOX_MAX_ATTEMPTS=8    # 超过该次数进入死信
+- AGENT__CALLBACK_TOKEN=xxxxxx    # n8n 回调鉴权（Bearer token），留空则不挂载回调路由（见 callback.py）
+- AGENT__CALLBACK_PATH=/agent/n8n/callback
+- AGENT__SESSION_DEBOUNCE_MS=1200  # 会话内连发合并窗口（毫秒），0 表示不等待
+- AGENT__SESSION_PREEMPT=true      # 新消息到达时取消进行中的 LLM 生成
+- AGENT__FASTPATH_ENABLED=true     # 本地规则快速通道（规则见 fastpath.py / 共享 JSON 配置）
+- AGENT__FASTPATH_MIN_CONFIDENCE=0.9
+- AGENT__RESPONSE_CACHE_ENABLED=false  # 单轮闲聊/问答回复缓存
+- AGENT__RESPONSE_CACHE_TTL=3600
+- AGENT__RESPONSE_CACHE_SIZE=256
+- AGENT__CHECKPOINT_PATH=data/agent_checkpoints.sqlite  # 会话图状态（SQLite），留空则只保存在内存
+- AGENT__CHECKPOINT_SESSION_TTL=86400  # 会话超过该秒数未活跃视为已放弃：重启后不再恢复，启动时清理
 
 模型相关（Gemini，建议写到环境变量/密钥系统，不要提交到仓库）：
 - AGENT__GEMINI_BASE_URL=http://xxx
 - AGENT__GEMINI_API_KEY=xxxxxx
 - AGENT__GEMINI_MODEL=gemini-2.5-flash
+- AGENT__GEMINI_CONTEXT_CACHE=true            # 启用上下文缓存（缓存 system_prompt）
+- AGENT__GEMINI_CONTEXT_CACHE_TTL=3600        # 缓存 TTL（秒）
+- AGENT__GEMINI_CONTEXT_CACHE_REFRESH_MARGIN=300  # 距过期不足该秒数时续期
+- AGENT__CONTEXT_TOKEN_BUDGET=8000  # 每轮上下文的估算 token 预算，超出部分折叠为摘要
+- AGENT__GEMINI_STREAM=false       # 使用流式接口（可测首 token 延迟，见 ai/telemetry.py）
+
+多 provider（对冲 / 故障转移 / 熔断，见 ai/providers.py）：
+- AGENT__PROVIDERS='[{"name": "backup", "base_url": "http://backup", "api_key": "xxx"}]'  # 备用 provider，按顺序
+  # 每项可单独配置 model / fast_model（不同网关的模型名可能不同）；留空沿用主 provider 的 model
+- AGENT__AI_DEADLINE=30          # 单个 provider 的请求截止时间（秒）
+- AGENT__AI_SLO=45               # 一轮请求的整体上限（秒）
+- AGENT__AI_HEDGE=true           # 主请求超过 p95 延迟时对冲到下一个 provider
+- AGENT__LLM_CONCURRENCY=4       # 全局同时进行的 LLM 请求上限（见 ai/scheduler.py）
+- AGENT__LLM_MAX_QUEUE=32        # 排队上限，超过直接拒绝
+- AGENT__LLM_STATS_SESSIONS=256  # 内存中保留按会话聚合的 LLM 调用统计的会话数
+- AGENT__METRICS_PATH=/metrics   # Prometheus 指标出口（见 metrics_http.py），留空则不挂载
+- AGENT__METRICS_TOKEN=xxxxxx    # 指标出口的 Bearer token，留空则不鉴权
+
+模型分档（见 ai/tiering.py）：
+- AGENT__GEMINI_FAST_MODEL=gemini-2.5-flash-lite  # 短文本轮次使用的快速模型，留空则不分档
+- AGENT__TIER_FAST_MAX_HISTORY=6   # 历史超过该条数时使用 strong 模型
+- AGENT__TIER_FAST_MAX_CHARS=200   # 最新消息超过该字数时使用 strong 模型
+- AGENT__TIER_MIN_CONFIDENCE=0     # fast 模型置信度低于该值时升级（0 表示不按置信度升级）
 """
 
 from __future__ import annotations
@@ -24,6 +62,19 @@ from pydantic import BaseModel, Field, AliasChoices
 from nonebot import get_plugin_config
 
 
+class ProviderSpec(BaseModel):
+    """备用模型 provider（api_key / model / deadline 留空时沿用主 provider 的配置）。"""
+
+    name: str
+    kind: Literal["gemini"] = "gemini"
+    base_url: str = ""
+    api_key: str = ""
+    model: str = ""
+    # fast 档使用的模型（见 ai/tiering.py）；留空则 fast 档也使用 model
+    fast_model: str = ""
+    deadline: float = 0
+
+
 class ScopedConfig(BaseModel):
     """Agent 插件配置。"""
 
@@ -33,6 +84,49 @@ class ScopedConfig(BaseModel):
         description="n8n webhook 路径（由后端进行路由/执行）",
     )
 
+    n8n_ack_message: str = Field(
+        default="收到，已交给 n8n 处理。", description="需求写入 outbox 后立即回复的确认语；留空则不回复"
+    )
+    outbox_path: str = Field(
+        default="data/agent_outbox.sqlite", description="n8n 投递队列的 SQLite 路径；留空则只保存在内存"
+    )
+    outbox_concurrency: int = Field(default=4, description="后台同时投递给 n8n 的最大请求数")
+    outbox_base_delay: float = Field(default=2, description="投递失败后的首次重试等待（秒），之后指数增长")
+    outbox_max_delay: float = Field(default=300, description="投递重试等待上限（秒）")
+    outbox_max_attempts: int = Field(default=8, description="投递失败超过该次数进入死信")
+
+    callback_token: str = Field(default="", description="n8n 回调鉴权 token；留空则不挂载回调路由")
+    callback_path: str = Field(default="/agent/n8n/callback", description="n8n 回调路由路径")
+    callback_send_concurrency: int = Field(default=4, description="n8n 回调消息的最大并发发送数")
+
+    session_debounce_ms: int = Field(
+        default=1200, description="会话内连发消息合并窗口（毫秒）；窗口内的消息合并为一轮"
+    )
+
+    session_preempt: bool = Field(
+        default=True, description="LLM 生成途中收到新消息时，取消旧生成并合并新消息重跑"
+    )
+
+    fastpath_enabled: bool = Field(default=True, description="启用本地规则快速通道（命中则跳过 LLM）")
+    fastpath_min_confidence: float = Field(
+        default=0.9, description="快速通道最低置信度，低于该值回退给 LLM"
+    )
+
+    checkpoint_path: str = Field(
+        default="data/agent_checkpoints.sqlite",
+        description="会话图 checkpoint 的 SQLite 路径；留空则只保存在内存（重启后会话丢失）",
+    )
+    checkpoint_session_ttl: int = Field(
+        default=86400,
+        description="会话超过该秒数未活跃视为已放弃：启动时清理其 checkpoint，恢复时忽略；0 表示不过期",
+    )
+
+    response_cache_enabled: bool = Field(
+        default=False, description="启用单轮闲聊/问答回复缓存（仅纯文本、无上下文）"
+    )
+    response_cache_ttl: int = Field(default=3600, description="回复缓存 TTL（秒）")
+    response_cache_size: int = Field(default=256, description="回复缓存最大条目数（LRU 淘汰）")
+
     provider: Literal["gemini"] = Field(default="gemini", description="Model provider")
 
     gemini_base_url: str = Field(default="", description="Gemini Base Url")
@@ -42,6 +136,41 @@ class ScopedConfig(BaseModel):
         description="gemini model",
     )
 
+    context_token_budget: int = Field(
+        default=8000, description="每轮上下文的估算 token 预算；较早的轮次折叠为滚动摘要"
+    )
+
+    gemini_fast_model: str = Field(default="", description="短文本轮次使用的快速模型，留空则不分档")
+    tier_fast_max_history: int = Field(default=6, description="历史超过该条数时使用 strong 模型")
+    tier_fast_max_chars: int = Field(default=200, description="最新消息超过该字数时使用 strong 模型")
+    tier_min_confidence: float = Field(
+        default=0.0, description="fast 模型置信度 exp(avg_logprobs) 低于该值时升级；0 表示不启用"
+    )
+
+    providers: list[ProviderSpec] = Field(default_factory=list, description="备用 provider（按优先级顺序）")
+    ai_deadline: float = Field(default=30, description="单个 provider 的请求截止时间（秒）")
+    ai_slo: float = Field(default=45, description="一轮模型请求的整体上限（秒）")
+    ai_hedge: bool = Field(default=True, description="主请求超过 p95 延迟时对冲到下一个 provider")
+    ai_hedge_min_delay: float = Field(default=2, description="对冲最早触发时间（秒）")
+    ai_hedge_default_delay: float = Field(default=8, description="延迟样本不足时的对冲触发时间（秒）")
+    llm_concurrency: int = Field(default=4, description="全局同时进行的 LLM 请求上限")
+    llm_max_queue: int = Field(default=32, description="LLM 排队上限，超过直接拒绝")
+    llm_busy_message: str = Field(
+        default="当前请求较多，已排队（第 {position} 位），请稍候。",
+        description="请求进入排队时的提示（{position} 为排队位置）；留空则不提示",
+    )
+    llm_stats_sessions: int = Field(default=256, description="内存中保留按会话聚合的 LLM 调用统计的会话数")
+    metrics_path: str = Field(default="", description="Prometheus 指标出口路径（如 /metrics）；留空则不挂载")
+    metrics_token: str = Field(default="", description="指标出口的 Bearer token；留空则不鉴权")
+    ai_breaker_failures: int = Field(default=3, description="连续失败多少次后熔断")
+    ai_breaker_cooldown: float = Field(default=30, description="熔断后多久放行一次探测请求（秒）")
+    gemini_stream: bool = Field(default=False, description="使用流式接口请求 Gemini（用于测量首 token 延迟）")
+    gemini_context_cache: bool = Field(default=False, description="启用 Gemini 上下文缓存（缓存 system_prompt）")
+    gemini_context_cache_ttl: int = Field(default=3600, description="上下文缓存 TTL（秒）")
+    gemini_context_cache_refresh_margin: int = Field(
+        default=300, description="距过期不足该秒数时提前续期"
+    )
+
 
 class Config(BaseModel):
     agent: ScopedConfig
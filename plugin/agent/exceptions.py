@@ -15,3 +15,6 @@ class AgentError(Exception):
 class UnsupportedAdapterError(AgentError):
     """当前适配器/平台暂不支持。"""
 
+
+class TurnSuperseded(AgentError):
+    """当前轮次的 LLM 生成被同会话的新消息抢占取消。"""
@@ -0,0 +1,228 @@
+"""本地规则快速通道：格式化的自动化需求不经过 LLM，直接交给 n8n。
+
+目标：
+- “刚才买咖啡花了30块钱”“重启 nas”这类句式固定的需求，本地正则/关键词即可提炼出 payload，
+  省掉一次完整的 Gemini 往返
+- 置信度低于阈值、或消息包含图片/语音时，回退给 LLM
+- 只处理“陈述式”的需求：带疑问语气（吗/么/怎么/为什么/？…）的消息一律交给 LLM，
+  “重启失败了怎么办”“服务器内存满了怎么办”是在提问，而不是要执行操作
+
+规则来源：
+- 内置规则 `DEFAULT_RULES`
+- 共享 JSON 配置 `plugins.agent.fastpath_rules`（list），同名规则覆盖内置规则；修改后无需重启
+
+规则格式：
+    {"name": "expense", "pattern": "<正则，整句匹配>", "payload": "记账：支出{amount}元，备注{item}", "confidence": 0.95}
+    {"name": "disk", "keywords": ["磁盘", "空间"], "payload": "查询磁盘空间",
+     "confidence": 0.9, "max_chars": 20}
+
+说明：
+- pattern 使用 fullmatch；payload 用命名分组做 `str.format` 填充
+- keywords 规则：置信度 = confidence × 命中比例；文本超过 max_chars 不参与（长句往往不止一个意图）
+- 命名分组先去掉开头的时间词 / 代词（我/今天/这个月…）；剩下为空或只是代词时视为未命中：
+  “我今天吃饭花了50”的备注是“吃饭”，“这个月花了3000”没有可用的备注，交给 LLM
+- 内置规则只覆盖“动作 + 明确对象”的句式：“重启吧”“重启nas失败了”“清理服务器内存”都交给 LLM
+- 只在会话首轮使用（由 graph 判断）：追问轮次脱离上下文无法理解，必须交给 LLM
+- 命中率通过 metrics（agent_fastpath_total / agent_fastpath_rule_hits_total）与 `FastPathRouter.stats` 输出
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+from nonebot.log import logger
+
+from nb_shared import metrics
+from nb_shared.json_config import get_store, plugin_key
+
+from .message_extract import ChatMessage, TextContent
+
+
+RULES_KEY = plugin_key("agent", "fastpath_rules")
+
+# 重启目标：常见设备词，或服务 / 容器名（英文标识符）；“重启吧”“重启电脑没用”这类不是可执行的需求
+_RESTART_TARGET = (
+    r"(?:[A-Za-z][A-Za-z0-9_.\-]{0,31}(?:\s*(?:容器|服务))?"
+    r"|路由器|软路由|服务器|电脑|主机|虚拟机|树莓派|光猫|交换机|网关|容器)"
+)
+
+DEFAULT_RULES: list[dict[str, Any]] = [
+    {
+        "name": "expense",
+        "pattern": r"(?:刚才|刚刚|今天)?(?:买)?(?P<item>[一-龥A-Za-z]{1,12}?)(?:花了|花|用了)(?P<amount>\d+(?:\.\d+)?)(?:块钱|块|元)?",
+        "payload": "记账：支出{amount}元，备注{item}",
+        "confidence": 0.95,
+    },
+    {
+        "name": "restart",
+        "pattern": rf"(?:帮我|请)?重启(?:一下|下)?\s*(?P<target>{_RESTART_TARGET})(?:一下)?",
+        "payload": "重启{target}",
+        "confidence": 0.9,
+    },
+    {
+        # 必须带查询动词 / 状态词：“清理服务器内存”“服务器内存升级到32G”是操作，不是查询
+        "name": "server_memory",
+        "pattern": r"(?:帮我)?(?:查|查查|查看|查询|看|看看)(?:一下|下)?服务器(?:的)?内存(?:状态|情况|占用|使用情况|使用率)?"
+        r"|服务器(?:的)?内存(?:状态|情况|占用|使用情况|使用率)",
+        "payload": "查询服务器内存状态",
+        "confidence": 0.92,
+    },
+]
+
+_TRAILING = "。.！!~～ \t\r\n"
+
+# 疑问语气：命中即回退给 LLM
+_QUESTION = re.compile(r"[?？]|吗|么|呢|为啥|如何|多少|哪|谁|是否|能不能|可不可以|有没有|会不会")
+
+# 命名分组开头的时间词 / 代词 / 虚词：提取前去掉（“我今天吃饭花了50”的备注是“吃饭”）
+_FILLER = re.compile(
+    r"^(?:我们|我|咱们|咱|俺|今天|昨天|前天|刚才|刚刚|早上|上午|中午|下午|晚上|这个月|上个月|本月|这周|上周|本周"
+    r"|这个|那个|这次|一共|总共|又|都|去|买了|买)+"
+)
+
+# 命名分组只提取到这些词（或去掉开头虚词后为空）时视为未命中
+_PRONOUNS = frozenset(
+    "我 你 您 他 她 它 我们 你们 他们 她们 它们 咱 咱们 俺 自己 这 那 这个 那个 这些 那些 这里 那里 它的".split()
+)
+
+
+@dataclass(frozen=True, slots=True)
+class FastPathMatch:
+    rule: str
+    payload: str
+    confidence: float
+
+
+@dataclass(frozen=True, slots=True)
+class _Rule:
+    name: str
+    payload: str
+    confidence: float
+    pattern: re.Pattern[str] | None = None
+    keywords: tuple[str, ...] = ()
+    max_chars: int = 0
+
+    def match(self, text: str) -> FastPathMatch | None:
+        if self.pattern is not None:
+            m = self.pattern.fullmatch(text)
+            if m is None:
+                return None
+            groups = {k: _FILLER.sub("", (v or "").strip()).strip() for k, v in m.groupdict().items()}
+            if any(not v or v in _PRONOUNS for v in groups.values()):
+                return None
+            try:
+                payload = self.payload.format(**groups)
+            except (KeyError, IndexError, ValueError):
+                return None
+            return FastPathMatch(self.name, payload, self.confidence)
+
+        if not self.keywords or (self.max_chars and len(text) > self.max_chars):
+            return None
+        hit = sum(1 for kw in self.keywords if kw in text)
+        if not hit:
+            return None
+        return FastPathMatch(self.name, self.payload, self.confidence * hit / len(self.keywords))
+
+
+def _compile(raw: dict[str, Any]) -> _Rule | None:
+    try:
+        name = str(raw["name"])
+        payload = str(raw["payload"])
+        confidence = float(raw.get("confidence", 1.0))
+        pattern = raw.get("pattern")
+        keywords = tuple(str(x) for x in raw.get("keywords") or ())
+        if pattern:
+            return _Rule(name, payload, confidence, pattern=re.compile(str(pattern)))
+        if keywords:
+            return _Rule(name, payload, confidence, keywords=keywords, max_chars=int(raw.get("max_chars", 0)))
+    except Exception:
+        logger.warning("快速通道规则无效，已忽略：{}", raw)
+        return None
+    logger.warning("快速通道规则缺少 pattern/keywords，已忽略：{}", raw)
+    return None
+
+
+@dataclass(slots=True)
+class FastPathStats:
+    attempts: int = 0
+    hits: int = 0
+    below_threshold: int = 0
+    rule_hits: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.attempts if self.attempts else 0.0
+
+
+class FastPathRouter:
+    """规则匹配器：按置信度取最优命中，低于阈值返回 None。"""
+
+    def __init__(self, *, threshold: float = 0.9) -> None:
+        self.threshold = threshold
+        self.stats = FastPathStats()
+        self._rules: list[_Rule] = []
+        self._signature: str | None = None
+
+    def _load_rules(self) -> list[_Rule]:
+        extra = get_store().get(RULES_KEY, []) or []
+        if not isinstance(extra, list):
+            extra = []
+        signature = json.dumps(extra, ensure_ascii=False, sort_keys=True)
+        if signature == self._signature:
+            return self._rules
+
+        merged: dict[str, dict[str, Any]] = {r["name"]: r for r in DEFAULT_RULES}
+        for raw in extra:
+            if isinstance(raw, dict) and raw.get("name"):
+                merged[str(raw["name"])] = raw
+        self._rules = [r for r in (_compile(raw) for raw in merged.values()) if r is not None]
+        self._signature = signature
+        return self._rules
+
+    def match_text(self, text: str) -> FastPathMatch | None:
+        text = (text or "").strip().rstrip(_TRAILING)
+        if not text or _QUESTION.search(text):
+            return None
+
+        best: FastPathMatch | None = None
+        for rule in self._load_rules():
+            found = rule.match(text)
+            if found is not None and (best is None or found.confidence > best.confidence):
+                best = found
+        return best
+
+    def route(self, turn: ChatMessage) -> FastPathMatch | None:
+        """尝试对一条用户消息走快速通道；仅纯文本消息参与。"""
+
+        if not turn.content or not all(isinstance(c, TextContent) for c in turn.content):
+            return None
+
+        self.stats.attempts += 1
+        found = self.match_text("\n".join(c.text for c in turn.content))
+        if found is None:
+            metrics.counter("agent_fastpath_total", "快速通道尝试次数", result="miss").inc()
+            return None
+        if found.confidence < self.threshold:
+            self.stats.below_threshold += 1
+            metrics.counter("agent_fastpath_total", "快速通道尝试次数", result="below_threshold").inc()
+            return None
+
+        self.stats.hits += 1
+        self.stats.rule_hits[found.rule] = self.stats.rule_hits.get(found.rule, 0) + 1
+        metrics.counter("agent_fastpath_total", "快速通道尝试次数", result="hit").inc()
+        metrics.counter("agent_fastpath_rule_hits_total", "快速通道各规则命中次数", rule=found.rule).inc()
+        logger.info(
+            "快速通道命中：rule={} confidence={:.2f} 命中率={:.1%}（{}/{}）",
+            found.rule,
+            found.confidence,
+            self.stats.hit_rate,
+            self.stats.hits,
+            self.stats.attempts,
+        )
+        return found
+
+
+__all__ = ["DEFAULT_RULES", "FastPathMatch", "FastPathRouter", "FastPathStats"]
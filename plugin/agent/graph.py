@@ -0,0 +1,409 @@
+"""会话轮次流水线（LangGraph）。
+
+图结构：
+
+    START ─┬─> preprocess ─┐
+           └─> fastpath  ──┴─> route ─┬─> dispatch（快速通道命中）
+                                      └─> llm ─┬─> reply（追问/闲聊）
+                                               ├─> dispatch（需求明确，写入 n8n outbox）
+                                               └─> END（LLM 失败，已回复错误）
+
+说明：
+- preprocess（媒体规范化 + 按 token 预算选取上下文）与 fastpath（规则匹配）互不依赖，在同一步并行执行
+- fastpath 只在会话首轮生效：追问轮次的文本离开上下文没有意义
+- 状态按 thread_id（= AgentSession.thread_id）由 checkpointer 持久化，默认落到本地 SQLite（见 checkpoint.py），
+  重启后可按 session_key 找回进行中的会话与已确认的历史
+- session_key -> thread_id 的绑定在启动时载入内存（查找不走 SQLite），超过 AGENT__CHECKPOINT_SESSION_TTL
+  未活跃的会话视为已放弃：启动时连同 checkpoint 一起清理，查找时忽略
+- 只有“完成”的轮次才写入 history：被抢占（TurnSuperseded）的轮次不会留下半截状态
+- bot / event / 会话对象等运行期依赖通过 LangGraph runtime context 传入，不参与持久化
+- llm 节点经过全局调度器（见 ai/scheduler.py）：并发上限、按用户公平排队、首轮/纯文本优先；
+  回复缓存命中时不经过调度器
+- 每次 LLM 调用的排队 / 首 token / 耗时 / token 用量按会话、模型、provider 聚合（见 ai/telemetry.py）
+- 每个节点的耗时记录到 `agent_graph_node_seconds{node}`，整轮耗时记录到 `agent_graph_turn_seconds`
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import operator
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Annotated, Any, TypedDict
+
+from langgraph.graph import END, START, StateGraph
+from langgraph.runtime import Runtime
+from nonebot import get_driver
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.log import logger
+from nonebot_plugin_alconna.uniseg import UniMessage
+
+from nb_shared import metrics
+
+from .ai import telemetry
+from .ai.context import estimate_tokens
+from .ai.router import AiResponse, request
+from .ai.scheduler import SchedulerBusy, get_scheduler, turn_priority
+from .config import config
+from .exceptions import TurnSuperseded
+from .fastpath import FastPathRouter
+from .message_extract import AudioContent, ChatMessage, TextContent, extract_turn
+from .n8n import N8NRequest
+from .outbox import enqueue
+from .session import AgentSession
+
+
+class TurnState(TypedDict, total=False):
+    # 已完成轮次的消息（ChatMessage.model_dump()），按轮次追加
+    history: Annotated[list[dict[str, Any]], operator.add]
+    # 本轮用户消息
+    turn: dict[str, Any]
+    context_tokens: int
+    fast_payload: str | None
+    decision: dict[str, Any] | None
+    # 需求已交给 n8n，会话结束
+    done: bool
+
+
+@dataclass(slots=True)
+class TurnContext:
+    """单轮运行期依赖（不持久化）。"""
+
+    bot: BaseBot
+    event: Event
+    # session_key（bot.self_id + 事件会话 id）
+    key: str
+    session: AgentSession
+    turn: ChatMessage
+    # 包裹可被新消息抢占的阶段（SessionActors.run_cancellable）
+    cancellable: Callable[[Awaitable[Any]], Awaitable[Any]]
+    # preprocess 按 token 预算选出的上下文
+    history: list[ChatMessage] = field(default_factory=list)
+
+
+_fastpath = FastPathRouter(threshold=config.fastpath_min_confidence)
+
+
+def _normalize_audio(turn: ChatMessage) -> None:
+    """校验语音 base64（去掉 data URL 前缀）；无法解码的替换为文本占位，避免整轮请求失败。"""
+
+    for i, c in enumerate(turn.content):
+        if not isinstance(c, AudioContent):
+            continue
+        data = c.audio or ""
+        if data.strip().lower().startswith("data:") and "," in data:
+            data = data.split(",", 1)[1]
+        try:
+            base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            turn.content[i] = TextContent(text="[语音解析失败]")
+            continue
+        if data is not c.audio:
+            turn.content[i] = AudioContent(audio=data)
+
+
+async def _preprocess(state: TurnState, runtime: Runtime[TurnContext]) -> TurnState:
+    ctx = runtime.context
+    if any(isinstance(c, AudioContent) for c in ctx.turn.content):
+        # 语音 base64 可能有数 MB，放到线程里解码，不阻塞事件循环（也让 fastpath 节点真正并行）
+        await asyncio.to_thread(_normalize_audio, ctx.turn)
+        ctx.turn._token_estimate = None
+
+    ctx.history = ctx.session.context.select(ctx.session.turns, budget=config.context_token_budget)
+    return {"context_tokens": sum(estimate_tokens(m) for m in ctx.history)}
+
+
+async def _fastpath_node(state: TurnState, runtime: Runtime[TurnContext]) -> TurnState:
+    ctx = runtime.context
+    # 只在会话首轮走快速通道：追问轮次的文本依赖上下文，交给 LLM
+    if not config.fastpath_enabled or any(m.role == "assistant" for m in ctx.session.turns):
+        return {"fast_payload": None}
+    found = _fastpath.route(ctx.turn)
+    return {"fast_payload": found.payload if found is not None else None}
+
+
+async def _route(state: TurnState, runtime: Runtime[TurnContext]) -> TurnState:
+    return {}
+
+
+def _after_route(state: TurnState) -> str:
+    return "dispatch" if state.get("fast_payload") else "llm"
+
+
+async def _llm(state: TurnState, runtime: Runtime[TurnContext]) -> TurnState:
+    ctx = runtime.context
+    first_turn = not any(m.role == "assistant" for m in ctx.session.turns)
+
+    async def on_queued(position: int) -> None:
+        if config.llm_busy_message:
+            await ctx.bot.send(event=ctx.event, message=config.llm_busy_message.format(position=position))
+
+    async def call() -> AiResponse:
+        # 在被 cancellable 包裹的任务内开始记录，调用链上的 telemetry.current() 才能拿到这条记录
+        async with telemetry.track(ctx.session.n8n_session_id, user=ctx.key) as record:
+
+            @asynccontextmanager
+            async def slot() -> AsyncIterator[None]:
+                queued_at = time.monotonic()
+                # 排队也在可抢占范围内：排队期间收到新消息同样会取消并合并重跑
+                async with get_scheduler().slot(
+                    ctx.key, priority=turn_priority(ctx.turn, first_turn=first_turn), on_queued=on_queued
+                ):
+                    record.queue = time.monotonic() - queued_at
+                    yield
+
+            # 回复缓存在 request 内、进入调度名额之前检查：命中时不排队
+            return await request(ctx.history, slot=slot)
+
+    try:
+        decision: AiResponse = await ctx.cancellable(call())
+    except TurnSuperseded:
+        raise
+    except SchedulerBusy:
+        logger.warning("LLM 排队已满，拒绝本轮：{}", ctx.key)
+        await ctx.bot.send(event=ctx.event, message="当前请求太多，请稍后再试。")
+        return {"decision": None, "history": [ctx.turn.model_dump()]}
+    except Exception as e:
+        logger.exception("LLM 执行失败")
+        await ctx.bot.send(event=ctx.event, message=f"LLM 执行失败：{e}")
+        return {"decision": None, "history": [ctx.turn.model_dump()]}
+    return {"decision": decision.model_dump()}
+
+
+def _after_llm(state: TurnState) -> str:
+    decision = state.get("decision")
+    if decision is None:
+        return END
+    return "dispatch" if decision.get("trigger_n8n") else "reply"
+
+
+async def _reply(state: TurnState, runtime: Runtime[TurnContext]) -> TurnState:
+    ctx = runtime.context
+    text = (state.get("decision") or {}).get("response", "")
+    await ctx.bot.send(event=ctx.event, message=text)
+    assistant = await extract_turn(ctx.bot, "assistant", UniMessage.text(text))
+    ctx.session.add(assistant)
+    return {"history": [ctx.turn.model_dump(), assistant.model_dump()]}
+
+
+async def _dispatch(state: TurnState, runtime: Runtime[TurnContext]) -> TurnState:
+    ctx = runtime.context
+    payload = state.get("fast_payload") or (state.get("decision") or {}).get("payload", "")
+    # 需求明确：写入 outbox 后立即确认，由后台投递给 n8n（n8n 侧再决定是否/如何让机器人回复）
+    try:
+        created = await enqueue(
+            N8NRequest(requirement=payload, session_id=ctx.session.n8n_session_id), reply_to=ctx.key
+        )
+    except Exception as e:
+        logger.exception("写入 n8n outbox 失败")
+        await ctx.bot.send(event=ctx.event, message=f"提交给 n8n 失败：{e}")
+        return {"history": [ctx.turn.model_dump()]}
+    if not created:
+        logger.info("同一会话的相同需求已在 outbox 中，跳过重复入队：{}", ctx.session.n8n_session_id)
+    if config.n8n_ack_message:
+        await ctx.bot.send(event=ctx.event, message=config.n8n_ack_message)
+    return {"history": [ctx.turn.model_dump()], "done": True}
+
+
+def _timed(name: str, fn: Callable[[TurnState, Runtime[TurnContext]], Awaitable[TurnState]]):
+    hist = metrics.histogram("agent_graph_node_seconds", "会话图各节点耗时", node=name)
+
+    async def node(state: TurnState, runtime: Runtime[TurnContext]) -> TurnState:
+        started = time.perf_counter()
+        try:
+            return await fn(state, runtime)
+        finally:
+            hist.observe(time.perf_counter() - started)
+
+    node.__name__ = name
+    return node
+
+
+def build_graph(checkpointer=None):
+    """构建并编译会话图。"""
+
+    builder = StateGraph(TurnState, context_schema=TurnContext)
+    builder.add_node("preprocess", _timed("preprocess", _preprocess))
+    builder.add_node("fastpath", _timed("fastpath", _fastpath_node))
+    builder.add_node("route", _timed("route", _route))
+    builder.add_node("llm", _timed("llm", _llm))
+    builder.add_node("reply", _timed("reply", _reply))
+    builder.add_node("dispatch", _timed("dispatch", _dispatch))
+
+    builder.add_edge(START, "preprocess")
+    builder.add_edge(START, "fastpath")
+    builder.add_edge(["preprocess", "fastpath"], "route")
+    builder.add_conditional_edges("route", _after_route, ["dispatch", "llm"])
+    builder.add_conditional_edges("llm", _after_llm, ["dispatch", "reply", END])
+    builder.add_edge("reply", END)
+    builder.add_edge("dispatch", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+_saver = None
+_pipeline = None
+# session_key -> (thread_id, 最近活跃时间)；首次使用时从 checkpointer 载入，之后与其同步维护
+_bindings: dict[str, tuple[str, float]] | None = None
+# 最近活跃时间的写回间隔（秒）：避免每轮都写一次 SQLite
+_TOUCH_INTERVAL = 60.0
+
+
+def get_saver():
+    """checkpointer（AGENT__CHECKPOINT_PATH 为空时退化为进程内存储）。"""
+
+    global _saver
+    if _saver is None:
+        path = config.checkpoint_path.strip()
+        if path:
+            from .checkpoint import SqliteSaver
+
+            _saver = SqliteSaver(path)
+        else:
+            from langgraph.checkpoint.memory import InMemorySaver
+
+            _saver = InMemorySaver()
+    return _saver
+
+
+def get_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = build_graph(get_saver())
+    return _pipeline
+
+
+def _thread_config(thread_id: str) -> dict[str, Any]:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+async def run_turn(ctx: TurnContext) -> TurnState:
+    """执行一轮；被抢占时抛出 TurnSuperseded（本轮不会写入 history）。"""
+
+    started = time.perf_counter()
+    try:
+        state = await get_pipeline().ainvoke(
+            {"turn": ctx.turn.model_dump(), "fast_payload": None, "decision": None, "done": False},
+            _thread_config(ctx.session.thread_id),
+            context=ctx,
+        )
+    finally:
+        metrics.histogram("agent_graph_turn_seconds", "会话图整轮耗时").observe(time.perf_counter() - started)
+    await _touch_session(ctx.key, ctx.session)
+    return state
+
+
+async def append_history(sess: AgentSession, messages: list[ChatMessage]) -> None:
+    """在图之外追加已确认的历史（例如 n8n 回调的结果），保证重启后恢复的上下文一致。"""
+
+    await get_pipeline().aupdate_state(
+        _thread_config(sess.thread_id),
+        {"history": [m.model_dump() for m in messages]},
+        as_node="reply",
+    )
+
+
+async def _load_bindings() -> dict[str, tuple[str, float]]:
+    global _bindings
+    if _bindings is None:
+        saver = get_saver()
+        loaded = await asyncio.to_thread(saver.session_bindings) if hasattr(saver, "session_bindings") else {}
+        if _bindings is None:
+            _bindings = loaded
+    return _bindings
+
+
+def _is_stale(updated_at: float) -> bool:
+    ttl = config.checkpoint_session_ttl
+    return ttl > 0 and time.time() - updated_at > ttl
+
+
+async def remember_session(session_key: str, sess: AgentSession) -> None:
+    saver = get_saver()
+    bindings = await _load_bindings()
+    bindings[session_key] = (sess.thread_id, time.time())
+    if hasattr(saver, "bind_session"):
+        await asyncio.to_thread(saver.bind_session, session_key, sess.thread_id)
+
+
+async def _touch_session(session_key: str, sess: AgentSession) -> None:
+    """轮次完成：刷新会话最近活跃时间（间隔不足 _TOUCH_INTERVAL 时只更新内存）。"""
+
+    bindings = await _load_bindings()
+    found = bindings.get(session_key)
+    if found is None or found[0] != sess.thread_id:
+        return
+    if time.time() - found[1] >= _TOUCH_INTERVAL:
+        await remember_session(session_key, sess)
+
+
+async def forget_session(session_key: str, sess: AgentSession) -> None:
+    """会话结束：解除绑定并删除该 thread 的全部 checkpoint。"""
+
+    saver = get_saver()
+    (await _load_bindings()).pop(session_key, None)
+    if hasattr(saver, "unbind_session"):
+        await asyncio.to_thread(saver.unbind_session, session_key)
+    await saver.adelete_thread(sess.thread_id)
+
+
+async def lookup_session(session_key: str) -> tuple[str, list[ChatMessage]] | None:
+    """按 session_key 找回重启前进行中的会话，返回 (thread_id, 已确认的历史)。
+
+    绑定已在内存中：不在会话中的消息（绝大多数）不会产生 SQLite 查询；超过 TTL 的会话不再恢复。
+    """
+
+    bindings = await _load_bindings()
+    found = bindings.get(session_key)
+    if found is None:
+        return None
+    thread_id, updated_at = found
+    if _is_stale(updated_at):
+        logger.info("会话已超过 {}s 未活跃，不再恢复：{}", config.checkpoint_session_ttl, session_key)
+        bindings.pop(session_key, None)
+        saver = get_saver()
+        if hasattr(saver, "unbind_session"):
+            await asyncio.to_thread(saver.unbind_session, session_key)
+        await saver.adelete_thread(thread_id)
+        return None
+    snapshot = await get_pipeline().aget_state(_thread_config(thread_id))
+    history = [ChatMessage.model_validate(m) for m in (snapshot.values or {}).get("history", [])]
+    return thread_id, history
+
+
+_driver = get_driver()
+
+
+@_driver.on_startup
+async def _prune_sessions() -> None:
+    """启动时清理已放弃的会话（超过 TTL 的绑定 + 无绑定的 thread），并载入绑定。"""
+
+    global _bindings
+    saver = get_saver()
+    if not hasattr(saver, "prune_sessions"):
+        return
+    try:
+        bindings, threads = await asyncio.to_thread(saver.prune_sessions, config.checkpoint_session_ttl)
+        _bindings = await asyncio.to_thread(saver.session_bindings)
+    except Exception:
+        logger.exception("清理会话 checkpoint 失败")
+        return
+    if bindings or threads:
+        logger.info("已清理 {} 个过期会话绑定、{} 个 thread 的 checkpoint", bindings, threads)
+
+
+__all__ = [
+    "TurnContext",
+    "TurnState",
+    "append_history",
+    "build_graph",
+    "forget_session",
+    "get_pipeline",
+    "get_saver",
+    "lookup_session",
+    "remember_session",
+    "run_turn",
+]
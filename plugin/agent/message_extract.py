@@ -7,7 +7,7 @@
 
 from __future__ import annotations
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import Literal, Union, List
 
 from nonebot.adapters import Bot as BaseBot
@@ -36,6 +36,9 @@ class ChatMessage(BaseModel):
     role: str
     content: List[Union[TextContent, ImageContent, AudioContent]]
 
+    # token 估算缓存（见 ai/context.py），不参与序列化
+    _token_estimate: int | None = PrivateAttr(default=None)
+
 
 async def extract_turn(bot: BaseBot, role: Role, msg: UniMessage) -> ChatMessage:
     """从 UniMessage 中提取结构化内容。"""
@@ -54,5 +57,22 @@ async def extract_turn(bot: BaseBot, role: Role, msg: UniMessage) -> ChatMessage
     return res
 
 
-__all__ = ["TextContent", "AudioContent", "ImageContent", "ChatMessage", "extract_turn"]
+def merge_turns(turns: list[ChatMessage]) -> ChatMessage:
+    """把同一角色连续的多条消息合并为一条（相邻文本用换行拼接）。"""
+
+    if len(turns) == 1:
+        return turns[0]
+
+    res = ChatMessage(role=turns[0].role, content=[])
+    for turn in turns:
+        for c in turn.content:
+            last = res.content[-1] if res.content else None
+            if isinstance(c, TextContent) and isinstance(last, TextContent):
+                res.content[-1] = TextContent(text=f"{last.text}\n{c.text}")
+                continue
+            res.content.append(c)
+    return res
+
+
+__all__ = ["TextContent", "AudioContent", "ImageContent", "ChatMessage", "extract_turn", "merge_turns"]
 
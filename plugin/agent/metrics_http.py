@@ -0,0 +1,52 @@
+"""Prometheus 指标出口：挂在 NoneBot FastAPI driver 的 ASGI app 上。
+
+接口（AGENT__METRICS_PATH，例如 /metrics；留空则不挂载）：
+- `GET` 返回 `nb_shared.metrics.registry.render_prometheus()`（进程内所有插件的指标）
+- 配置了 AGENT__METRICS_TOKEN 时需要 `Authorization: Bearer <token>`
+"""
+
+from __future__ import annotations
+
+import hmac
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+from nonebot import get_driver
+from nonebot.log import logger
+
+from nb_shared import metrics
+
+from .config import config
+
+
+def _authorized(authorization: str | None) -> bool:
+    expected = config.metrics_token
+    if not expected:
+        return True
+    if not authorization:
+        return False
+    _, _, token = authorization.partition(" ")
+    return hmac.compare_digest((token or authorization).strip().encode(), expected.encode())
+
+
+def _mount() -> None:
+    driver = get_driver()
+    if driver.type != "fastapi":
+        logger.warning("当前 driver 不是 FastAPI（{}），指标出口未挂载", driver.type)
+        return
+
+    app = driver.server_app  # type: ignore[attr-defined]
+
+    async def prometheus_metrics(request: Request) -> PlainTextResponse:
+        if not _authorized(request.headers.get("authorization")):
+            return PlainTextResponse("unauthorized\n", status_code=401)
+        return PlainTextResponse(
+            metrics.registry.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    app.add_api_route(config.metrics_path, prometheus_metrics, methods=["GET"])
+    logger.info("指标出口已挂载：GET {}", config.metrics_path)
+
+
+if config.metrics_path:
+    _mount()
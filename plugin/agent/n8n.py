@@ -19,6 +19,25 @@ def _build_url() -> str:
     path = config.n8n_webhook_path.lstrip("/")
     return urljoin(base, path)
 
+
+# 进程内共用一个连接池（outbox 后台并发投递时复用连接）
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=30)
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 async def webhook_request(payload: N8NRequest):
     """调用 webhook（POST JSON）。"""
 
@@ -26,10 +45,8 @@ async def webhook_request(payload: N8NRequest):
     if config.n8n_api_key:
         headers["Authorization"] = config.n8n_api_key
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(_build_url(), json=payload.model_dump(), headers=headers)
-        resp.raise_for_status()
-        return resp
-
-__all__ = ["N8NRequest", "webhook_request"]
+    resp = await _get_client().post(_build_url(), json=payload.model_dump(), headers=headers)
+    resp.raise_for_status()
+    return resp
 
+__all__ = ["N8NRequest", "close_client", "webhook_request"]
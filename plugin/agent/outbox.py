@@ -0,0 +1,432 @@
+"""n8n 需求投递的持久化 outbox。
+
+目标：
+- 会话处理器只负责“写入本地队列 + 回复确认”，毫秒级返回，与 n8n 是否健康无关
+- 会话结束后投递失败也不会丢需求：后台按指数退避重试，超过次数进入死信
+
+说明：
+- 队列存放在本地 SQLite（AGENT__OUTBOX_PATH）；进程重启时把“投递中”的记录放回待投递
+- 按 (session_id, 需求内容哈希) 去重：同一需求同时只会有一条待投递/投递中的记录（重复入队直接返回已有记录）；
+  同一 session_id 的不同需求（例如 n8n 回调 reopen 后的追加需求）各自入队，不会被吞掉
+- 后台 dispatcher 并发数有上限（AGENT__OUTBOX_CONCURRENCY），共用一个 httpx 连接池
+- 4xx（408/429 除外）视为不可重试，直接进入死信；其余失败按 base * 2^(n-1)（带抖动，封顶 max）退避
+- 死信可通过 `test outbox` 查看，`test outbox retry` 重新入队（见 dev_debug）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+from nonebot import get_driver
+from nonebot.log import logger
+
+from nb_shared import metrics
+
+from .config import config
+from .n8n import N8NRequest, close_client, webhook_request
+
+
+PENDING = "pending"
+INFLIGHT = "inflight"
+DELIVERED = "delivered"
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    requirement TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    reply_to TEXT NOT NULL DEFAULT '',
+    requirement_hash TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox(status, next_attempt_at);
+"""
+
+# 旧版按 session_id 唯一；迁移到 (session_id, requirement_hash) 后再建
+_ACTIVE_INDEX = """
+DROP INDEX IF EXISTS outbox_active_session;
+CREATE UNIQUE INDEX IF NOT EXISTS outbox_active_requirement
+    ON outbox(session_id, requirement_hash) WHERE status IN ('pending', 'inflight');
+"""
+
+
+def requirement_hash(requirement: str) -> str:
+    return hashlib.sha256(requirement.strip().encode("utf-8")).hexdigest()
+
+_COLUMNS = "id, session_id, requirement, status, attempts, next_attempt_at, last_error, created_at, updated_at, reply_to"
+
+
+@dataclass(slots=True)
+class OutboxEntry:
+    id: int
+    session_id: str
+    requirement: str
+    status: str
+    attempts: int
+    next_attempt_at: float
+    last_error: str | None
+    created_at: float
+    updated_at: float
+    # 回传结果的目标 session_key（见 callback.py）
+    reply_to: str = ""
+
+    def to_request(self) -> N8NRequest:
+        return N8NRequest(requirement=self.requirement, session_id=self.session_id)
+
+
+class Outbox:
+    """SQLite 队列（同步接口；在事件循环里请通过 asyncio.to_thread 调用）。"""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+            if "reply_to" not in columns:
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN reply_to TEXT NOT NULL DEFAULT ''")
+            if "requirement_hash" not in columns:
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN requirement_hash TEXT NOT NULL DEFAULT ''")
+                rows = self._conn.execute("SELECT id, requirement FROM outbox").fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET requirement_hash=? WHERE id=?", [(requirement_hash(r), i) for i, r in rows]
+                )
+            self._conn.executescript(_ACTIVE_INDEX)
+            # 上次退出时仍在投递中的记录：结果未知，重新投递（n8n 侧按 session_id 幂等）
+            self._conn.execute(
+                "UPDATE outbox SET status=? WHERE status=?", (PENDING, INFLIGHT)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _rows(self, sql: str, params: tuple = ()) -> list[OutboxEntry]:
+        with self._lock:
+            return [OutboxEntry(*row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def enqueue(self, req: N8NRequest, *, reply_to: str = "") -> tuple[int, bool]:
+        """入队；返回 (记录 id, 是否新建)。同一 session_id 的同一需求已在队列中时不重复入队。"""
+
+        now = time.time()
+        digest = requirement_hash(req.requirement)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(session_id, requirement, status, next_attempt_at, created_at, updated_at, reply_to, requirement_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (req.session_id, req.requirement, PENDING, now, now, now, reply_to, digest),
+            )
+            if cur.rowcount:
+                return int(cur.lastrowid), True
+            row = self._conn.execute(
+                "SELECT id FROM outbox WHERE session_id=? AND requirement_hash=? AND status IN (?, ?)",
+                (req.session_id, digest, PENDING, INFLIGHT),
+            ).fetchone()
+            return int(row[0]), False
+
+    def reply_to(self, session_id: str) -> str | None:
+        """session_id 最近一次入队时记录的回传目标；未知 session_id 返回 None。"""
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT reply_to FROM outbox WHERE session_id=? ORDER BY id DESC LIMIT 1", (session_id,)
+            ).fetchone()
+        return row[0] if row and row[0] else None
+
+    def claim(self, limit: int, *, now: float | None = None) -> list[OutboxEntry]:
+        """取出最多 limit 条到期的待投递记录，并标记为投递中。"""
+
+        if limit <= 0:
+            return []
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM outbox WHERE status=? AND next_attempt_at<=? "
+                    "ORDER BY next_attempt_at, id LIMIT ?",
+                    (PENDING, now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET status=?, updated_at=? WHERE id=?",
+                    [(INFLIGHT, now, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        entries = [OutboxEntry(*row) for row in rows]
+        for e in entries:
+            e.status = INFLIGHT
+        return entries
+
+    def next_due(self) -> float | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status=?", (PENDING,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_delivered(self, entry_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status=?, attempts=attempts+1, last_error=NULL, updated_at=? WHERE id=?",
+                (DELIVERED, time.time(), entry_id),
+            )
+
+    def mark_failed(self, entry_id: int, error: str, *, retry_at: float | None) -> None:
+        """记录一次失败；retry_at 为 None 时进入死信。"""
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status=?, attempts=attempts+1, next_attempt_at=?, last_error=?, updated_at=? "
+                "WHERE id=?",
+                (PENDING if retry_at is not None else DEAD, retry_at or now, error[:500], now, entry_id),
+            )
+
+    def dead_letters(self, limit: int = 20) -> list[OutboxEntry]:
+        return self._rows(
+            f"SELECT {_COLUMNS} FROM outbox WHERE status=? ORDER BY updated_at DESC LIMIT ?", (DEAD, limit)
+        )
+
+    def requeue_dead(self, entry_id: int | None = None) -> int:
+        """把死信重新放回待投递（attempts 清零）；返回重新入队的条数。"""
+
+        now = time.time()
+        sql = "UPDATE OR IGNORE outbox SET status=?, attempts=0, next_attempt_at=?, updated_at=? WHERE status=?"
+        params: tuple = (PENDING, now, now, DEAD)
+        if entry_id is not None:
+            sql += " AND id=?"
+            params += (entry_id,)
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
+
+    def purge_delivered(self, older_than: float) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM outbox WHERE status=? AND updated_at<?", (DELIVERED, time.time() - older_than)
+            ).rowcount
+
+
+# sender(entry)：投递一条记录，失败直接抛异常
+Sender = Callable[[OutboxEntry], Awaitable[object]]
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code >= 500 or code in (408, 429)
+    return True
+
+
+class OutboxDispatcher:
+    """后台投递循环：有界并发 + 指数退避 + 死信。"""
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        sender: Sender,
+        *,
+        concurrency: int = 4,
+        base_delay: float = 2.0,
+        max_delay: float = 300.0,
+        max_attempts: int = 8,
+        poll_interval: float = 5.0,
+    ) -> None:
+        self.outbox = outbox
+        self._sender = sender
+        self._concurrency = max(1, concurrency)
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._max_attempts = max(1, max_attempts)
+        self._poll_interval = poll_interval
+        self._wake = asyncio.Event()
+        self._inflight: set[asyncio.Task[None]] = set()
+        self._loop_task: asyncio.Task[None] | None = None
+
+    def backoff(self, attempts: int) -> float:
+        """第 attempts 次失败后的等待时间（带 50%~100% 抖动）。"""
+
+        delay = min(self._max_delay, self._base_delay * 2 ** max(0, attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def notify(self) -> None:
+        """有新记录入队：立即唤醒投递循环。"""
+
+        self._wake.set()
+
+    def start(self) -> None:
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self, *, timeout: float = 5.0) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        if self._inflight:
+            # 给进行中的投递一点时间收尾；没完成的下次启动时会重新投递
+            await asyncio.wait(self._inflight, timeout=timeout)
+            for task in self._inflight:
+                task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                free = self._concurrency - len(self._inflight)
+                entries = await asyncio.to_thread(self.outbox.claim, free) if free > 0 else []
+                for entry in entries:
+                    task = asyncio.create_task(self._deliver(entry))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._on_done)
+
+                due = await asyncio.to_thread(self.outbox.next_due)
+                counts = await asyncio.to_thread(self.outbox.counts)
+                metrics.gauge("agent_outbox_pending", "outbox 待投递条数").set(counts.get(PENDING, 0))
+                metrics.gauge("agent_outbox_dead", "outbox 死信条数").set(counts.get(DEAD, 0))
+            except Exception:
+                logger.exception("outbox 读取失败")
+                due = None
+
+            timeout = self._poll_interval
+            if due is not None and len(self._inflight) < self._concurrency:
+                timeout = min(timeout, max(0.0, due - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_done(self, task: asyncio.Task[None]) -> None:
+        self._inflight.discard(task)
+        # 空出并发名额：让循环立即领取下一批
+        self._wake.set()
+
+    async def _deliver(self, entry: OutboxEntry) -> None:
+        try:
+            await self._sender(entry)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            attempts = entry.attempts + 1
+            if _retryable(e) and attempts < self._max_attempts:
+                delay = self.backoff(attempts)
+                await asyncio.to_thread(self.outbox.mark_failed, entry.id, repr(e), retry_at=time.time() + delay)
+                metrics.counter("agent_outbox_total", "outbox 投递结果", result="retry").inc()
+                logger.warning(
+                    "n8n 投递失败（第 {} 次），{:.1f}s 后重试：session_id={} error={!r}",
+                    attempts,
+                    delay,
+                    entry.session_id,
+                    e,
+                )
+            else:
+                await asyncio.to_thread(self.outbox.mark_failed, entry.id, repr(e), retry_at=None)
+                metrics.counter("agent_outbox_total", "outbox 投递结果", result="dead").inc()
+                logger.error("n8n 投递失败，已进入死信：session_id={} error={!r}", entry.session_id, e)
+            return
+
+        await asyncio.to_thread(self.outbox.mark_delivered, entry.id)
+        metrics.counter("agent_outbox_total", "outbox 投递结果", result="delivered").inc()
+        metrics.histogram("agent_outbox_delivery_seconds", "需求从入队到投递成功的耗时").observe(
+            time.time() - entry.created_at
+        )
+
+
+async def _send(entry: OutboxEntry) -> None:
+    await webhook_request(entry.to_request())
+
+
+_outbox: Outbox | None = None
+_dispatcher: OutboxDispatcher | None = None
+
+
+def get_outbox() -> Outbox:
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox(config.outbox_path.strip() or ":memory:")
+    return _outbox
+
+
+def get_dispatcher() -> OutboxDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = OutboxDispatcher(
+            get_outbox(),
+            _send,
+            concurrency=config.outbox_concurrency,
+            base_delay=config.outbox_base_delay,
+            max_delay=config.outbox_max_delay,
+            max_attempts=config.outbox_max_attempts,
+        )
+    return _dispatcher
+
+
+async def enqueue(req: N8NRequest, *, reply_to: str = "") -> bool:
+    """写入 outbox 并唤醒后台投递；返回是否为新记录（False 表示同一会话的同一需求已在队列中）。
+
+    reply_to 为发起会话的 session_key，n8n 回调（见 callback.py）按 session_id 找回投递目标。
+    """
+
+    _, created = await asyncio.to_thread(get_outbox().enqueue, req, reply_to=reply_to)
+    dispatcher = get_dispatcher()
+    dispatcher.start()
+    dispatcher.notify()
+    return created
+
+
+_driver = get_driver()
+
+
+@_driver.on_startup
+async def _start_dispatcher() -> None:
+    # 已投递记录只保留一周，避免队列文件无限增长
+    await asyncio.to_thread(get_outbox().purge_delivered, 7 * 86400)
+    get_dispatcher().start()
+
+
+@_driver.on_shutdown
+async def _stop_dispatcher() -> None:
+    if _dispatcher is not None:
+        await _dispatcher.stop()
+    await close_client()
+
+
+__all__ = [
+    "Outbox",
+    "OutboxDispatcher",
+    "OutboxEntry",
+    "enqueue",
+    "get_dispatcher",
+    "get_outbox",
+]
@@ -14,6 +14,7 @@ from datetime import datetime
 from uuid import uuid4
 
 from plugin.agent.message_extract import ChatMessage
+from plugin.agent.ai.context import ContextWindow
 
 @dataclass(slots=True)
 class AgentSession:
@@ -26,6 +27,8 @@ class AgentSession:
     thread_id: str = field(init=False)
 
     turns: list[ChatMessage] = field(default_factory=list)
+    # 按 token 预算裁剪上下文时的滚动摘要状态
+    context: ContextWindow = field(default_factory=ContextWindow)
     created_at: datetime = field(default_factory=datetime.now)
 
     def __post_init__(self) -> None:
@@ -47,14 +50,20 @@ class SessionStore:
     def get(self, session_key: str) -> AgentSession | None:
         return self._sessions.get(session_key)
 
-    def create(self, session_key: str) -> AgentSession:
-        sess = AgentSession()
+    def create(self, session_key: str, *, n8n_session_id: str | None = None) -> AgentSession:
+        sess = AgentSession(n8n_session_id=n8n_session_id) if n8n_session_id else AgentSession()
         self._sessions[session_key] = sess
         return sess
 
     def pop(self, session_key: str) -> AgentSession | None:
         return self._sessions.pop(session_key, None)
 
+    def values(self) -> list[AgentSession]:
+        return list(self._sessions.values())
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
 
 __all__ = ["AgentSession", "SessionStore"]
 
@@ -8,12 +8,15 @@
 
 from __future__ import annotations
 
+import time
 from collections import deque
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any
 
 from nonebot.adapters.onebot.v11.message import Message
 
+from nb_shared import memstats
+
 
 Segment = dict[str, Any]
 
@@ -34,11 +37,20 @@ class CachedMessage:
     expanded_segments: list[Segment]
     # 归档群中的消息 ID（用于 NapCat forward_friend_single_msg 转发）
     archived_message_id: int | None = None
+    # 写入缓存的时间（用于 test mem 的年龄分布）
+    cached_at: float = field(default_factory=time.time)
 
 
 _message_queue: deque[int] = deque()
 _message_cache: dict[int, CachedMessage] = {}
 
+memstats.register(
+    "anti_recall.messages",
+    lambda: list(_message_cache.values()),
+    created_at=lambda m: m.cached_at,
+    limit=MAX_CACHE_SIZE,
+)
+
 
 def put(message_id: int, cached: CachedMessage) -> None:
     """写入缓存，超过上限自动 FIFO 淘汰。"""
@@ -21,8 +21,25 @@ require("nonebot_plugin_alconna")
 __plugin_meta__ = PluginMetadata(
     name="开发调试",
     description="机器人内置开发调试命令集合",
-    usage="test send：在控制台输出机器人最近一次发送消息的记录（仅 OneBot V11，superuser 可用）",
+    usage="\n".join(
+        [
+            "test send：在控制台输出机器人最近一次发送消息的记录（仅 OneBot V11，superuser 可用）",
+            "test outbox [retry]：输出 agent 的 n8n 投递队列状态与死信；retry 重新投递死信",
+            "test api [名称]：输出各 OneBot API 调用耗时分布（p50/p95/p99）",
+            "test slow [条数]：输出最近的慢 API 调用",
+            "test loop [stacks]：输出事件循环延迟、卡顿时的调用栈与各 matcher 耗时",
+            "test capture [start [none|ids|text] | stop]：录制收到的事件为 JSONL（bench/replay.py 回放）",
+            "test profile [秒数]：采样 profile（默认 10 秒，上限 60 秒），折叠栈与摘要写到 data/profile/ 并回复路径",
+            "test mem [start [帧数] | top [条数] | stop]：输出各缓存的条目数 / 估算字节数 / 年龄；tracemalloc 分配统计与快照对比",
+            "test fault [on|off|clear|reload|add <api> <延迟ms[~p99ms]> [失败率] [超时率]]：OneBot API 故障 / 延迟注入",
+            "test llm [session|recent|reset]：输出 agent 的 LLM 调用统计（排队/首 token/耗时/token/缓存/重试）",
+        ]
+    ),
 )
 
 from . import record as _record
+from . import tracer as _tracer
+from . import loop_monitor as _loop_monitor
+from . import capture as _capture
+from . import faults as _faults
 from . import commands
@@ -0,0 +1,197 @@
+"""事件录制：把收到的 OneBot V11 事件写成 JSONL，供 `bench/replay.py` 离线回放。
+
+开关（持久化到共享 JSON 配置，重启后保持）：
+- `plugins.dev_debug.capture.path`：录制文件路径；为空表示未在录制
+- `plugins.dev_debug.capture.mask`：脱敏方式
+  - `none`：原样保存
+  - `ids`（默认）：QQ 号 / 群号替换为稳定的伪号（同一个号始终映射到同一个伪号，会话关系保持不变），昵称 / 群名片清空；
+    raw_message 中 CQ 码携带的号码（`[CQ:at,qq=…]` 等）同样替换
+  - `text`：在 ids 的基础上，把文本内容替换为等长的占位符，图片 / 语音等链接清空
+
+文件格式（每行一条）：
+    {"ts": 1730000000.123, "event": <event.model_dump(mode="json")>}
+
+说明：
+- 录制在 event_preprocessor 中进行：记录的是适配器处理之后（to_me 等已判定）的事件，回放时不再重复判定
+- 写文件在后台线程批量进行（每 FLUSH_INTERVAL 秒一次），不阻塞事件循环
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+from typing import Any
+
+from nonebot import get_driver
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+from nonebot.log import logger
+from nonebot.message import event_preprocessor
+
+from nb_shared.json_config import get_store, plugin_key
+
+PATH_KEY = plugin_key("dev_debug", "capture.path")
+MASK_KEY = plugin_key("dev_debug", "capture.mask")
+MASK_MODES = ("none", "ids", "text")
+
+FLUSH_INTERVAL = 1.0
+
+# 视为 QQ 号 / 群号的字段（message_id 等不在此列）
+_ID_FIELDS = {"self_id", "user_id", "group_id", "operator_id", "target_id", "sender_id", "qq"}
+_NAME_FIELDS = {"nickname", "card", "title", "group_name", "area"}
+_MEDIA_FIELDS = {"url", "file", "path", "file_id"}
+# raw_message 里的 CQ 码参数：[CQ:at,qq=123,name=xx]；reply / forward 的 id 是消息 id，不替换
+_CQ_FIELD = re.compile(r"(?<=,)(qq|user_id|group_id|name)=([^,\]]*)")
+# 推荐名片：[CQ:contact,type=qq,id=123]
+_CQ_CONTACT = re.compile(r"(\[CQ:contact,type=(?:qq|group),id=)(\d+)")
+
+_buffer: list[str] = []
+_flusher: asyncio.Task[None] | None = None
+
+
+def capture_path() -> str:
+    return str(get_store().get(PATH_KEY, "") or "")
+
+
+def capture_mask() -> str:
+    mode = str(get_store().get(MASK_KEY, "ids") or "ids")
+    return mode if mode in MASK_MODES else "ids"
+
+
+async def start_capture(path: str, mask: str = "ids") -> None:
+    store = get_store()
+    store.set(PATH_KEY, path)
+    store.set(MASK_KEY, mask if mask in MASK_MODES else "ids")
+    # 保存 JSON 配置是同步文件写入：放到线程里，不阻塞事件循环
+    await asyncio.to_thread(store.save)
+    _ensure_flusher()
+
+
+async def stop_capture() -> None:
+    store = get_store()
+    store.set(PATH_KEY, "")
+    await asyncio.to_thread(store.save)
+
+
+def _pseudo_id(value: Any) -> Any:
+    try:
+        raw = int(value)
+    except (TypeError, ValueError):
+        return value
+    if raw <= 0:
+        return raw
+    digest = hashlib.blake2b(str(raw).encode(), digest_size=8).digest()
+    return 100000 + int.from_bytes(digest, "big") % 9_000_000_000
+
+
+def _mask_cq(raw: str) -> str:
+    """raw_message 中 CQ 码携带的 QQ 号 / 群号换成伪号（与消息段中的替换一致），昵称清空。"""
+
+    def repl(m: re.Match[str]) -> str:
+        key, value = m.group(1), m.group(2)
+        if key == "name":
+            return f"{key}="
+        return f"{key}={_pseudo_id(value)}"
+
+    raw = _CQ_CONTACT.sub(lambda m: f"{m.group(1)}{_pseudo_id(m.group(2))}", raw)
+    return _CQ_FIELD.sub(repl, raw)
+
+
+def mask_event(data: Any, mode: str) -> Any:
+    """按脱敏方式处理 model_dump 结果（返回新对象）。"""
+
+    if mode == "none":
+        return data
+    if isinstance(data, dict):
+        if mode == "text" and data.get("type") == "text" and isinstance(data.get("data"), dict):
+            text = str(data["data"].get("text", ""))
+            return {**data, "data": {**data["data"], "text": "x" * len(text)}}
+        out: dict[str, Any] = {}
+        for k, v in data.items():
+            if k in _ID_FIELDS and not isinstance(v, (dict, list)):
+                out[k] = _pseudo_id(v)
+            elif k in _NAME_FIELDS and isinstance(v, str):
+                out[k] = ""
+            elif mode == "text" and k in _MEDIA_FIELDS and isinstance(v, str):
+                out[k] = ""
+            elif k == "raw_message" and isinstance(v, str):
+                out[k] = "x" * len(v) if mode == "text" else _mask_cq(v)
+            else:
+                out[k] = mask_event(v, mode)
+        return out
+    if isinstance(data, list):
+        return [mask_event(v, mode) for v in data]
+    return data
+
+
+def _write(path: Path, lines: list[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await flush()
+
+
+async def flush() -> None:
+    path = capture_path()
+    if not _buffer:
+        return
+    lines = _buffer[:]
+    _buffer.clear()
+    if not path:
+        return
+    try:
+        await asyncio.to_thread(_write, Path(path), lines)
+    except Exception:
+        logger.exception("写入事件录制文件失败：{}", path)
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _flusher is None or _flusher.done():
+        try:
+            _flusher = asyncio.get_running_loop().create_task(_flush_loop())
+        except RuntimeError:
+            # 尚未进入事件循环（插件加载阶段）：由 on_startup 启动
+            pass
+
+
+@event_preprocessor
+async def _capture_event(bot: BaseBot, event: Event):
+    if not isinstance(bot, V11Bot):
+        return
+    if not capture_path():
+        return
+    try:
+        data = mask_event(event.model_dump(mode="json"), capture_mask())
+        _buffer.append(json.dumps({"ts": time.time(), "event": data}, ensure_ascii=False) + "\n")
+    except Exception:
+        logger.exception("录制事件失败")
+
+
+driver = get_driver()
+
+
+@driver.on_startup
+async def _start() -> None:
+    if capture_path():
+        logger.info("事件录制中：{}（mask={}）", capture_path(), capture_mask())
+    _ensure_flusher()
+
+
+@driver.on_shutdown
+async def _shutdown() -> None:
+    if _flusher is not None:
+        _flusher.cancel()
+    await flush()
+
+
+__all__ = ["MASK_MODES", "capture_mask", "capture_path", "flush", "mask_event", "start_capture", "stop_capture"]
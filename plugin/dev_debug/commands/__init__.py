@@ -2,7 +2,7 @@
 """
 
 from nb_shared.alconna_ns import build_default_namespace
-from arclet.alconna import Alconna, Subcommand  # noqa: E402
+from arclet.alconna import Alconna, Args, Subcommand  # noqa: E402
 from nonebot_plugin_alconna import on_alconna, AlcResult  # noqa: E402
 
 # 主命令入口：test <subcommand>
@@ -11,6 +11,15 @@ test_cmd = on_alconna(
         "test",
         Subcommand("send"),
         Subcommand("alconna"),
+        Subcommand("outbox", Args["action?", str]),
+        Subcommand("llm", Args["view?", str]),
+        Subcommand("api", Args["name?", str]),
+        Subcommand("slow", Args["limit?", int]),
+        Subcommand("loop", Args["view?", str]),
+        Subcommand("capture", Args["action?", str]["mask?", str]),
+        Subcommand("profile", Args["seconds?", float]),
+        Subcommand("mem", Args["action?", str]["arg?", int]),
+        Subcommand("fault", Args["action?", str]["api?", str]["latency?", str]["error?", float]["timeout?", float]),
         namespace=build_default_namespace(name="global"),
     ),
     priority=1,
@@ -21,3 +30,12 @@ test_cmd = on_alconna(
 # 导入子模块以完成注册（API hook / assign handler）
 from . import test_send as _test_send
 from . import test_alconna as _test_alconna
+from . import test_outbox as _test_outbox
+from . import test_llm as _test_llm
+from . import test_api as _test_api
+from . import test_slow as _test_slow
+from . import test_loop as _test_loop
+from . import test_capture as _test_capture
+from . import test_profile as _test_profile
+from . import test_mem as _test_mem
+from . import test_fault as _test_fault
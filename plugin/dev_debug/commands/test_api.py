@@ -0,0 +1,74 @@
+"""test api：在控制台输出各 OneBot API 的调用耗时分布（不回消息）。
+
+- `test api`：全部 API，按调用次数排序
+- `test api <名称>`：只看某个 API（另附最近 10 次调用）
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from nonebot import logger
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared.validate import is_superuser
+from ..tracer import api_errors, api_histograms, recent_calls
+
+from nonebot_plugin_alconna import AlcResult, AlconnaMatch, Match  # noqa: E402
+from . import test_cmd
+
+
+@test_cmd.assign("api")
+async def handle_test_api(
+    bot: BaseBot,
+    event: Event,
+    result: AlcResult,
+    name: Match[str] = AlconnaMatch("name"),
+):
+    """输出各 API 的 p50/p95/p99（仅日志输出，不回复）。"""
+
+    # 命令解析失败：静默
+    if not result.matched:
+        return
+
+    # 只在 OneBot V11 生效
+    if not isinstance(bot, V11Bot):
+        return
+
+    # 仅 superuser 可用；无权限静默
+    if not is_superuser(event):
+        return
+
+    hists = api_histograms()
+    errors = api_errors()
+    if name.available:
+        hists = {k: v for k, v in hists.items() if k == name.result}
+    if not hists:
+        logger.info("[test api] 暂无记录")
+        return
+
+    for api, h in sorted(hists.items(), key=lambda kv: kv[1].count, reverse=True):
+        logger.info(
+            "[test api] {} count={} errors={} p50={:.1f}ms p95={:.1f}ms p99={:.1f}ms max={:.1f}ms",
+            api,
+            h.count,
+            errors.get(api, 0),
+            h.quantile(0.5) * 1000,
+            h.quantile(0.95) * 1000,
+            h.quantile(0.99) * 1000,
+            h.max * 1000,
+        )
+
+    if name.available:
+        calls = [c for c in recent_calls() if c.api == name.result][-10:]
+        for c in calls:
+            logger.info(
+                "[test api]   {} {:.1f}ms ok={} size={} target={} {}",
+                datetime.fromtimestamp(c.at).strftime("%H:%M:%S"),
+                c.duration * 1000,
+                c.ok,
+                c.size,
+                c.target,
+                c.error or "",
+            )
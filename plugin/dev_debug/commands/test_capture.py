@@ -0,0 +1,68 @@
+"""test capture：开始 / 停止录制收到的事件（不回消息）。
+
+- `test capture`：输出当前录制状态
+- `test capture start [none|ids|text]`：开始录制到 data/capture/events-<时间>.jsonl（默认 ids 脱敏）
+- `test capture stop`：停止录制并写出缓冲
+
+录制文件可用 `python -m bench.replay <文件>` 离线回放。
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from nonebot import logger
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared.validate import is_superuser
+from ..capture import MASK_MODES, capture_mask, capture_path, flush, start_capture, stop_capture
+
+from nonebot_plugin_alconna import AlcResult, AlconnaMatch, Match  # noqa: E402
+from . import test_cmd
+
+
+@test_cmd.assign("capture")
+async def handle_test_capture(
+    bot: BaseBot,
+    event: Event,
+    result: AlcResult,
+    action: Match[str] = AlconnaMatch("action"),
+    mask: Match[str] = AlconnaMatch("mask"),
+):
+    """开始 / 停止事件录制（仅日志输出，不回复）。"""
+
+    # 命令解析失败：静默
+    if not result.matched:
+        return
+
+    # 只在 OneBot V11 生效
+    if not isinstance(bot, V11Bot):
+        return
+
+    # 仅 superuser 可用；无权限静默
+    if not is_superuser(event):
+        return
+
+    act = action.result if action.available else ""
+    if act == "start":
+        mode = mask.result if mask.available else "ids"
+        if mode not in MASK_MODES:
+            return
+        path = f"data/capture/events-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl"
+        await start_capture(path, mode)
+        logger.info("[test capture] 开始录制：{}（mask={}）", path, mode)
+        return
+
+    if act == "stop":
+        path = capture_path()
+        await flush()
+        await stop_capture()
+        logger.info("[test capture] 已停止录制：{}", path or "（未在录制）")
+        return
+
+    path = capture_path()
+    if path:
+        logger.info("[test capture] 录制中：{}（mask={}）", path, capture_mask())
+    else:
+        logger.info("[test capture] 未在录制")
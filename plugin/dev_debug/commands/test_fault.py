@@ -0,0 +1,84 @@
+"""test fault：在运行时开启 / 关闭 OneBot API 故障注入（不回消息）。
+
+- `test fault`：输出当前状态与规则
+- `test fault on` / `test fault off`：开启 / 关闭注入（规则保留）
+- `test fault add <api> <延迟ms[~p99ms]> [失败率] [超时率]`：追加规则，例如
+  `test fault add get_group_msg_history 200~2000 0.1`、`test fault add send_* 0 0.2`
+- `test fault clear`：清空规则并关闭
+- `test fault reload`：重新读取 JSON 配置（手动编辑 `plugins.dev_debug.faults` 后使用，可配置 target 等）
+"""
+
+from __future__ import annotations
+
+from nonebot import logger
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared.validate import is_superuser
+from ..faults import FaultRule, add_rule, clear_rules, is_active, is_enabled, load, rules, set_enabled
+
+from nonebot_plugin_alconna import AlcResult, AlconnaMatch, Match  # noqa: E402
+from . import test_cmd
+
+
+def _parse_latency(text: str) -> tuple[float, float | None]:
+    p50, _, p99 = text.partition("~")
+    return float(p50), (float(p99) if p99 else None)
+
+
+@test_cmd.assign("fault")
+async def handle_test_fault(
+    bot: BaseBot,
+    event: Event,
+    result: AlcResult,
+    action: Match[str] = AlconnaMatch("action"),
+    api: Match[str] = AlconnaMatch("api"),
+    latency: Match[str] = AlconnaMatch("latency"),
+    error: Match[float] = AlconnaMatch("error"),
+    timeout: Match[float] = AlconnaMatch("timeout"),
+):
+    """修改故障注入配置（仅日志输出，不回复）。"""
+
+    # 命令解析失败：静默
+    if not result.matched:
+        return
+
+    # 只在 OneBot V11 生效
+    if not isinstance(bot, V11Bot):
+        return
+
+    # 仅 superuser 可用；无权限静默
+    if not is_superuser(event):
+        return
+
+    act = action.result if action.available else ""
+    if act in ("on", "off"):
+        set_enabled(act == "on")
+    elif act == "clear":
+        clear_rules()
+    elif act == "reload":
+        load()
+    elif act == "add":
+        if not api.available:
+            return
+        try:
+            p50, p99 = _parse_latency(latency.result) if latency.available else (0.0, None)
+            rule = FaultRule.from_dict(
+                {
+                    "api": api.result,
+                    "latency_ms": p50,
+                    "latency_p99_ms": p99,
+                    "error_rate": error.result if error.available else 0.0,
+                    "timeout_rate": timeout.result if timeout.available else 0.0,
+                }
+            )
+        except ValueError:
+            return
+        add_rule(rule)
+    elif act:
+        return
+
+    state = "注入中" if is_active() else ("已开启（无规则）" if is_enabled() else "已关闭")
+    logger.info("[test fault] {}，{} 条规则", state, len(rules()))
+    for i, rule in enumerate(rules(), 1):
+        logger.info("[test fault] #{} {}", i, rule.to_dict())
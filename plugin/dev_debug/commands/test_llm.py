@@ -0,0 +1,103 @@
+"""test llm：在控制台输出 agent 的 LLM 调用统计（不回消息）。
+
+- `test llm`：总计 + 按模型 / provider 聚合
+- `test llm session`：按会话聚合（最近活跃的在前）
+- `test llm recent`：最近的原始调用记录
+- `test llm reset`：清空内存中的聚合（Prometheus 计数器不受影响）
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from nonebot import logger
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared.validate import is_superuser
+
+from nonebot_plugin_alconna import AlcResult, AlconnaMatch, Match  # noqa: E402
+from . import test_cmd
+
+
+def _fmt(name: str, s: dict[str, Any]) -> str:
+    return (
+        f"{name}: calls={s['calls']} errors={s['errors']} "
+        f"queue_p95={s['queue_p95'] * 1000:.0f}ms "
+        f"ttft_p50/p95={s['ttft_p50'] * 1000:.0f}/{s['ttft_p95'] * 1000:.0f}ms "
+        f"latency_p50/p95={s['latency_p50'] * 1000:.0f}/{s['latency_p95'] * 1000:.0f}ms "
+        f"tokens(prompt/cached/output)={s['prompt_tokens']}/{s['cached_tokens']}/{s['output_tokens']} "
+        f"cache_hits(response/prompt)={s['response_cache_hits']}/{s['prompt_cache_hits']} "
+        f"retries={s['retries']} parse_failures={s['parse_failures']}"
+    )
+
+
+@test_cmd.assign("llm")
+async def handle_test_llm(
+    bot: BaseBot,
+    event: Event,
+    result: AlcResult,
+    view: Match[str] = AlconnaMatch("view"),
+):
+    """输出 LLM 调用统计（仅日志输出，不回复）。"""
+
+    # 命令解析失败：静默
+    if not result.matched:
+        return
+
+    # 只在 OneBot V11 生效
+    if not isinstance(bot, V11Bot):
+        return
+
+    # 仅 superuser 可用；无权限静默
+    if not is_superuser(event):
+        return
+
+    # agent 插件在处理时一定已加载；延迟导入避免插件加载顺序问题
+    from plugin.agent.ai.telemetry import get_stats
+
+    stats = get_stats()
+    mode = view.result if view.available else ""
+
+    if mode == "reset":
+        stats.reset()
+        logger.info("[test llm] 统计已清空")
+        return
+
+    if mode == "recent":
+        if not stats.recent:
+            logger.info("[test llm] 暂无记录")
+        for c in stats.recent:
+            logger.info(
+                "[test llm] user={} session={} result={} provider={} model={} queue={:.0f}ms ttft={} "
+                "latency={:.0f}ms tokens={}/{}/{} cache={} attempts={} parse_failures={} {}",
+                c.user,
+                c.session,
+                c.result,
+                c.provider or "-",
+                c.model or "-",
+                c.queue * 1000,
+                f"{c.ttft * 1000:.0f}ms" if c.ttft is not None else "-",
+                c.latency * 1000,
+                c.prompt_tokens,
+                c.cached_tokens,
+                c.output_tokens,
+                "response" if c.response_cache_hit else ("prompt" if c.prompt_cache_hit else "-"),
+                c.attempts,
+                c.parse_failures,
+                c.error,
+            )
+        return
+
+    if mode == "session":
+        if not stats.by_session:
+            logger.info("[test llm] 暂无记录")
+        for session, agg in reversed(stats.by_session.items()):
+            logger.info("[test llm] {}", _fmt(f"session {stats.user_of(session)} {session}", agg.summary()))
+        return
+
+    logger.info("[test llm] {}", _fmt("total", stats.total.summary()))
+    for name, agg in sorted(stats.by_model.items()):
+        logger.info("[test llm] {}", _fmt(f"model {name}", agg.summary()))
+    for name, agg in sorted(stats.by_provider.items()):
+        logger.info("[test llm] {}", _fmt(f"provider {name}", agg.summary()))
@@ -0,0 +1,86 @@
+"""test loop：在控制台输出事件循环延迟、卡顿快照与各 matcher 耗时（不回消息）。
+
+- `test loop`：延迟分布 + 最慢的 matcher（按 p95）+ 最近一次卡顿的调用栈
+- `test loop stacks`：输出全部保留的卡顿快照
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from nonebot import logger
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared.validate import is_superuser
+from ..loop_monitor import lag_histogram, matcher_errors, matcher_histograms, snapshots
+
+from nonebot_plugin_alconna import AlcResult, AlconnaMatch, Match  # noqa: E402
+from . import test_cmd
+
+
+@test_cmd.assign("loop")
+async def handle_test_loop(
+    bot: BaseBot,
+    event: Event,
+    result: AlcResult,
+    view: Match[str] = AlconnaMatch("view"),
+):
+    """输出事件循环与 matcher 耗时统计（仅日志输出，不回复）。"""
+
+    # 命令解析失败：静默
+    if not result.matched:
+        return
+
+    # 只在 OneBot V11 生效
+    if not isinstance(bot, V11Bot):
+        return
+
+    # 仅 superuser 可用；无权限静默
+    if not is_superuser(event):
+        return
+
+    stalls = snapshots()
+    if view.available and view.result == "stacks":
+        if not stalls:
+            logger.info("[test loop] 暂无卡顿快照")
+        for s in stalls:
+            logger.info(
+                "[test loop] {} 卡住 {:.2f}s：\n{}",
+                datetime.fromtimestamp(s.at).strftime("%Y-%m-%d %H:%M:%S"),
+                s.blocked,
+                s.stack,
+            )
+        return
+
+    lag = lag_histogram()
+    logger.info(
+        "[test loop] lag samples={} p50={:.1f}ms p99={:.1f}ms max={:.1f}ms stalls={}",
+        lag.count,
+        lag.quantile(0.5) * 1000,
+        lag.quantile(0.99) * 1000,
+        lag.max * 1000,
+        len(stalls),
+    )
+
+    errors = matcher_errors()
+    ranked = sorted(matcher_histograms().items(), key=lambda kv: kv[1].quantile(0.95), reverse=True)
+    for name, h in ranked[:10]:
+        logger.info(
+            "[test loop] matcher {} runs={} errors={} p50={:.1f}ms p95={:.1f}ms max={:.1f}ms",
+            name,
+            h.count,
+            errors.get(name, 0),
+            h.quantile(0.5) * 1000,
+            h.quantile(0.95) * 1000,
+            h.max * 1000,
+        )
+
+    if stalls:
+        last = stalls[-1]
+        logger.info(
+            "[test loop] 最近一次卡顿 {}（{:.2f}s）：\n{}",
+            datetime.fromtimestamp(last.at).strftime("%Y-%m-%d %H:%M:%S"),
+            last.blocked,
+            last.stack,
+        )
@@ -0,0 +1,156 @@
+"""test mem：在控制台输出进程内缓存的内存占用与 tracemalloc 分配统计（不回消息）。
+
+- `test mem`：进程 RSS + 各登记缓存（nb_shared.memstats）的条目数 / 估算字节数 / 年龄分布
+- `test mem start [帧数]`：开启 tracemalloc（默认记录 1 层调用栈；开启后才分配的内存才会被追踪）
+- `test mem top [条数]`：分配最多的代码位置；与上一次 `test mem top` 的快照相比增长最多的位置
+- `test mem stop`：关闭 tracemalloc 并丢弃快照
+
+tracemalloc 会让内存分配变慢并额外占用内存：排查完记得 stop。
+"""
+
+from __future__ import annotations
+
+import os
+import tracemalloc
+
+from nonebot import logger
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared import memstats
+from nb_shared.validate import is_superuser
+
+from nonebot_plugin_alconna import AlcResult, AlconnaMatch, Match  # noqa: E402
+from . import test_cmd
+
+_last_snapshot: tracemalloc.Snapshot | None = None
+
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(n) < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GiB"
+
+
+def _fmt_age(v: float | None) -> str:
+    return "-" if v is None else f"{v:.0f}s"
+
+
+def _rss() -> int | None:
+    """当前 RSS（字节）；非 Linux 返回 None。"""
+
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def _log_caches() -> None:
+    rss = _rss()
+    traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    logger.info(
+        "[test mem] rss={} tracemalloc={}",
+        "-" if rss is None else _fmt_bytes(rss),
+        "off" if traced is None else _fmt_bytes(traced),
+    )
+    for r in memstats.report():
+        if r.error:
+            logger.info("[test mem] {} 读取失败：{}", r.name, r.error)
+            continue
+        logger.info(
+            "[test mem] {} entries={}{} bytes≈{}{} age p50={} p90={} max={}",
+            r.name,
+            r.entries,
+            "" if r.limit is None else f"/{r.limit}",
+            _fmt_bytes(r.bytes),
+            "" if r.sampled >= r.entries else f"（抽样 {r.sampled}）",
+            _fmt_age(r.age_p50),
+            _fmt_age(r.age_p90),
+            _fmt_age(r.age_max),
+        )
+
+
+def _log_top(limit: int) -> None:
+    global _last_snapshot
+
+    if not tracemalloc.is_tracing():
+        logger.info("[test mem] tracemalloc 未开启：先执行 test mem start")
+        return
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+    for stat in snapshot.statistics("lineno")[:limit]:
+        logger.info("[test mem] top {} count={} {}", _fmt_bytes(stat.size), stat.count, stat.traceback)
+
+    if _last_snapshot is not None:
+        for diff in snapshot.compare_to(_last_snapshot, "lineno")[:limit]:
+            if diff.size_diff <= 0:
+                break
+            logger.info(
+                "[test mem] diff +{} count{:+d} (now {}) {}",
+                _fmt_bytes(diff.size_diff),
+                diff.count_diff,
+                _fmt_bytes(diff.size),
+                diff.traceback,
+            )
+    _last_snapshot = snapshot
+
+
+@test_cmd.assign("mem")
+async def handle_test_mem(
+    bot: BaseBot,
+    event: Event,
+    result: AlcResult,
+    action: Match[str] = AlconnaMatch("action"),
+    arg: Match[int] = AlconnaMatch("arg"),
+):
+    """输出内存占用（仅日志输出，不回复）。"""
+
+    global _last_snapshot
+
+    # 命令解析失败：静默
+    if not result.matched:
+        return
+
+    # 只在 OneBot V11 生效
+    if not isinstance(bot, V11Bot):
+        return
+
+    # 仅 superuser 可用；无权限静默
+    if not is_superuser(event):
+        return
+
+    act = action.result if action.available else ""
+    if act == "start":
+        frames = max(1, min(arg.result if arg.available else 1, 25))
+        if tracemalloc.is_tracing():
+            logger.info("[test mem] tracemalloc 已在运行（{} 层）", tracemalloc.get_traceback_limit())
+            return
+        tracemalloc.start(frames)
+        _last_snapshot = None
+        logger.info("[test mem] tracemalloc 已开启（{} 层）", frames)
+        return
+
+    if act == "stop":
+        tracemalloc.stop()
+        _last_snapshot = None
+        logger.info("[test mem] tracemalloc 已关闭")
+        return
+
+    if act == "top":
+        _log_top(max(1, arg.result if arg.available else 15))
+        return
+
+    if act:
+        return
+    _log_caches()
@@ -0,0 +1,73 @@
+"""test outbox：在控制台输出 agent 的 n8n 投递队列状态与死信（不回消息）。
+
+- `test outbox`：输出各状态条数 + 最近的死信
+- `test outbox retry`：把全部死信重新放回待投递
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+
+from nonebot import logger
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared.validate import is_superuser
+
+from nonebot_plugin_alconna import AlcResult, AlconnaMatch, Match  # noqa: E402
+from . import test_cmd
+
+
+def _fmt_time(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+@test_cmd.assign("outbox")
+async def handle_test_outbox(
+    bot: BaseBot,
+    event: Event,
+    result: AlcResult,
+    action: Match[str] = AlconnaMatch("action"),
+):
+    """输出 outbox 状态；`retry` 时重新投递死信（仅日志输出，不回复）。"""
+
+    # 命令解析失败：静默
+    if not result.matched:
+        return
+
+    # 只在 OneBot V11 生效
+    if not isinstance(bot, V11Bot):
+        return
+
+    # 仅 superuser 可用；无权限静默
+    if not is_superuser(event):
+        return
+
+    # agent 插件在处理时一定已加载；延迟导入避免插件加载顺序问题
+    from plugin.agent.outbox import get_dispatcher, get_outbox
+
+    outbox = get_outbox()
+    if action.available and action.result == "retry":
+        n = await asyncio.to_thread(outbox.requeue_dead)
+        get_dispatcher().notify()
+        logger.info("[test outbox] 已重新入队 {} 条死信", n)
+        return
+
+    # Outbox 的方法是同步 SQLite 操作：放到线程里执行，不阻塞事件循环
+    counts = await asyncio.to_thread(outbox.counts)
+    logger.info("[test outbox] counts={}", counts)
+    dead = await asyncio.to_thread(outbox.dead_letters)
+    if not dead:
+        logger.info("[test outbox] 暂无死信")
+        return
+    for e in dead:
+        logger.info(
+            "[test outbox] dead id={} session_id={} attempts={} updated={} requirement={!r} error={}",
+            e.id,
+            e.session_id,
+            e.attempts,
+            _fmt_time(e.updated_at),
+            e.requirement,
+            e.last_error,
+        )
@@ -0,0 +1,60 @@
+"""test profile：对运行中的进程采样若干秒，结果写到 data/profile/。
+
+- `test profile [秒数]`：默认 10 秒，上限 60 秒；同一时间只允许一次
+- 采样结束后在控制台输出摘要路径与最热的几个函数，并回复结果文件路径（仅此命令回复，便于在聊天里拿到路径）
+"""
+
+from __future__ import annotations
+
+from nonebot import logger
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared.validate import is_superuser
+from ..profiler import DEFAULT_SECONDS, MAX_SECONDS, ProfilerBusy, profile
+
+from nonebot_plugin_alconna import AlcResult, AlconnaMatch, Match  # noqa: E402
+from . import test_cmd
+
+
+@test_cmd.assign("profile")
+async def handle_test_profile(
+    bot: BaseBot,
+    event: Event,
+    result: AlcResult,
+    seconds: Match[float] = AlconnaMatch("seconds"),
+):
+    """采样 profile，完成后回复结果文件路径。"""
+
+    # 命令解析失败：静默
+    if not result.matched:
+        return
+
+    # 只在 OneBot V11 生效
+    if not isinstance(bot, V11Bot):
+        return
+
+    # 仅 superuser 可用；无权限静默
+    if not is_superuser(event):
+        return
+
+    duration = seconds.result if seconds.available else DEFAULT_SECONDS
+    if duration <= 0:
+        return
+    duration = min(duration, MAX_SECONDS)
+
+    logger.info("[test profile] 开始采样 {:g}s", duration)
+    try:
+        res = await profile(duration)
+    except ProfilerBusy:
+        logger.info("[test profile] 已有 profile 在运行，忽略")
+        return
+
+    logger.info(
+        "[test profile] 完成：{:.1f}s ticks={} 折叠栈={} 摘要={}",
+        res.duration,
+        res.samples,
+        res.collapsed_path,
+        res.summary_path,
+    )
+    await bot.send(event, f"profile 完成（{res.duration:.1f}s）：\n{res.collapsed_path}\n{res.summary_path}")
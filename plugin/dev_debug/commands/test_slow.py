@@ -0,0 +1,58 @@
+"""test slow：在控制台输出最近的慢 OneBot API 调用（不回消息）。
+
+- `test slow [条数]`：按耗时从高到低输出（默认 10 条；慢调用阈值见 tracer.SLOW_THRESHOLD）
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from nonebot import logger
+from nonebot.adapters import Bot as BaseBot, Event
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared.validate import is_superuser
+from ..tracer import SLOW_THRESHOLD, slow_calls
+
+from nonebot_plugin_alconna import AlcResult, AlconnaMatch, Match  # noqa: E402
+from . import test_cmd
+
+
+@test_cmd.assign("slow")
+async def handle_test_slow(
+    bot: BaseBot,
+    event: Event,
+    result: AlcResult,
+    limit: Match[int] = AlconnaMatch("limit"),
+):
+    """输出最近的慢调用（仅日志输出，不回复）。"""
+
+    # 命令解析失败：静默
+    if not result.matched:
+        return
+
+    # 只在 OneBot V11 生效
+    if not isinstance(bot, V11Bot):
+        return
+
+    # 仅 superuser 可用；无权限静默
+    if not is_superuser(event):
+        return
+
+    calls = sorted(slow_calls(), key=lambda c: c.duration, reverse=True)
+    calls = calls[: limit.result if limit.available else 10]
+    if not calls:
+        logger.info("[test slow] 暂无超过 {:g}s 的调用", SLOW_THRESHOLD)
+        return
+
+    for c in calls:
+        logger.info(
+            "[test slow] {} {} {:.0f}ms ok={} size={} target={} {}",
+            datetime.fromtimestamp(c.at).strftime("%Y-%m-%d %H:%M:%S"),
+            c.api,
+            c.duration * 1000,
+            c.ok,
+            c.size,
+            c.target,
+            c.error or "",
+        )
@@ -0,0 +1,241 @@
+"""OneBot API 故障 / 延迟注入（默认关闭，仅 OneBot V11）。
+
+目标：
+- 在事故发生前验证超时、背压、降级：故意让 NapCat “变慢 / 变不稳定”，观察 anti_recall / agent 的表现
+- 关闭时零开销：开启时才替换 `Adapter._call_api`，关闭后还原
+
+配置（持久化到共享 JSON 配置 `plugins.dev_debug.faults`，可用 `test fault` 在运行时修改）：
+    {
+      "enabled": true,
+      "rules": [
+        {"api": "get_group_msg_history", "latency_ms": 200, "latency_p99_ms": 2000},
+        {"api": "send_*", "target": {"group_id": 123456}, "error_rate": 0.2},
+        {"api": "delete_msg", "timeout_rate": 0.05, "error_kind": "network"}
+      ]
+    }
+
+规则：
+- 按顺序匹配，第一条命中的规则生效；`api` 支持通配符（fnmatch），`target` 中的字段须与调用参数全部相等
+- 延迟：`latency_ms` 为中位数；给出 `latency_p99_ms` 时按对数正态分布抽样（长尾），否则为固定值
+- 超时：以 `timeout_rate` 概率等待该次调用的超时时长（`_timeout` 或 ONEBOT_API_TIMEOUT）后抛出 NetworkError，
+  与适配器真实超时的表现一致
+- 失败：以 `error_rate` 概率抛出 ActionFailed（`error_kind: "network"` 时抛出 NetworkError），不真正调用后端
+
+说明：
+- 注入发生在适配器层：API hook（tracer / 发送记录 / 发送索引）照常执行，看到的就是注入后的耗时与结果
+- 每次注入计入 `onebot_faults_injected_total{api,kind}`
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Any
+
+from nonebot import get_driver
+from nonebot.adapters.onebot.v11 import Adapter as V11Adapter
+from nonebot.adapters.onebot.v11.exception import ActionFailed, NetworkError
+from nonebot.log import logger
+
+from nb_shared import metrics
+from nb_shared.json_config import get_store, plugin_key
+
+FAULTS_KEY = plugin_key("dev_debug", "faults")
+ERROR_KINDS = ("action", "network")
+
+# 正态分布 99 分位对应的 z 值
+_Z99 = 2.326
+
+
+@dataclass(slots=True)
+class FaultRule:
+    api: str = "*"
+    target: dict[str, Any] = field(default_factory=dict)
+    latency_ms: float = 0.0
+    latency_p99_ms: float | None = None
+    error_rate: float = 0.0
+    error_kind: str = "action"
+    timeout_rate: float = 0.0
+
+    @classmethod
+    def from_dict(cls, raw: dict[str, Any]) -> FaultRule:
+        rule = cls(
+            api=str(raw.get("api") or "*"),
+            target=dict(raw.get("target") or {}),
+            latency_ms=max(0.0, float(raw.get("latency_ms") or 0)),
+            latency_p99_ms=float(raw["latency_p99_ms"]) if raw.get("latency_p99_ms") else None,
+            error_rate=min(1.0, max(0.0, float(raw.get("error_rate") or 0))),
+            error_kind=str(raw.get("error_kind") or "action"),
+            timeout_rate=min(1.0, max(0.0, float(raw.get("timeout_rate") or 0))),
+        )
+        if rule.error_kind not in ERROR_KINDS:
+            raise ValueError(f"error_kind 只能是 {ERROR_KINDS}")
+        return rule
+
+    def to_dict(self) -> dict[str, Any]:
+        out: dict[str, Any] = {"api": self.api}
+        if self.target:
+            out["target"] = self.target
+        if self.latency_ms:
+            out["latency_ms"] = self.latency_ms
+        if self.latency_p99_ms:
+            out["latency_p99_ms"] = self.latency_p99_ms
+        if self.error_rate:
+            out["error_rate"] = self.error_rate
+            out["error_kind"] = self.error_kind
+        if self.timeout_rate:
+            out["timeout_rate"] = self.timeout_rate
+        return out
+
+    def matches(self, api: str, data: dict[str, Any]) -> bool:
+        if not fnmatchcase(api, self.api):
+            return False
+        return all(str(data.get(k)) == str(v) for k, v in self.target.items())
+
+    def sample_latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        if not self.latency_p99_ms or self.latency_p99_ms <= self.latency_ms:
+            return self.latency_ms / 1000
+        sigma = (math.log(self.latency_p99_ms) - math.log(self.latency_ms)) / _Z99
+        return random.lognormvariate(math.log(self.latency_ms), sigma) / 1000
+
+
+_rules: list[FaultRule] = []
+_enabled = False
+_original_call_api: Any = None
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def is_active() -> bool:
+    """是否正在注入（已开启且至少有一条规则）。"""
+
+    return _original_call_api is not None
+
+
+def rules() -> list[FaultRule]:
+    return list(_rules)
+
+
+def _count(api: str, kind: str) -> None:
+    metrics.counter("onebot_faults_injected_total", "注入的 OneBot API 故障次数", api=api, kind=kind).inc()
+
+
+def _match(api: str, data: dict[str, Any]) -> FaultRule | None:
+    for rule in _rules:
+        if rule.matches(api, data):
+            return rule
+    return None
+
+
+async def _faulty_call_api(self: V11Adapter, bot: Any, api: str, **data: Any) -> Any:
+    rule = _match(api, data)
+    if rule is None:
+        return await _original_call_api(self, bot, api, **data)
+
+    delay = rule.sample_latency()
+    if delay > 0:
+        _count(api, "latency")
+        await asyncio.sleep(delay)
+    if rule.timeout_rate and random.random() < rule.timeout_rate:
+        _count(api, "timeout")
+        await asyncio.sleep(float(data.get("_timeout", self.config.api_timeout) or 0))
+        raise NetworkError(f"WebSocket call api {api} timeout (injected)")
+    if rule.error_rate and random.random() < rule.error_rate:
+        _count(api, "error")
+        if rule.error_kind == "network":
+            raise NetworkError(f"call api {api} failed (injected)")
+        raise ActionFailed(status="failed", retcode=1200, message="injected failure", wording="injected failure")
+    return await _original_call_api(self, bot, api, **data)
+
+
+def _install() -> None:
+    global _original_call_api
+    if _original_call_api is not None:
+        return
+    _original_call_api = V11Adapter._call_api
+    V11Adapter._call_api = _faulty_call_api  # type: ignore[method-assign]
+
+
+def _uninstall() -> None:
+    global _original_call_api
+    if _original_call_api is None:
+        return
+    V11Adapter._call_api = _original_call_api  # type: ignore[method-assign]
+    _original_call_api = None
+
+
+def load() -> None:
+    """从 JSON 配置读取规则并按 enabled 开启 / 关闭注入。"""
+
+    global _enabled
+    raw = get_store().get(FAULTS_KEY) or {}
+    if not isinstance(raw, dict):
+        raw = {}
+    loaded: list[FaultRule] = []
+    for item in raw.get("rules") or []:
+        try:
+            loaded.append(FaultRule.from_dict(item))
+        except (TypeError, ValueError, KeyError) as e:
+            logger.warning("忽略无效的故障注入规则 {!r}：{}", item, e)
+    _rules[:] = loaded
+    _enabled = bool(raw.get("enabled"))
+
+    if _enabled and _rules:
+        if not is_active():
+            logger.warning("OneBot API 故障注入已开启（{} 条规则）", len(_rules))
+        _install()
+    else:
+        _uninstall()
+
+
+def _save(enabled: bool) -> None:
+    store = get_store()
+    store.set(FAULTS_KEY, {"enabled": enabled, "rules": [r.to_dict() for r in _rules]})
+    store.save()
+
+
+def set_enabled(enabled: bool) -> None:
+    _save(enabled)
+    load()
+
+
+def add_rule(rule: FaultRule) -> None:
+    """追加规则（同 api、同 target 的旧规则被替换）。"""
+
+    _rules[:] = [r for r in _rules if not (r.api == rule.api and r.target == rule.target)] + [rule]
+    _save(_enabled)
+    load()
+
+
+def clear_rules() -> None:
+    _rules.clear()
+    _save(False)
+    load()
+
+
+driver = get_driver()
+
+
+@driver.on_startup
+async def _load_on_startup() -> None:
+    load()
+
+
+__all__ = [
+    "ERROR_KINDS",
+    "FaultRule",
+    "add_rule",
+    "clear_rules",
+    "is_active",
+    "is_enabled",
+    "load",
+    "rules",
+    "set_enabled",
+]
@@ -0,0 +1,157 @@
+"""事件循环卡顿监控 + 慢 matcher 检测。
+
+目标：
+- 机器人“变慢”时能分清：是事件循环被同步代码卡住（例如同步写文件），还是 handler 在等后端
+
+事件循环延迟：
+- 循环内的采样任务每 SAMPLE_INTERVAL 秒醒来一次，实际睡眠超出的部分即为延迟，记到 `event_loop_lag_seconds`
+- 看门狗线程盯着采样任务的心跳：超过 STALL_THRESHOLD 秒没有心跳，说明循环正被卡住，
+  立即抓取事件循环线程的调用栈（`sys._current_frames`）并打印 —— 抓到的正是卡住循环的那段代码
+- 每次卡顿只抓一次栈，计入 `event_loop_stalls_total`；最近的快照保留在内存中供 `test loop` 查看
+
+matcher 耗时：
+- 通过 run_preprocessor / run_postprocessor 记录每次 matcher 运行的耗时（含 await 后端的时间），
+  记到 `nonebot_matcher_seconds{matcher}`，出错记到 `nonebot_matcher_errors_total{matcher}`
+- 超过 SLOW_MATCHER 秒的运行打一条 warning
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+
+from nonebot import get_driver
+from nonebot.log import logger
+from nonebot.matcher import Matcher
+from nonebot.message import run_postprocessor, run_preprocessor
+
+from nb_shared import metrics
+
+# 采样间隔 / 判定为卡顿的心跳间隔 / 慢 matcher 阈值（秒）
+SAMPLE_INTERVAL = 0.1
+STALL_THRESHOLD = 0.5
+SLOW_MATCHER = 2.0
+# 保留的卡顿快照条数
+SNAPSHOT_SIZE = 10
+
+
+@dataclass(slots=True)
+class StallSnapshot:
+    at: float
+    # 抓栈时已卡住的时长（实际卡顿时长见 lag 直方图）
+    blocked: float
+    stack: str
+
+
+_snapshots: deque[StallSnapshot] = deque(maxlen=SNAPSHOT_SIZE)
+_heartbeat = time.monotonic()
+_loop_thread_id: int | None = None
+_sampler: asyncio.Task[None] | None = None
+_watchdog: threading.Thread | None = None
+_stop = threading.Event()
+
+_matcher_started: dict[int, float] = {}
+
+
+def snapshots() -> list[StallSnapshot]:
+    return list(_snapshots)
+
+
+def lag_histogram() -> metrics.Histogram:
+    return metrics.histogram("event_loop_lag_seconds", "事件循环调度延迟")
+
+
+def matcher_histograms() -> dict[str, metrics.Histogram]:
+    return {labels["matcher"]: h for labels, h in metrics.registry.series("nonebot_matcher_seconds")}
+
+
+def matcher_errors() -> dict[str, int]:
+    return {labels["matcher"]: int(c.value) for labels, c in metrics.registry.series("nonebot_matcher_errors_total")}
+
+
+async def _sample() -> None:
+    global _heartbeat
+    loop = asyncio.get_running_loop()
+    hist = lag_histogram()
+    while True:
+        before = loop.time()
+        _heartbeat = time.monotonic()
+        await asyncio.sleep(SAMPLE_INTERVAL)
+        _heartbeat = time.monotonic()
+        hist.observe(max(0.0, loop.time() - before - SAMPLE_INTERVAL))
+
+
+def _watch() -> None:
+    reported_beat = 0.0
+    while not _stop.wait(SAMPLE_INTERVAL):
+        beat = _heartbeat
+        blocked = time.monotonic() - beat
+        if blocked < STALL_THRESHOLD or beat == reported_beat or _loop_thread_id is None:
+            continue
+        # 同一次卡顿只抓一次
+        reported_beat = beat
+        frame = sys._current_frames().get(_loop_thread_id)
+        if frame is None:
+            continue
+        stack = "".join(traceback.format_stack(frame))
+        _snapshots.append(StallSnapshot(time.time(), blocked, stack))
+        metrics.counter("event_loop_stalls_total", "事件循环卡顿次数").inc()
+        logger.warning("事件循环已卡住 {:.2f}s，当前调用栈：\n{}", blocked, stack)
+
+
+def _matcher_name(matcher: Matcher) -> str:
+    source = getattr(matcher, "_source", None)
+    lineno = getattr(source, "lineno", None)
+    return f"{matcher.module_name or matcher.plugin_name or type(matcher).__name__}:{lineno or '?'}"
+
+
+@run_preprocessor
+async def _matcher_start(matcher: Matcher):
+    now = time.perf_counter()
+    if len(_matcher_started) >= 1024:
+        # 其他 preprocessor 抛出 IgnoredException 时 postprocessor 不会执行：清理遗留的开始时间
+        for key in [k for k, t in _matcher_started.items() if now - t > 600]:
+            _matcher_started.pop(key, None)
+    _matcher_started[id(matcher)] = now
+
+
+@run_postprocessor
+async def _matcher_done(matcher: Matcher, exception: Exception | None):
+    started = _matcher_started.pop(id(matcher), None)
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    name = _matcher_name(matcher)
+    metrics.histogram("nonebot_matcher_seconds", "matcher 单次运行耗时", matcher=name).observe(duration)
+    if exception is not None:
+        metrics.counter("nonebot_matcher_errors_total", "matcher 运行出错次数", matcher=name).inc()
+    if duration >= SLOW_MATCHER:
+        logger.warning("matcher {} 运行耗时 {:.2f}s", name, duration)
+
+
+driver = get_driver()
+
+
+@driver.on_startup
+async def _start() -> None:
+    global _sampler, _watchdog, _loop_thread_id
+    _loop_thread_id = threading.get_ident()
+    _stop.clear()
+    _sampler = asyncio.create_task(_sample())
+    _watchdog = threading.Thread(target=_watch, name="loop-watchdog", daemon=True)
+    _watchdog.start()
+
+
+@driver.on_shutdown
+async def _shutdown() -> None:
+    _stop.set()
+    if _sampler is not None:
+        _sampler.cancel()
+
+
+__all__ = ["StallSnapshot", "lag_histogram", "matcher_errors", "matcher_histograms", "snapshots"]
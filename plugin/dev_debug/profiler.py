@@ -0,0 +1,201 @@
+"""按需采样 profiler：不重启进程即可对线上进程采样一段时间。
+
+目标：
+- 低开销：后台线程每 SAMPLE_INTERVAL 秒用 `sys._current_frames()` 抓一次所有线程的调用栈，不挂 settrace / setprofile
+- 能看出时间花在哪个 asyncio 任务上：事件循环线程的栈以“当前正在运行的任务（协程名）”为根，
+  没有任务在运行时记为 `(idle)`（在 selector 里等 IO，或在跑普通回调）
+
+输出（写到 PROFILE_DIR）：
+- `profile-<时间>.collapsed`：折叠栈格式（`根;…;叶 次数`），可直接交给 flamegraph.pl / speedscope
+- `profile-<时间>.txt`：摘要（按自身 / 累计采样数排序的前 N 个函数，以及按任务的累计采样数）
+
+说明：
+- 同一时间只允许一次采样；时长上限 MAX_SECONDS
+- 采样线程自身不计入结果
+- 采样线程需要拿到 GIL 才能抓栈：短于切换间隔（默认 5ms）的纯 Python 计算容易被低估，
+  长时间占着事件循环的代码（真正要找的问题）不受影响
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from types import CodeType, FrameType
+
+PROFILE_DIR = Path("data/profile")
+SAMPLE_INTERVAL = 0.01
+MAX_SECONDS = 60
+DEFAULT_SECONDS = 10
+# 单个栈最多保留的帧数（超出部分从根部截断）
+MAX_DEPTH = 128
+# 摘要中每张表的行数
+TOP_N = 30
+
+_busy = threading.Lock()
+_labels: dict[CodeType, str] = {}
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+@dataclass(slots=True)
+class ProfileResult:
+    started: float
+    duration: float
+    samples: int
+    stacks: Counter[str] = field(default_factory=Counter)
+    collapsed_path: Path | None = None
+    summary_path: Path | None = None
+
+
+def _label(code: CodeType) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        parts = filename.replace("\\", "/").rsplit("/", 2)
+        short = "/".join(parts[-2:]) if len(parts) > 1 else filename
+        # 折叠栈格式以 ';' 分隔帧、以最后一个空格分隔次数：帧名里不能出现 ';'
+        label = f"{code.co_qualname} ({short}:{code.co_firstlineno})".replace(";", ",")
+        _labels[code] = label
+    return label
+
+
+def _walk(frame: FrameType | None) -> list[str]:
+    out: list[str] = []
+    while frame is not None and len(out) < MAX_DEPTH:
+        out.append(_label(frame.f_code))
+        frame = frame.f_back
+    out.reverse()
+    return out
+
+
+def _task_root(loop: asyncio.AbstractEventLoop | None) -> str:
+    if loop is None:
+        return "(idle)"
+    # 跨线程读取：只读 dict，在 GIL 下安全；取不到时按空闲处理
+    current = getattr(asyncio.tasks, "_current_tasks", {}).get(loop)
+    if current is None:
+        return "(idle)"
+    coro = current.get_coro()
+    name = getattr(coro, "__qualname__", None) or current.get_name()
+    return f"task:{name}".replace(";", ",")
+
+
+def _sample(
+    stop: threading.Event,
+    result: ProfileResult,
+    loop: asyncio.AbstractEventLoop,
+    loop_thread: int,
+) -> None:
+    own = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    while not stop.wait(SAMPLE_INTERVAL):
+        frames = sys._current_frames()
+        for tid, frame in frames.items():
+            if tid == own:
+                continue
+            if tid == loop_thread:
+                root = _task_root(loop)
+            else:
+                name = names.get(tid)
+                if name is None:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                    name = names.get(tid, str(tid))
+                root = f"thread:{name}".replace(";", ",")
+            result.stacks[";".join([root, *_walk(frame)])] += 1
+        result.samples += 1
+        del frames
+
+
+def _summary(result: ProfileResult) -> str:
+    self_counts: Counter[str] = Counter()
+    total_counts: Counter[str] = Counter()
+    roots: Counter[str] = Counter()
+    for stack, n in result.stacks.items():
+        frames = stack.split(";")
+        roots[frames[0]] += n
+        if len(frames) > 1:
+            self_counts[frames[-1]] += n
+        for f in set(frames[1:]):
+            total_counts[f] += n
+    all_samples = sum(result.stacks.values()) or 1
+
+    lines = [
+        f"started={datetime.fromtimestamp(result.started).strftime('%Y-%m-%d %H:%M:%S')} "
+        f"duration={result.duration:.1f}s ticks={result.samples} interval={SAMPLE_INTERVAL * 1000:.0f}ms "
+        f"stacks={all_samples}",
+        "",
+        "== 按根（asyncio 任务 / 线程）==",
+    ]
+    lines += [f"{n:>8} {n / all_samples:>6.1%}  {k}" for k, n in roots.most_common(TOP_N)]
+    lines += ["", "== 自身采样数（叶子帧）=="]
+    lines += [f"{n:>8} {n / all_samples:>6.1%}  {k}" for k, n in self_counts.most_common(TOP_N)]
+    lines += ["", "== 累计采样数（出现在栈中）=="]
+    lines += [f"{n:>8} {n / all_samples:>6.1%}  {k}" for k, n in total_counts.most_common(TOP_N)]
+    return "\n".join(lines) + "\n"
+
+
+def _write(result: ProfileResult) -> None:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stem = f"profile-{datetime.fromtimestamp(result.started).strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    collapsed = PROFILE_DIR / f"{stem}.collapsed"
+    summary = PROFILE_DIR / f"{stem}.txt"
+    collapsed.write_text(
+        "".join(f"{stack} {n}\n" for stack, n in sorted(result.stacks.items())), encoding="utf-8"
+    )
+    summary.write_text(_summary(result), encoding="utf-8")
+    result.collapsed_path = collapsed
+    result.summary_path = summary
+
+
+def is_running() -> bool:
+    return _busy.locked()
+
+
+async def profile(seconds: float = DEFAULT_SECONDS) -> ProfileResult:
+    """对当前进程采样 seconds 秒（上限 MAX_SECONDS），写出结果文件；已有采样在运行时抛出 ProfilerBusy。"""
+
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("已有 profile 在运行")
+    try:
+        seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+        loop = asyncio.get_running_loop()
+        result = ProfileResult(started=time.time(), duration=0.0, samples=0)
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=_sample,
+            args=(stop, result, loop, threading.get_ident()),
+            name="profile-sampler",
+            daemon=True,
+        )
+        began = time.perf_counter()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join)
+            result.duration = time.perf_counter() - began
+        await asyncio.to_thread(_write, result)
+        return result
+    finally:
+        _busy.release()
+
+
+__all__ = [
+    "DEFAULT_SECONDS",
+    "MAX_SECONDS",
+    "PROFILE_DIR",
+    "ProfileResult",
+    "ProfilerBusy",
+    "is_running",
+    "profile",
+]
@@ -0,0 +1,146 @@
+"""OneBot API 调用追踪（常驻开启，仅 OneBot V11）。
+
+目标：
+- 每次 API 调用都记录：api、目标会话、耗时、成功/失败、请求体大小
+- 最近的调用放在定长环形缓冲里；慢调用单独保留一份，不会被大量快调用挤掉
+- 每个 API 的耗时进入共享指标 `onebot_api_seconds{api}`（流式直方图），调用结果进入 `onebot_api_calls_total{api,result}`
+
+做法：
+- `on_calling_api` 记下开始时间（以本次调用的 data dict 为键），`on_called_api` 取出并计算耗时
+  （NoneBot 在两个钩子里传入的是同一个 data 对象）
+- 请求体大小为估算值：只累加字符串 / bytes 的长度，不做序列化，开销与字段数成正比
+- 被取消的调用不会触发 on_called_api：挂起的开始时间超过上限后按时间清理
+"""
+
+from __future__ import annotations
+
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+
+from nonebot.adapters import Bot as BaseBot
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+
+from nb_shared import metrics
+
+from .record import _extract_target
+
+# 环形缓冲长度 / 慢调用保留条数
+RING_SIZE = 512
+SLOW_SIZE = 100
+# 超过该耗时（秒）视为慢调用
+SLOW_THRESHOLD = 1.0
+# 挂起的开始时间上限（被取消的调用不会回调 on_called_api）
+_MAX_PENDING = 4096
+
+
+@dataclass(slots=True)
+class ApiCall:
+    at: float
+    api: str
+    target: dict[str, Any]
+    duration: float
+    ok: bool
+    error: str | None
+    size: int
+
+
+_ring: deque[ApiCall] = deque(maxlen=RING_SIZE)
+_slow: deque[ApiCall] = deque(maxlen=SLOW_SIZE)
+_pending: dict[int, float] = {}
+# (api, ok) -> (直方图, 计数器)：避免每次调用都在注册表里按标签查找
+_series: dict[tuple[str, bool], tuple[metrics.Histogram, metrics.Counter]] = {}
+
+
+def recent_calls() -> list[ApiCall]:
+    return list(_ring)
+
+
+def slow_calls() -> list[ApiCall]:
+    return list(_slow)
+
+
+def api_histograms() -> dict[str, metrics.Histogram]:
+    return {labels["api"]: hist for labels, hist in metrics.registry.series("onebot_api_seconds")}
+
+
+def api_errors() -> dict[str, int]:
+    out: dict[str, int] = {}
+    for labels, counter in metrics.registry.series("onebot_api_calls_total"):
+        if labels.get("result") == "error":
+            out[labels["api"]] = int(counter.value)
+    return out
+
+
+def _series_for(api: str, ok: bool) -> tuple[metrics.Histogram, metrics.Counter]:
+    entry = _series.get((api, ok))
+    if entry is None:
+        entry = (
+            metrics.histogram("onebot_api_seconds", "OneBot API 调用耗时", api=api),
+            metrics.counter("onebot_api_calls_total", "OneBot API 调用次数", api=api, result="ok" if ok else "error"),
+        )
+        _series[(api, ok)] = entry
+    return entry
+
+
+def _approx_size(value: Any, depth: int = 0) -> int:
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if depth >= 4:
+        return 0
+    if isinstance(value, dict):
+        return sum(_approx_size(v, depth + 1) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_approx_size(v, depth + 1) for v in value)
+    # MessageSegment 等：只看 data 字段
+    data = getattr(value, "data", None)
+    if isinstance(data, dict):
+        return _approx_size(data, depth + 1)
+    return 0
+
+
+@BaseBot.on_calling_api
+async def _trace_calling(bot: BaseBot, api: str, data: dict[str, Any]):
+    if not isinstance(bot, V11Bot):
+        return
+    if len(_pending) >= _MAX_PENDING:
+        cutoff = time.perf_counter() - 300
+        for key in [k for k, t in _pending.items() if t < cutoff]:
+            _pending.pop(key, None)
+    _pending[id(data)] = time.perf_counter()
+
+
+@BaseBot.on_called_api
+async def _trace_called(
+    bot: BaseBot,
+    exception: Exception | None,
+    api: str,
+    data: dict[str, Any],
+    result: Any,
+):
+    started = _pending.pop(id(data), None)
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    ok = exception is None
+
+    hist, counter = _series_for(api, ok)
+    hist.observe(duration)
+    counter.inc()
+
+    call = ApiCall(
+        at=time.time(),
+        api=api,
+        target=_extract_target(data),
+        duration=duration,
+        ok=ok,
+        error=None if ok else repr(exception),
+        size=_approx_size(data),
+    )
+    _ring.append(call)
+    if duration >= SLOW_THRESHOLD:
+        _slow.append(call)
+
+
+__all__ = ["ApiCall", "api_errors", "api_histograms", "recent_calls", "slow_calls"]
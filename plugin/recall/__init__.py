@@ -6,18 +6,28 @@
 - 仅 OneBot V11 平台生效
 
 命令语法（Alconna）：
-- recall <数量> [群聊id]
+- recall <数量> [群聊id ...]   # 可一次指定多个群，每个群各撤回最近 <数量> 条；完成后回复撤回结果
+
+说明：
+- 撤回目标优先从本地发送索引（nb_shared/sent_index.py）取得，不调用历史 API；
+  索引不完整（例如刚重启）时回退到按 message_seq 分页扫描历史（见 history.py）
+- 删除走有界并发 + 自适应限速（见 deleter.py），单条失败不影响其余消息
 """
 
 from nonebot.plugin import PluginMetadata
 
+from nb_shared import sent_index
+
 
 __plugin_meta__ = PluginMetadata(
     name="撤回工具",
     description="撤回机器人自己发送的消息（仅 OneBot V11）",
-    usage="recall <数量> [群聊id]",
+    usage="recall <数量> [群聊id ...]",
 )
 
+# 记录机器人发出的消息，供撤回时直接取 message_id
+sent_index.install()
+
 # 导入 commands 模块以注册 Alconna 命令
 from . import commands as _commands
 
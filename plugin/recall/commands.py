@@ -7,16 +7,17 @@ from __future__ import annotations
 
 from nonebot import require
 from nonebot.adapters import Bot as BaseBot
-from nonebot.adapters.onebot.v11 import GroupMessageEvent, PrivateMessageEvent
+from nonebot.adapters.onebot.v11 import Event, GroupMessageEvent, PrivateMessageEvent
 from nonebot.adapters.onebot.v11 import Bot as V11Bot
 
 from nb_shared.alconna_ns import build_default_namespace
 
-from .executers import recall_friend, recall_group
+from .deleter import DeleteReport
+from .executers import friend_target, group_target, recall_chats
 
 require("nonebot_plugin_alconna")
 
-from arclet.alconna import Alconna, Args  # noqa: E402
+from arclet.alconna import Alconna, Args, MultiVar  # noqa: E402
 from nonebot_plugin_alconna import (  # noqa: E402
     on_alconna,
     AlcResult,
@@ -28,7 +29,7 @@ from nonebot_plugin_alconna import (  # noqa: E402
 recall_cmd = on_alconna(
     Alconna(
         "recall",
-        Args["count", int]["group_id?", int],
+        Args["count", int]["group_ids", MultiVar(int, "*")],
         namespace=build_default_namespace(name="global"),
     ),
     priority=1,
@@ -37,13 +38,28 @@ recall_cmd = on_alconna(
 )
 
 
+def _group_ids(group_ids: Match[tuple[int, ...]]) -> list[int]:
+    if not group_ids.available:
+        return []
+    # 去重并保持顺序
+    return list(dict.fromkeys(group_ids.result))
+
+
+async def _run(bot: V11Bot, event: Event, count: int, chats) -> None:
+    async def on_progress(report: DeleteReport) -> None:
+        await bot.send(event, f"撤回中：{report.done}/{report.total}")
+
+    report = await recall_chats(bot, count, chats, on_progress=on_progress)
+    await bot.send(event, report.format())
+
+
 @recall_cmd.handle()
 async def handle_group(
     bot: BaseBot,
     event: GroupMessageEvent,
     result: AlcResult,
     count: Match[int] = AlconnaMatch("count"),
-    group_id: Match[int] = AlconnaMatch("group_id"),
+    group_ids: Match[tuple[int, ...]] = AlconnaMatch("group_ids"),
 ):
     # 语法不匹配：静默
     if not result.matched:
@@ -53,8 +69,8 @@ async def handle_group(
     if not isinstance(bot, V11Bot):
         return
 
-    target_group_id = group_id.result if group_id.available else event.group_id
-    await recall_group(bot, target_group_id, count.result)
+    ids = _group_ids(group_ids) or [event.group_id]
+    await _run(bot, event, count.result, [group_target(bot, gid) for gid in ids])
 
 @recall_cmd.handle()
 async def handle_friend(
@@ -62,7 +78,7 @@ async def handle_friend(
     event: PrivateMessageEvent,
     result: AlcResult,
     count: Match[int] = AlconnaMatch("count"),
-    group_id: Match[int] = AlconnaMatch("group_id"),
+    group_ids: Match[tuple[int, ...]] = AlconnaMatch("group_ids"),
 ):
     # 语法不匹配：静默
     if not result.matched:
@@ -72,7 +88,8 @@ async def handle_friend(
     if not isinstance(bot, V11Bot):
         return
 
-    if group_id.available:
-        await recall_group(bot, group_id.result, count.result)
+    ids = _group_ids(group_ids)
+    if ids:
+        await _run(bot, event, count.result, [group_target(bot, gid) for gid in ids])
     else:
-        await recall_friend(bot, event.user_id, count.result)
+        await _run(bot, event, count.result, [friend_target(bot, event.user_id)])
@@ -0,0 +1,211 @@
+"""撤回执行引擎：有界并发 + 自适应限速 + 逐条结果。
+
+目标：
+- 大批量撤回尽可能快，但不把后端打到限流
+- 单条失败不影响其余消息；结果逐条统计，可汇报给命令发起人
+
+限速策略（`AdaptiveLimiter`，AIMD）：
+- 请求间隔按当前速率（条/秒）匀速放行，同时在途请求数不超过并发上限
+- 每次成功：速率加性增加（+increase，直到 max_rate）
+- 限流（明确的“频繁 / rate limit”提示或限流 retcode）/ 连接类网络错误：速率减半（不低于 min_rate）
+  并暂停 backoff 秒，然后重试该条
+- 其他失败（消息已撤回、已超过可撤回时间、API 调用超时、无权限等）与请求速率无关：不调整速率、不重试，
+  直接记为该条失败
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from nonebot.adapters.onebot.v11 import Bot as V11Bot
+from nonebot.adapters.onebot.v11.exception import ActionFailed, NetworkError
+from nonebot.log import logger
+
+from nb_shared.sent_index import ChatKey
+
+# 判定为限流的错误文本（NapCat / QQ 的提示并不统一）；只认明确的限流信号，
+# “超时”既可能是消息已超过可撤回时间，也可能是后端处理超时，都与请求速率无关
+_THROTTLE_HINTS = ("频繁", "频率", "frequen", "rate limit", "ratelimit", "too many")
+# 明确表示限流的 retcode
+_THROTTLE_RETCODES = frozenset({429})
+
+
+class AdaptiveLimiter:
+    """AIMD 速率控制 + 并发上限。"""
+
+    def __init__(
+        self,
+        *,
+        rate: float = 4.0,
+        min_rate: float = 0.5,
+        max_rate: float = 20.0,
+        increase: float = 0.5,
+        concurrency: int = 4,
+        backoff: float = 2.0,
+    ) -> None:
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.backoff = backoff
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._lock = asyncio.Lock()
+        self._next_at = 0.0
+        self._paused_until = 0.0
+
+    async def acquire(self) -> None:
+        await self._sem.acquire()
+        try:
+            async with self._lock:
+                loop = asyncio.get_running_loop()
+                now = loop.time()
+                start = max(now, self._next_at, self._paused_until)
+                self._next_at = start + 1.0 / self.rate
+            if start > now:
+                await asyncio.sleep(start - now)
+        except BaseException:
+            self._sem.release()
+            raise
+
+    def release(self, *, ok: bool, throttled: bool = False) -> None:
+        """归还名额：成功则加速；限流则减速并暂停；其他失败（与后端负载无关）不调整速率。"""
+
+        if ok:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+        elif throttled:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._paused_until = asyncio.get_running_loop().time() + self.backoff
+        self._sem.release()
+
+
+@dataclass(slots=True)
+class DeleteReport:
+    """一次撤回的结果（按会话统计）。"""
+
+    total: int = 0
+    ok: int = 0
+    failed: dict[int, str] = field(default_factory=dict)
+    by_chat: dict[ChatKey, list[int]] = field(default_factory=dict)
+    # 查询撤回目标就失败的会话 -> 原因
+    unresolved: dict[ChatKey, str] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.ok + len(self.failed)
+
+    def format(self) -> str:
+        """给命令发起人的回复文本。"""
+
+        if not self.total and not self.unresolved:
+            return "没有可撤回的消息（超过 2 分钟的消息无法撤回）"
+
+        lines = [f"已撤回 {self.ok}/{self.total} 条，用时 {self.elapsed:.1f}s"]
+        if self.failed:
+            reasons: dict[str, int] = {}
+            for reason in self.failed.values():
+                reasons[reason] = reasons.get(reason, 0) + 1
+            lines.append("失败：" + "；".join(f"{r} ×{n}" for r, n in reasons.items()))
+        chats = self.chat_summary()
+        if len(chats) + len(self.unresolved) > 1:
+            lines.extend(f"{_chat_name(chat)}：成功 {ok} / 失败 {failed}" for chat, ok, failed in chats)
+        lines.extend(f"{_chat_name(chat)}：查询失败 {err}" for chat, err in self.unresolved.items())
+        return "\n".join(lines)
+
+    def chat_summary(self) -> list[tuple[ChatKey, int, int]]:
+        """[(会话, 成功数, 失败数)]"""
+
+        out = []
+        for chat, ids in self.by_chat.items():
+            failed = sum(1 for mid in ids if mid in self.failed)
+            out.append((chat, len(ids) - failed, failed))
+        return out
+
+
+def _chat_name(chat: ChatKey) -> str:
+    _, kind, target = chat
+    return f"群 {target}" if kind == "group" else f"私聊 {target}"
+
+
+def _classify(e: Exception) -> tuple[bool, str]:
+    """返回 (是否可重试, 原因)。"""
+
+    if isinstance(e, NetworkError):
+        # API 调用超时：后端没有在时限内给出结果，重试大概率同样超时（且可能已经撤回成功），记为普通失败
+        if "timeout" in str(e).lower():
+            return False, "timeout"
+        return True, "network"
+    if isinstance(e, ActionFailed):
+        info: dict[str, Any] = getattr(e, "info", {}) or {}
+        text = f"{info.get('message', '')} {info.get('wording', '')}".lower()
+        reason = (info.get("wording") or info.get("message") or f"retcode={info.get('retcode')}").strip()
+        throttled = info.get("retcode") in _THROTTLE_RETCODES or any(h in text for h in _THROTTLE_HINTS)
+        return throttled, reason
+    return False, repr(e)
+
+
+ProgressCallback = Callable[[DeleteReport], Awaitable[object]]
+
+
+async def delete_messages(
+    bot: V11Bot,
+    targets: Iterable[tuple[ChatKey, int]],
+    *,
+    limiter: AdaptiveLimiter | None = None,
+    retries: int = 2,
+    on_progress: ProgressCallback | None = None,
+    progress_interval: float = 5.0,
+    report: DeleteReport | None = None,
+) -> DeleteReport:
+    """撤回 (会话, message_id) 列表；逐条记录结果，不因单条失败中断。
+
+    on_progress 至多每 progress_interval 秒回调一次（只在任务较慢时触发）。
+    """
+
+    limiter = limiter or AdaptiveLimiter()
+    report = report or DeleteReport()
+    items: list[int] = []
+    for chat, mid in targets:
+        report.by_chat.setdefault(chat, []).append(mid)
+        items.append(mid)
+    report.total = len(items)
+    started = time.monotonic()
+    last_progress = started
+
+    async def delete_one(mid: int) -> None:
+        nonlocal last_progress
+        for attempt in range(retries + 1):
+            await limiter.acquire()
+            try:
+                await bot.delete_msg(message_id=mid)
+            except Exception as e:
+                retryable, reason = _classify(e)
+                limiter.release(ok=False, throttled=retryable)
+                if retryable and attempt < retries:
+                    logger.debug("撤回 {} 失败（{}），降速后重试", mid, reason)
+                    continue
+                report.failed[mid] = reason
+                break
+            else:
+                limiter.release(ok=True)
+                report.ok += 1
+                break
+
+        now = time.monotonic()
+        if on_progress is not None and now - last_progress >= progress_interval and report.done < report.total:
+            last_progress = now
+            try:
+                await on_progress(report)
+            except Exception:
+                logger.exception("撤回进度回调失败")
+
+    await asyncio.gather(*(delete_one(mid) for mid in items))
+    report.elapsed = time.monotonic() - started
+    return report
+
+
+__all__ = ["AdaptiveLimiter", "DeleteReport", "delete_messages"]
@@ -1,77 +1,96 @@
+from __future__ import annotations
+
 from nonebot.adapters.onebot.v11 import Bot as V11Bot
-import asyncio, time
+from nonebot.log import logger
+import asyncio
+
+from nb_shared.sent_index import ChatKey, get_sent_index, group_key, private_key
 
-def _is_expired(timestamp: int):
-    now = int(time.time())
-    return now - timestamp >= 100
+from .deleter import DeleteReport, ProgressCallback, delete_messages
+from .history import RECALL_WINDOW, HistoryFetcher, scan_own_messages
 
-async def _recall(bot: V11Bot, delete_list: list):
-    for msg_id in delete_list:
-        await bot.delete_msg(message_id=msg_id)
-        await asyncio.sleep(0.5)
+# 每页拉取的历史条数
+PAGE_SIZE = 50
 
 
-async def recall_friend(
-        bot: V11Bot,
-        user_id: int,
-        count: int
-):
-    async def request(c: int):
-        return await bot.call_api(
+def friend_target(bot: V11Bot, user_id: int) -> tuple[ChatKey, HistoryFetcher]:
+    async def fetch(message_seq: int, c: int):
+        res = await bot.call_api(
             "get_friend_msg_history",
             user_id=user_id,
-            message_seq=0,
+            message_seq=message_seq,
             count=c,
             reverse_order=False
         )
-    
-    await _compute(bot, count, request)
+        return res.get("messages") or []
+
+    return private_key(bot.self_id, user_id), fetch
 
 
-async def recall_group(
-        bot: V11Bot,
-        group_id: int,
-        count: int
-):
-    async def request(c: int):
-        return await bot.call_api(
+def group_target(bot: V11Bot, group_id: int) -> tuple[ChatKey, HistoryFetcher]:
+    async def fetch(message_seq: int, c: int):
+        res = await bot.call_api(
             "get_group_msg_history",
             group_id=group_id,
-            message_seq=0,
+            message_seq=message_seq,
             count=c,
             reverse_order=False
         )
-    await _compute(bot, count, request)
-    
-
-async def _compute(bot: V11Bot, count: int, request):
-    try:
-        delete_list = []
-        cnt = count
-        loop_cnt = 0
-        while cnt > 0 and loop_cnt <= 5:
-            amount = (loop_cnt + 1) * count
-            res = await request(amount)
-            messages = res["messages"]
-            
-            if not messages or len(messages) == 0:
-                break
-            expire_flag = False
-            for i in reversed(range(0, count)):
-                msg = messages[i]
-                if msg["self_id"] != msg["user_id"] or msg["raw_message"] == '':
-                    continue
-                if _is_expired(int(msg["time"])):
-                    expire_flag = True
-                    break
-                delete_list.append(msg["message_id"])
-                cnt -= 1
-                if cnt <= 0:
-                    break
-            if len(messages) < amount or expire_flag:
-                break
-            loop_cnt += 1
-            
-        await _recall(bot, delete_list)
-    except Exception:
-        return
+        return res.get("messages") or []
+
+    return group_key(bot.self_id, group_id), fetch
+
+
+async def recall_friend(bot: V11Bot, user_id: int, count: int, **kwargs) -> DeleteReport:
+    return await recall_chats(bot, count, [friend_target(bot, user_id)], **kwargs)
+
+
+async def recall_group(bot: V11Bot, group_id: int, count: int, **kwargs) -> DeleteReport:
+    return await recall_chats(bot, count, [group_target(bot, group_id)], **kwargs)
+
+
+async def resolve_targets(count: int, chat: ChatKey, fetch: HistoryFetcher) -> list[int]:
+    """要撤回的 message_id（从新到旧）。
+
+    优先查本地发送索引（不调用 API）；索引条数不够且索引还不完整（例如刚重启）时，回退到分页扫描后端历史。
+    """
+
+    index = get_sent_index()
+    found = index.recent(chat, count, window=RECALL_WINDOW)
+    if len(found) >= count or index.complete_for(RECALL_WINDOW):
+        return found
+
+    logger.debug("发送索引未命中（{}/{}），回退到查询历史：{}", len(found), count, chat)
+    delete_list = []
+    async for msg in scan_own_messages(fetch, page_size=min(max(count, 20), PAGE_SIZE)):
+        delete_list.append(msg["message_id"])
+        if len(delete_list) >= count:
+            break
+    return delete_list
+
+
+async def recall_chats(
+    bot: V11Bot,
+    count: int,
+    chats: list[tuple[ChatKey, HistoryFetcher]],
+    *,
+    on_progress: ProgressCallback | None = None,
+) -> DeleteReport:
+    """在每个会话里各撤回最近 count 条自己的消息；各会话的目标并行查询，删除共用同一个限速器。"""
+
+    report = DeleteReport()
+    if count <= 0 or not chats:
+        return report
+
+    resolved = await asyncio.gather(
+        *(resolve_targets(count, chat, fetch) for chat, fetch in chats), return_exceptions=True
+    )
+    targets: list[tuple[ChatKey, int]] = []
+    for (chat, _), ids in zip(chats, resolved):
+        if isinstance(ids, BaseException):
+            logger.warning("查询撤回目标失败：{} {!r}", chat, ids)
+            report.unresolved[chat] = repr(ids)
+            continue
+        targets.extend((chat, mid) for mid in ids)
+
+    return await delete_messages(bot, targets, on_progress=on_progress, report=report)
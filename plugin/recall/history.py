@@ -0,0 +1,75 @@
+"""消息历史分页扫描（按 message_seq 游标向前翻页）。
+
+目标：
+- 只扫描需要的页数：从最新消息开始逐页向前，找够数量或越过可撤回时限就停
+- 每页的全部消息都会检查（混杂聊天里机器人自己的消息不会漏掉）
+
+约定（NapCat get_group_msg_history / get_friend_msg_history）：
+- `message_seq=0` 表示从最新消息开始；否则以该条消息为锚点，返回锚点及其之前的 `count` 条
+- 锚点消息会在下一页再次出现，因此按 message_id 去重
+- 不依赖返回顺序：每页内部按 (time, message_seq) 从新到旧排序后再处理
+"""
+
+from __future__ import annotations
+
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any
+
+# 可撤回时限（秒）：QQ 普通消息 2 分钟，留出余量
+RECALL_WINDOW = 100
+
+# (message_seq 游标, 条数) -> 该页消息
+HistoryFetcher = Callable[[int, int], Awaitable[list[dict[str, Any]]]]
+
+
+def _seq(msg: dict[str, Any]) -> int:
+    return int(msg.get("message_seq") or msg.get("message_id") or 0)
+
+
+def is_expired(timestamp: int, *, now: float | None = None, window: int = RECALL_WINDOW) -> bool:
+    now = time.time() if now is None else now
+    return int(now) - int(timestamp) >= window
+
+
+def is_own(msg: dict[str, Any]) -> bool:
+    """是否为机器人自己发送的、有内容的消息。"""
+
+    sender = msg.get("user_id") or (msg.get("sender") or {}).get("user_id")
+    return str(sender) == str(msg.get("self_id")) and msg.get("raw_message", "") != ""
+
+
+async def scan_own_messages(
+    fetch: HistoryFetcher,
+    *,
+    page_size: int = 50,
+    max_pages: int = 20,
+    window: int = RECALL_WINDOW,
+) -> AsyncIterator[dict[str, Any]]:
+    """从新到旧依次产出机器人自己仍可撤回的消息。
+
+    遇到第一条已过期的消息即停止（更早的消息只会更旧）；历史翻到头或达到 max_pages 也停止。
+    调用方拿够数量后直接停止迭代即可，不会再请求下一页。
+    """
+
+    cursor = 0
+    seen: set[int] = set()
+    now = time.time()
+    for _ in range(max_pages):
+        page = await fetch(cursor, page_size)
+        fresh = [m for m in page if int(m["message_id"]) not in seen]
+        if not fresh:
+            return
+        fresh.sort(key=lambda m: (int(m.get("time", 0)), _seq(m)), reverse=True)
+        for msg in fresh:
+            seen.add(int(msg["message_id"]))
+            if is_expired(int(msg.get("time", 0)), now=now, window=window):
+                return
+            if is_own(msg):
+                yield msg
+        if len(page) < page_size:
+            return
+        cursor = _seq(fresh[-1])
+
+
+__all__ = ["RECALL_WINDOW", "HistoryFetcher", "is_expired", "is_own", "scan_own_messages"]
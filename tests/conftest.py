@@ -0,0 +1,33 @@
+"""测试环境：插件在导入时读取 NoneBot 配置，需要先初始化 NoneBot 并加载插件。
+
+- 共享 JSON 配置写到临时目录，不碰仓库里的 data/
+- agent 的 checkpoint 只保存在内存
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+# NoneBot 按工作目录解析插件模块名
+os.chdir(ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="nb-tests-")
+os.environ.setdefault("DRIVER", "~fastapi")
+os.environ.setdefault("NB_CONFIG_JSON_PATH", os.path.join(_tmp, "config.json"))
+os.environ.setdefault("AGENT__N8N_WEBHOOK_PATH", "hook")
+os.environ.setdefault("AGENT__CHECKPOINT_PATH", "")
+os.environ.setdefault("AGENT__OUTBOX_PATH", os.path.join(_tmp, "outbox.sqlite"))
+os.environ.setdefault("ANTI_RECALL__MONITOR_GROUPS", "[1]")
+
+import nonebot  # noqa: E402
+from nonebot.adapters.onebot import V11Adapter  # noqa: E402
+
+nonebot.init()
+nonebot.get_driver().register_adapter(V11Adapter)
+nonebot.load_plugins("plugin")
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from nonebot.adapters.onebot.v11.exception import ActionFailed, NetworkError
+
+from plugin.recall.deleter import AdaptiveLimiter, _classify, delete_messages
+
+CHAT = ("bot", "group", 1)
+
+
+@pytest.mark.parametrize(
+    ("error", "expected"),
+    [
+        (ActionFailed(retcode=1200, message="操作过于频繁"), (True, "操作过于频繁")),
+        (ActionFailed(retcode=429, message=""), (True, "retcode=429")),
+        (ActionFailed(retcode=200, message="Rate limit exceeded"), (True, "Rate limit exceeded")),
+        (ActionFailed(retcode=200, message="消息已超过可撤回时间"), (False, "消息已超过可撤回时间")),
+        (ActionFailed(retcode=200, message="timeout"), (False, "timeout")),
+        (NetworkError("WebSocket call api get_msg timeout"), (False, "timeout")),
+        (NetworkError("connection reset"), (True, "network")),
+        (ValueError("x"), (False, "ValueError('x')")),
+    ],
+)
+def test_classify(error: Exception, expected: tuple[bool, str]) -> None:
+    assert _classify(error) == expected
+
+
+def test_limiter_aimd() -> None:
+    async def main() -> None:
+        limiter = AdaptiveLimiter(rate=4.0, min_rate=1.0, max_rate=5.0, increase=0.5, backoff=0.0)
+        await limiter.acquire()
+        limiter.release(ok=True)
+        assert limiter.rate == 4.5
+        for _ in range(3):
+            await limiter.acquire()
+            limiter.release(ok=True)
+        assert limiter.rate == 5.0
+        await limiter.acquire()
+        limiter.release(ok=False)
+        assert limiter.rate == 5.0
+        for _ in range(3):
+            await limiter.acquire()
+            limiter.release(ok=False, throttled=True)
+        assert limiter.rate == 1.0
+
+    asyncio.run(main())
+
+
+class FakeBot:
+    def __init__(self, errors: dict[int, list[Exception]]) -> None:
+        self.errors = errors
+        self.calls: list[int] = []
+
+    async def delete_msg(self, *, message_id: int) -> None:
+        self.calls.append(message_id)
+        pending = self.errors.get(message_id)
+        if pending:
+            raise pending.pop(0)
+
+
+def test_delete_messages_retries_throttled_only() -> None:
+    bot = FakeBot(
+        {
+            2: [ActionFailed(retcode=1200, message="操作过于频繁")],
+            3: [ActionFailed(retcode=200, message="消息已撤回")],
+            4: [NetworkError("connection reset")] * 3,
+        }
+    )
+    limiter = AdaptiveLimiter(rate=1000.0, max_rate=1000.0, backoff=0.0)
+    report = asyncio.run(delete_messages(bot, [(CHAT, mid) for mid in (1, 2, 3, 4)], limiter=limiter, retries=2))
+
+    assert report.total == 4
+    assert report.ok == 2
+    assert report.failed == {3: "消息已撤回", 4: "network"}
+    assert bot.calls.count(2) == 2
+    assert bot.calls.count(3) == 1
+    assert bot.calls.count(4) == 3
+    assert report.chat_summary() == [(CHAT, 2, 2)]
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import pytest
+
+from plugin.agent.fastpath import FastPathRouter
+from plugin.agent.message_extract import ChatMessage, ImageContent, TextContent
+
+
+@pytest.fixture
+def router() -> FastPathRouter:
+    return FastPathRouter(threshold=0.9)
+
+
+@pytest.mark.parametrize(
+    ("text", "payload"),
+    [
+        ("刚才买咖啡花了30块钱", "记账：支出30元，备注咖啡"),
+        ("打车花了25元。", "记账：支出25元，备注打车"),
+        ("我今天吃饭花了50", "记账：支出50元，备注吃饭"),
+        ("昨天打车用了18", "记账：支出18元，备注打车"),
+        ("重启 nas", "重启nas"),
+        ("重启一下nas", "重启nas"),
+        ("帮我重启一下路由器！", "重启路由器"),
+        ("重启jellyfin容器", "重启jellyfin容器"),
+        ("查一下服务器内存", "查询服务器内存状态"),
+        ("看看服务器的内存占用", "查询服务器内存状态"),
+        ("服务器内存状态", "查询服务器内存状态"),
+    ],
+)
+def test_hits(router: FastPathRouter, text: str, payload: str) -> None:
+    found = router.match_text(text)
+    assert found is not None
+    assert found.payload == payload
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # 提问
+        "重启有什么用？",
+        "重启失败了怎么办",
+        "服务器内存满了怎么办",
+        "重启nas吗",
+        # 缺少对象 / 只有代词或时间词
+        "我花了30",
+        "这个花了20",
+        "这个月花了3000",
+        "重启一下吧",
+        "重启吧",
+        # 抱怨 / 结果描述
+        "重启电脑没用",
+        "重启nas失败了",
+        "重启nas就好了",
+        "重启失败了",
+        # 操作而不是查询
+        "清理服务器内存",
+        "释放一下服务器内存",
+        "服务器内存升级到32G",
+        # 普通闲聊
+        "今天天气不错",
+        "",
+    ],
+)
+def test_misses(router: FastPathRouter, text: str) -> None:
+    assert router.match_text(text) is None
+
+
+def test_route_skips_media(router: FastPathRouter) -> None:
+    turn = ChatMessage(
+        role="user",
+        content=[TextContent(text="重启 nas"), ImageContent(image="x", file_name="a.png")],
+    )
+    assert router.route(turn) is None
+
+
+def test_route_counts_hits(router: FastPathRouter) -> None:
+    assert router.route(ChatMessage(role="user", content=[TextContent(text="重启 nas")])) is not None
+    assert router.route(ChatMessage(role="user", content=[TextContent(text="你好")])) is None
+    assert router.stats.attempts == 2
+    assert router.stats.hits == 1
+    assert router.stats.rule_hits == {"restart": 1}
+
+
+def test_below_threshold() -> None:
+    strict = FastPathRouter(threshold=0.99)
+    assert strict.route(ChatMessage(role="user", content=[TextContent(text="重启 nas")])) is None
+    assert strict.stats.below_threshold == 1
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from plugin.agent.n8n import N8NRequest
+from plugin.agent.outbox import DELIVERED, INFLIGHT, PENDING, Outbox
+
+
+@pytest.fixture
+def outbox(tmp_path: Path) -> Outbox:
+    box = Outbox(tmp_path / "outbox.sqlite")
+    yield box
+    box.close()
+
+
+def _req(requirement: str, session_id: str = "s1") -> N8NRequest:
+    return N8NRequest(requirement=requirement, session_id=session_id)
+
+
+def test_duplicate_requirement_is_deduped(outbox: Outbox) -> None:
+    first, created = outbox.enqueue(_req("重启nas"), reply_to="k")
+    assert created
+    again, created = outbox.enqueue(_req("重启nas"), reply_to="k")
+    assert (again, created) == (first, False)
+    assert outbox.counts() == {PENDING: 1}
+
+
+def test_same_session_different_requirements(outbox: Outbox) -> None:
+    """reopen 后同一 session_id 的新需求不能被吞掉。"""
+
+    outbox.enqueue(_req("重启nas"))
+    outbox.claim(10)
+    _, created = outbox.enqueue(_req("记账：支出30元"))
+    assert created
+    assert outbox.counts() == {PENDING: 1, INFLIGHT: 1}
+
+
+def test_requeue_after_delivery(outbox: Outbox) -> None:
+    entry_id, _ = outbox.enqueue(_req("重启nas"))
+    outbox.claim(10)
+    outbox.mark_delivered(entry_id)
+    _, created = outbox.enqueue(_req("重启nas"))
+    assert created
+    assert outbox.counts() == {PENDING: 1, DELIVERED: 1}
+
+
+def test_claim_respects_due_time_and_limit(outbox: Outbox) -> None:
+    for i in range(3):
+        outbox.enqueue(_req(f"r{i}", session_id=f"s{i}"))
+    first = outbox.claim(2)
+    assert [e.requirement for e in first] == ["r0", "r1"]
+    assert all(e.status == INFLIGHT for e in first)
+    assert [e.requirement for e in outbox.claim(10)] == ["r2"]
+    assert outbox.claim(10) == []
+
+
+def test_failed_entry_waits_for_retry_then_dead(outbox: Outbox) -> None:
+    entry_id, _ = outbox.enqueue(_req("重启nas"))
+    (entry,) = outbox.claim(1)
+    outbox.mark_failed(entry.id, "boom", retry_at=entry.next_attempt_at + 100)
+    assert outbox.claim(10, now=entry.next_attempt_at + 50) == []
+    (entry,) = outbox.claim(10, now=entry.next_attempt_at + 101)
+    assert entry.attempts == 1
+    outbox.mark_failed(entry_id, "boom", retry_at=None)
+    assert [e.id for e in outbox.dead_letters()] == [entry_id]
+    assert outbox.requeue_dead() == 1
+    assert outbox.counts() == {PENDING: 1}
+
+
+def test_reply_to(outbox: Outbox) -> None:
+    outbox.enqueue(_req("a"), reply_to="k1")
+    outbox.enqueue(_req("b"), reply_to="k2")
+    assert outbox.reply_to("s1") == "k2"
+    assert outbox.reply_to("unknown") is None
+
+
+def test_restart_requeues_inflight(tmp_path: Path) -> None:
+    path = tmp_path / "outbox.sqlite"
+    box = Outbox(path)
+    box.enqueue(_req("重启nas"))
+    box.claim(1)
+    box.close()
+    box = Outbox(path)
+    assert box.counts() == {PENDING: 1}
+    box.close()
+
+
+def test_migrates_session_unique_index(tmp_path: Path) -> None:
+    path = tmp_path / "outbox.sqlite"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, requirement TEXT NOT NULL,
+            status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL,
+            last_error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL
+        );
+        CREATE UNIQUE INDEX outbox_active_session ON outbox(session_id) WHERE status IN ('pending', 'inflight');
+        INSERT INTO outbox (session_id, requirement, status, next_attempt_at, created_at, updated_at)
+            VALUES ('s1', '重启nas', 'pending', 0, 0, 0);
+        """
+    )
+    conn.commit()
+    conn.close()
+
+    box = Outbox(path)
+    assert box.enqueue(_req("重启nas"))[1] is False
+    assert box.enqueue(_req("记账：支出30元"))[1] is True
+    box.close()
+
+
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from plugin.agent.ai.providers import (
+    AiInvalidOutputError,
+    AiProviderError,
+    AiTimeoutError,
+    FakeProvider,
+    HedgedDispatcher,
+    ProviderHealth,
+    ProviderRegistry,
+)
+
+
+def _open(health: ProviderHealth) -> None:
+    """让熔断器立刻进入 half_open（cooldown=0 时）。"""
+
+    for _ in range(health._failure_threshold):
+        health.record_failure()
+
+
+# ---------- 熔断器 ----------
+
+
+def test_breaker_opens_after_threshold() -> None:
+    h = ProviderHealth(failure_threshold=3, cooldown=60)
+    for _ in range(2):
+        h.record_failure()
+    assert h.state == "closed"
+    assert h.acquire() == 0
+    h.record_failure()
+    assert h.state == "open"
+    assert h.acquire() is None
+
+
+def test_half_open_allows_single_probe() -> None:
+    h = ProviderHealth(failure_threshold=1, cooldown=0)
+    _open(h)
+    assert h.state == "half_open"
+    token = h.acquire()
+    assert token
+    assert h.acquire() is None
+
+
+def test_probe_released_only_by_owner() -> None:
+    h = ProviderHealth(failure_threshold=1, cooldown=0)
+    _open(h)
+    token = h.acquire()
+    assert token
+    # 别的请求（闭合状态发出的 / 被取消的对冲）不能释放探测名额
+    h.release(0)
+    h.release(token + 1)
+    h.record_failure(0)
+    assert h.acquire() is None
+    h.release(token)
+    assert h.acquire()
+
+
+def test_probe_success_closes_breaker() -> None:
+    h = ProviderHealth(failure_threshold=1, cooldown=0)
+    _open(h)
+    assert h.acquire()
+    h.record_success(0.1)
+    assert h.state == "closed"
+    assert h.consecutive_failures == 0
+
+
+def test_probe_failure_reopens() -> None:
+    h = ProviderHealth(failure_threshold=1, cooldown=60)
+    h.record_failure()
+    h.opened_at = time.monotonic() - 61
+    token = h.acquire()
+    assert token
+    h.record_failure(token)
+    assert h.state == "open"
+
+
+def test_latency_quantile_needs_samples() -> None:
+    h = ProviderHealth()
+    assert h.latency_quantile(0.95, 8.0) == 8.0
+    for v in (0.1, 0.2, 0.3, 0.4, 1.0):
+        h.record_success(v)
+    assert h.latency_quantile(0.95, 8.0) == 1.0
+
+
+# ---------- 调度 ----------
+
+
+def _dispatcher(*providers: FakeProvider, health: dict[str, ProviderHealth] | None = None, **kwargs) -> HedgedDispatcher:
+    registry = ProviderRegistry()
+    for p in providers:
+        registry.register(p, (health or {}).get(p.name))
+    kwargs.setdefault("hedge_min_delay", 0.05)
+    kwargs.setdefault("hedge_default_delay", 0.05)
+    return HedgedDispatcher(registry, **kwargs)
+
+
+def test_primary_answers() -> None:
+    a, b = FakeProvider("a", latency=0.01), FakeProvider("b", latency=0.01)
+    result = asyncio.run(_dispatcher(a, b).dispatch([]))
+    assert result.result.provider == "a"
+    assert not result.hedged
+    assert b.calls == 0
+
+
+def test_hedge_to_faster_backup() -> None:
+    slow, fast = FakeProvider("slow", latency=1.0), FakeProvider("fast", latency=0.01)
+    result = asyncio.run(_dispatcher(slow, fast).dispatch([]))
+    assert result.result.provider == "fast"
+    assert result.hedged
+    # 输掉的对冲请求被取消
+    assert slow.cancelled == 1
+
+
+def test_failover_without_waiting_for_hedge() -> None:
+    bad, good = FakeProvider("bad", latency=0.0, fail_rate=1.0), FakeProvider("good", latency=0.01)
+    started = time.monotonic()
+    result = asyncio.run(_dispatcher(bad, good, hedge_min_delay=5, hedge_default_delay=5).dispatch([]))
+    assert result.result.provider == "good"
+    assert time.monotonic() - started < 1
+
+
+def test_unused_half_open_backup_keeps_probe() -> None:
+    """主 provider 先返回时，half_open 的备用 provider 不能因为被“预先放行”而永久占住探测名额。"""
+
+    backup_health = ProviderHealth(failure_threshold=1, cooldown=0)
+    _open(backup_health)
+    d = _dispatcher(
+        FakeProvider("a", latency=0.01),
+        FakeProvider("b", latency=0.01),
+        health={"b": backup_health},
+        hedge_min_delay=5,
+        hedge_default_delay=5,
+    )
+    for _ in range(3):
+        assert asyncio.run(d.dispatch([])).result.provider == "a"
+    assert backup_health.acquire()
+
+
+def test_all_open_still_tries_primary() -> None:
+    health = ProviderHealth(failure_threshold=1, cooldown=60)
+    health.record_failure()
+    a = FakeProvider("a", latency=0.01)
+    result = asyncio.run(_dispatcher(a, health={"a": health}).dispatch([]))
+    assert result.result.provider == "a"
+
+
+def test_all_fail() -> None:
+    d = _dispatcher(FakeProvider("a", fail_rate=1.0, latency=0), FakeProvider("b", fail_rate=1.0, latency=0))
+    with pytest.raises(AiProviderError) as exc:
+        asyncio.run(d.dispatch([]))
+    assert not isinstance(exc.value, (AiTimeoutError, AiInvalidOutputError))
+
+
+def test_invalid_output() -> None:
+    d = _dispatcher(FakeProvider("a", latency=0, text="not json"))
+    # 非结构化输出兜底为原文
+    assert asyncio.run(d.dispatch([])).response.response == "not json"
+    with pytest.raises(AiInvalidOutputError):
+        asyncio.run(d.dispatch([], require_structured=True))
+
+
+def test_slo_override() -> None:
+    d = _dispatcher(FakeProvider("a", latency=1.0), slo=10)
+    started = time.monotonic()
+    with pytest.raises(AiTimeoutError):
+        asyncio.run(d.dispatch([], slo=0.1))
+    assert time.monotonic() - started < 0.5
+
+
+def test_each_provider_picks_model_for_tier() -> None:
+    a = FakeProvider("a", latency=0, fail_rate=1.0, model="pro", tier_models={"fast": "flash"})
+    b = FakeProvider("b", latency=0, model="backup-large")
+    assert a.model_for("fast") == "flash"
+    assert a.model_for("strong") == "pro"
+    assert a.model_for(None) == "pro"
+    result = asyncio.run(_dispatcher(a, b).dispatch([], tier="fast"))
+    assert (result.result.provider, result.result.model) == ("b", "backup-large")
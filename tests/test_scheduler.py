@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from plugin.agent.ai.scheduler import LlmScheduler, SchedulerBusy, turn_priority
+from plugin.agent.message_extract import ChatMessage, ImageContent, TextContent
+
+
+async def _queue(sched: LlmScheduler, order: list[str], user: str, priority: int = 0) -> asyncio.Task[None]:
+    async def run() -> None:
+        async with sched.slot(user, priority=priority):
+            order.append(user)
+
+    task = asyncio.create_task(run())
+    await asyncio.sleep(0)
+    return task
+
+
+def test_turn_priority() -> None:
+    text = ChatMessage(role="user", content=[TextContent(text="hi")])
+    image = ChatMessage(role="user", content=[ImageContent(image="x", file_name="a.png")])
+    assert turn_priority(text, first_turn=True) == 0
+    assert turn_priority(text, first_turn=False) == 1
+    assert turn_priority(image, first_turn=True) == 2
+    assert turn_priority(image, first_turn=False) == 3
+
+
+def test_priority_then_fair_per_user() -> None:
+    async def main() -> list[str]:
+        sched = LlmScheduler(concurrency=1, max_queue=10)
+        order: list[str] = []
+        await sched.acquire("holder")
+        tasks = [
+            await _queue(sched, order, "a1", priority=1),
+            await _queue(sched, order, "a", priority=0),
+            await _queue(sched, order, "a", priority=0),
+            await _queue(sched, order, "b", priority=0),
+        ]
+        sched.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    # 同一优先级内：a 连发两条不会把 b 挤到后面
+    assert asyncio.run(main()) == ["a", "b", "a", "a1"]
+
+
+def test_rejects_when_queue_full() -> None:
+    async def main() -> None:
+        sched = LlmScheduler(concurrency=1, max_queue=1)
+        await sched.acquire("x")
+        waiter = asyncio.create_task(sched.acquire("y"))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerBusy):
+            await sched.acquire("z")
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_leaves_queue() -> None:
+    async def main() -> None:
+        sched = LlmScheduler(concurrency=1)
+        await sched.acquire("x")
+        waiter = asyncio.create_task(sched.acquire("y"))
+        await asyncio.sleep(0)
+        assert sched.waiting == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert sched.waiting == 0
+        sched.release()
+        assert sched.active == 0
+
+    asyncio.run(main())
+
+
+def test_failing_busy_notice_does_not_leak_slot() -> None:
+    async def main() -> None:
+        sched = LlmScheduler(concurrency=1)
+        notified: list[int] = []
+
+        async def on_queued(position: int) -> None:
+            notified.append(position)
+            raise RuntimeError("send failed")
+
+        await sched.acquire("x")
+        waiter = asyncio.create_task(sched.acquire("y", on_queued=on_queued))
+        await asyncio.sleep(0)
+        assert notified == [1]
+        sched.release()
+        await waiter
+        assert (sched.active, sched.waiting) == (1, 0)
+        sched.release()
+        assert sched.active == 0
+
+    asyncio.run(main())
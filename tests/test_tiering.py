@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from plugin.agent.ai.response_cache import ResponseCache, normalize_query
+from plugin.agent.ai.router import AiResponse
+from plugin.agent.ai.tiering import FAST, STRONG, TierPolicy, extract_features
+from plugin.agent.message_extract import ChatMessage, ImageContent, TextContent
+
+POLICY = TierPolicy(fast_model="flash", strong_model="pro", max_history=2, max_chars=10, min_confidence=0.5)
+
+
+def _text(text: str, role: str = "user") -> ChatMessage:
+    return ChatMessage(role=role, content=[TextContent(text=text)])
+
+
+def test_choose() -> None:
+    assert POLICY.choose(extract_features([_text("你好")])) == (FAST, "short_text")
+    assert POLICY.choose(extract_features([_text("x" * 11)])) == (STRONG, "long_text")
+    assert POLICY.choose(extract_features([_text("a"), _text("b", "assistant"), _text("c")])) == (STRONG, "long_history")
+    image = ChatMessage(role="user", content=[ImageContent(image="x", file_name="a.png")])
+    assert POLICY.choose(extract_features([image])) == (STRONG, "media")
+    disabled = TierPolicy(fast_model="", strong_model="pro")
+    assert disabled.choose(extract_features([_text("你好")])) == (STRONG, "disabled")
+
+
+def test_should_escalate() -> None:
+    assert POLICY.should_escalate(structured=False, confidence=0.9) == "schema"
+    assert POLICY.should_escalate(structured=True, confidence=0.1) == "low_confidence"
+    assert POLICY.should_escalate(structured=True, confidence=None) is None
+    assert POLICY.should_escalate(structured=True, confidence=0.9) is None
+    no_threshold = TierPolicy(fast_model="flash", strong_model="pro")
+    assert no_threshold.should_escalate(structured=True, confidence=0.01) is None
+
+
+def test_signature_tracks_tier_config() -> None:
+    assert POLICY.signature() != TierPolicy(fast_model="", strong_model="pro").signature()
+    assert POLICY.signature() != TierPolicy(fast_model="flash", strong_model="pro", max_chars=10).signature()
+
+
+def test_cache_key() -> None:
+    msgs = [_text("西红柿炒蛋 怎么做？")]
+    key = ResponseCache.key_for(msgs, model=POLICY.signature(), version="v1")
+    assert key == ResponseCache.key_for([_text("西红柿炒蛋怎么做")], model=POLICY.signature(), version="v1")
+    assert key != ResponseCache.key_for(msgs, model=TierPolicy("", "pro").signature(), version="v1")
+    assert key != ResponseCache.key_for(msgs, model=POLICY.signature(), version="v2")
+    # 多轮 / 非用户消息 / 含图片：不缓存
+    assert ResponseCache.key_for([_text("a"), _text("b")], model="m", version="v1") is None
+    assert ResponseCache.key_for([_text("a", "assistant")], model="m", version="v1") is None
+    image = ChatMessage(role="user", content=[ImageContent(image="x", file_name="a.png")])
+    assert ResponseCache.key_for([image], model="m", version="v1") is None
+
+
+def test_normalize_query() -> None:
+    assert normalize_query("  ＨＥＬＬＯ   World！！ ") == "hello world"
+    assert normalize_query("西红柿炒蛋 怎么做？") == "西红柿炒蛋怎么做"
+
+
+def test_cache_only_stores_chat_answers() -> None:
+    cache = ResponseCache(maxsize=4, ttl=60)
+    cache.put("k1", AiResponse(response="先炒蛋"))
+    cache.put("k2", AiResponse(trigger_n8n=True, payload="重启nas"))
+    cache.put("k3", AiResponse(response=""))
+    assert cache.get("k1") is not None
+    assert cache.get("k2") is None
+    assert cache.get("k3") is None